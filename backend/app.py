@@ -2,19 +2,20 @@
 Flask后端API
 提供权威query查询服务
 """
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 import sys
 import os
-from concurrent.futures import ThreadPoolExecutor
+import json
 
 # 添加服务路径
 sys.path.append(os.path.join(os.path.dirname(__file__), 'services'))
 
-from services.websearch_service import get_search_results
-from services.relevance_scorer import score_relevance_batch
-from services.authority_scorer import score_authority_batch
-from services.result_processor import add_host_to_results, filter_results, format_final_results, deduplicate_by_url_keep_longest
+from services.query_pipeline import (run_cached_query_pipeline, run_cached_query_pipeline_async,
+                                     stream_query_pipeline, run_batch_query_pipeline, get_service_stats,
+                                     explain_score, EmptySearchResultsError)
+from services.async_runtime import run_coroutine
+from services.request_params import parse_top_k, parse_deadline_ms, parse_engine_mode, parse_batch_queries
 
 app = Flask(__name__,
             template_folder='../frontend/templates',
@@ -35,7 +36,10 @@ def process_query():
 
     请求格式:
     {
-        "query": "考研数学二大纲"
+        "query": "考研数学二大纲",
+        "top_k": 10,           # 可选：惰性打分，只保证前top_k条结果的顺序，其余结果不打相关性
+        "deadline_ms": 3000,   # 可选：请求时间预算，到期时返回已完成的部分，未完成的结果标记为未打分
+        "engine_mode": "adaptive"  # 可选：all 调用全部引擎，adaptive 只调用产出与耗时划算的引擎
     }
 
     返回格式:
@@ -60,8 +64,11 @@ def process_query():
         "stats": {
             "search_engines": {...},
             "relevance_distribution": {...},
-            "authority_distribution": {...}
-        }
+            "authority_distribution": {...},
+            "timed_out_stages": [],    # 到达截止时间仍未完成的阶段：search/authority/relevance
+            "engine_selection": {...}  # 引擎模式、延迟预算，以及每个引擎被选中或跳过的原因
+        },
+        "cache": {"hit": false, "age_seconds": 0, "coalesced": false}
     }
     """
     try:
@@ -76,110 +83,86 @@ def process_query():
                 'error': 'Query不能为空'
             }), 400
 
+        try:
+            top_k = parse_top_k(data)
+            deadline_ms = parse_deadline_ms(data)
+            engine_mode = parse_engine_mode(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
         print(f"\n{'='*60}")
         print(f"收到查询: {query}")
         if selected_engines:
             print(f"选中引擎: {', '.join(selected_engines)}")
         print(f"{'='*60}")
 
-        # 2. 调用搜索引擎获取结果（支持引擎筛选）
-        print("\n[步骤 1/6] 搜索引擎查询...")
-        search_results, search_stats = get_search_results(query, selected_engines)
+        # 2. 执行查询流水线：搜索 -> 提取host -> 去重 -> 打分 -> 排序
+        #    相同查询命中响应缓存，或合并到正在执行的相同请求
+        response = run_cached_query_pipeline(query, selected_engines, top_k, deadline_ms, engine_mode)
+        return jsonify(response)
+
+    except EmptySearchResultsError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 
-        if not search_results:
+@app.route('/api/query/async', methods=['POST'])
+def process_query_async():
+    """
+    异步处理查询请求（请求体与返回格式同 /api/query）
+
+    搜索与打分的全部上游调用在进程共享的事件循环上并发执行，
+    高并发下不再为每个请求创建上百个线程
+    """
+    try:
+        data = request.get_json()
+        query = data.get('query', '').strip()
+        selected_engines = data.get('selected_engines', [])
+
+        if not query:
             return jsonify({
                 'success': False,
-                'error': '未获取到搜索结果'
-            }), 500
-
-        # 3. 提取host
-        print("\n[步骤 2/6] 提取URL的host...")
-        search_results = add_host_to_results(search_results)
-
-        # 4. 早期URL去重（保留content最长的）
-        print("\n[步骤 3/6] URL去重(保留content最长)...")
-        search_results = deduplicate_by_url_keep_longest(search_results)
-
-        # 5. 并行进行权威性与相关性打分
-        print("\n[步骤 4/6] 权威性与相关性打分(并行)...")
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            authority_future = executor.submit(score_authority_batch, search_results)
-            relevance_future = executor.submit(score_relevance_batch, search_results, query)
-            authority_scored = authority_future.result()
-            relevance_scored = relevance_future.result()
-
-        if len(authority_scored) != len(relevance_scored):
-            raise ValueError("权威性和相关性结果数量不一致")
-
-        combined_results = []
-        for auth_result, rel_result in zip(authority_scored, relevance_scored):
-            combined = auth_result.copy()
-            combined['relevance_score'] = rel_result.get('relevance_score', -1)
-            combined['relevance_reason'] = rel_result.get('relevance_reason', '')
-            combined_results.append(combined)
-
-        # 6. 排序结果（权威性降序 -> 相关性降序）
-        print("\n[步骤 5/6] 排序结果...")
-        # 先按权威性降序，再按相关性降序
-        sorted_results = sorted(
-            combined_results,
-            key=lambda x: (
-                -x.get('authority_score', -1),  # 权威性降序（4->3->2->1）
-                -x.get('relevance_score', -1)   # 相关性降序（2->1->0）
-            )
-        )
-
-        # 7. 格式化结果
-        print("\n[步骤 6/6] 格式化输出...")
-        final_results = format_final_results(sorted_results)
-
-        # 8. 统计信息（包含所有打分结果）
-        stats = {
-            'search_engines': search_stats['engines'],
-            'relevance_distribution': {},
-            'authority_distribution': {}
-        }
+                'error': 'Query不能为空'
+            }), 400
 
-        for r in combined_results:
-            rel_score = r.get('relevance_score', -1)
-            auth_score = r.get('authority_score', -1)
-            stats['relevance_distribution'][rel_score] = stats['relevance_distribution'].get(rel_score, 0) + 1
-            stats['authority_distribution'][auth_score] = stats['authority_distribution'].get(auth_score, 0) + 1
-
-        # 9. 按引擎分组原始结果
-        raw_results_by_engine = {}
-        for r in combined_results:
-            engine = r.get('engine', 'unknown')
-            if engine not in raw_results_by_engine:
-                raw_results_by_engine[engine] = []
-            raw_results_by_engine[engine].append({
-                'url': r['url'],
-                'title': r['title'],
-                'content': r['content'],
-                'host': r['host'],
-                'relevance_score': r.get('relevance_score', -1),
-                'relevance_reason': r.get('relevance_reason', ''),
-                'authority_score': r.get('authority_score', -1),
-                'authority_reason': r.get('authority_reason', '')
-            })
+        try:
+            top_k = parse_top_k(data)
+            deadline_ms = parse_deadline_ms(data)
+            engine_mode = parse_engine_mode(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
 
         print(f"\n{'='*60}")
-        print(f"处理完成!")
-        print(f"  原始结果数: {len(search_results)}")
-        print(f"  排序后数量: {len(final_results)}")
-        print(f"  排序规则: 权威性(4→3→2→1) -> 相关性(2→1→0)")
-        print(f"{'='*60}\n")
+        print(f"收到异步查询: {query}")
+        print(f"{'='*60}")
+
+        response = run_coroutine(run_cached_query_pipeline_async(query, selected_engines, top_k, deadline_ms,
+                                                                 engine_mode))
+        return jsonify(response)
 
-        # 10. 返回结果
+    except EmptySearchResultsError as e:
         return jsonify({
-            'success': True,
-            'query': query,
-            'total_raw_results': len(search_results),
-            'total_filtered_results': len(final_results),
-            'results': final_results,
-            'raw_results_by_engine': raw_results_by_engine,  # 新增：按引擎分组的原始结果
-            'stats': stats
-        })
+            'success': False,
+            'error': str(e)
+        }), 500
 
     except Exception as e:
         print(f"\n错误: {str(e)}")
@@ -192,6 +175,143 @@ def process_query():
         }), 500
 
 
+def format_sse(event: str, data: dict) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/query/stream', methods=['GET'])
+def stream_query():
+    """
+    流式处理查询请求（Server-Sent Events）
+
+    请求参数:
+        query: 查询词
+        engines: 逗号分隔的引擎列表，如 google,bing（为空时调用所有引擎）
+
+    事件:
+        search: 某个引擎返回 {"engine": "google", "count": 10}
+        results: 某个引擎的结果打分完成 {"engine": "google", "results": [...]}
+        done: 全部完成，数据与 /api/query 的返回一致
+        failure: 处理失败 {"success": false, "error": "..."}
+    """
+    query = request.args.get('query', '').strip()
+    selected_engines = [e for e in request.args.get('engines', '').split(',') if e]
+
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'Query不能为空'
+        }), 400
+
+    print(f"\n{'='*60}")
+    print(f"收到流式查询: {query}")
+    if selected_engines:
+        print(f"选中引擎: {', '.join(selected_engines)}")
+    print(f"{'='*60}")
+
+    def generate():
+        try:
+            for event, data in stream_query_pipeline(query, selected_engines):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"\n错误: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield format_sse('failure', {'success': False, 'error': str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/query/batch', methods=['POST'])
+def batch_query():
+    """
+    批量查询，按完成顺序逐行返回NDJSON
+
+    请求格式:
+    {
+        "queries": ["考研数学二大纲", "高考志愿填报", ...],
+        "selected_engines": [],       # 可选，同 /api/query
+        "engine_mode": "adaptive"     # 可选，同 /api/query
+    }
+
+    返回（每行一个JSON）:
+    {"type": "result", "index": 0, ...与 /api/query 一致的响应}
+    {"type": "error", "index": 1, "query": "...", "error": "..."}
+    {"type": "summary", "queries": 2, "succeeded": 1, "failed": 1, "unique_hosts": 30, "queries_per_minute": 12.5, ...}
+    """
+    data = request.get_json() or {}
+    try:
+        queries = parse_batch_queries(data)
+        engine_mode = parse_engine_mode(data)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    selected_engines = data.get('selected_engines', [])
+
+    print(f"\n{'='*60}")
+    print(f"收到批量查询: {len(queries)} 条")
+    print(f"{'='*60}")
+
+    def generate():
+        try:
+            for line in run_batch_query_pipeline(queries, selected_engines, engine_mode):
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+        except Exception as e:
+            print(f"\n错误: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield json.dumps({'type': 'failure', 'success': False, 'error': str(e)}, ensure_ascii=False) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/explain', methods=['POST'])
+def explain():
+    """
+    按需生成打分理由（快速打分模式下结果只有标签和置信度）
+
+    请求格式:
+    {"type": "relevance", "query": "...", "title": "...", "content": "..."}
+    或
+    {"type": "authority", "host": "www.example.com"}
+
+    返回格式:
+    {"success": true, "type": "relevance", "score": 2, "reason": "..."}
+    """
+    data = request.get_json() or {}
+    try:
+        result = explain_score(data.get('type', ''), data)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    return jsonify({'success': True, **result})
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -201,6 +321,12 @@ def health_check():
     })
 
 
+@app.route('/api/stats', methods=['GET'])
+def service_stats():
+    """运行统计（LLM连接池使用情况等）"""
+    return jsonify(get_service_stats())
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("权威Query查询系统启动中...")
@@ -0,0 +1,170 @@
+"""
+搜索客户端基准测试
+启动本地mock搜索服务，对比旧实现（每次新建连接 + 全量解码响应）与
+新实现（按host复用keep-alive连接 + 读到前N条即停止解析）的p50/p99延迟
+
+用法:
+    python benchmarks/bench_websearch.py --requests 300 --concurrency 6 --items 50 --handshake-ms 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'services'))
+
+import websearch_service
+
+
+class MockSearchHandler(BaseHTTPRequestHandler):
+    """模拟智谱web_search接口：支持keep-alive，新连接额外等待handshake_ms模拟握手开销"""
+
+    protocol_version = 'HTTP/1.1'
+    # 关闭Nagle算法，避免keep-alive连接上出现延迟ACK导致的40ms停顿
+    disable_nagle_algorithm = True
+    payload = b'{}'
+    handshake_seconds = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with MockSearchHandler.lock:
+            MockSearchHandler.connections += 1
+        time.sleep(self.handshake_seconds)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_payload(num_items: int, content_chars: int) -> bytes:
+    """构造与真实接口结构一致的响应体"""
+    items = [
+        {
+            'link': f'https://www.example{i}.com/article/{i}',
+            'title': f'考研数学二大纲 示例标题 {i}',
+            'content': ('考研数学二考试大纲内容示例。' * (content_chars // 14 + 1))[:content_chars],
+            'media': 'example',
+            'icon': '',
+            'refer': f'ref_{i}',
+            'publish_date': '2025-01-01'
+        }
+        for i in range(num_items)
+    ]
+    body = {
+        'id': 'mock',
+        'created': int(time.time()),
+        'request_id': 'bench',
+        'search_intent': [{'query': '考研数学二大纲', 'intent': 'SEARCH_ALL', 'keywords': '考研 数学二 大纲'}],
+        'search_result': items
+    }
+    return json.dumps(body, ensure_ascii=False).encode()
+
+
+def legacy_call(url: str, query: str) -> list:
+    """旧实现：每次请求新建连接，全量解码后截取前10条"""
+    data = {"search_engine": "search_prime", "search_query": query, "query_rewrite": "false"}
+    response = requests.post(url, headers={'api-key': 'bench'}, data=json.dumps(data), timeout=30)
+    result = json.loads(response.content.decode())
+    return result.get("search_result", [])[:10]
+
+
+def pooled_call(url: str, query: str) -> list:
+    """新实现：走websearch_service.call_single_engine（共享Session + 流式解析）"""
+    websearch_service.API_URL = url
+    return websearch_service.call_single_engine(query, 'bench', 'search_prime')
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(name: str, func, url: str, total: int, concurrency: int) -> dict:
+    """并发执行total次调用，统计延迟分位数和新建连接数"""
+    MockSearchHandler.connections = 0
+    latencies = []
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        items = func(url, f'考研数学二大纲 {i}')
+        elapsed = (time.perf_counter() - start) * 1000
+        if len(items) != 10:
+            raise RuntimeError(f"{name}: 期望10条结果，实际 {len(items)} 条")
+        with lock:
+            latencies.append(elapsed)
+
+    # 预热
+    func(url, 'warmup')
+    MockSearchHandler.connections = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    return {
+        'name': name,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'qps': total / wall,
+        'connections': MockSearchHandler.connections
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索客户端连接复用与流式解析基准测试')
+    parser.add_argument('--requests', type=int, default=300, help='每种实现的请求总数')
+    parser.add_argument('--concurrency', type=int, default=6, help='并发数（默认6，对应6个引擎）')
+    parser.add_argument('--items', type=int, default=50, help='mock响应中search_result的条数')
+    parser.add_argument('--content-chars', type=int, default=2000, help='每条结果content的字符数')
+    parser.add_argument('--handshake-ms', type=float, default=20.0, help='每个新连接额外的握手耗时（毫秒）')
+    args = parser.parse_args()
+
+    MockSearchHandler.payload = build_payload(args.items, args.content_chars)
+    MockSearchHandler.handshake_seconds = args.handshake_ms / 1000
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockSearchHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/web_search'
+
+    print(f"mock响应体: {len(MockSearchHandler.payload) / 1024:.1f} KB, {args.items} 条结果, "
+          f"握手开销 {args.handshake_ms:.0f} ms")
+    print(f"请求数: {args.requests}, 并发: {args.concurrency}\n")
+
+    # call_single_engine 每次调用都会打印日志，测试期间屏蔽输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = [
+            run('legacy (新建连接+全量解码)', legacy_call, url, args.requests, args.concurrency),
+            run('pooled (keep-alive+流式解析)', pooled_call, url, args.requests, args.concurrency),
+        ]
+
+    print(f"{'实现':<32}{'p50(ms)':>10}{'p99(ms)':>10}{'QPS':>10}{'新建连接':>10}")
+    for row in rows:
+        print(f"{row['name']:<32}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['qps']:>10.1f}{row['connections']:>10}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
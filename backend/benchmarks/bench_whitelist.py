@@ -0,0 +1,146 @@
+"""
+白名单存储后端基准测试
+分别生成1万/100万/1000万个host的JSON白名单并迁移到SQLite，每个(后端, 规模)组合在独立子进程中
+加载并查询，对比启动耗时、常驻内存(RSS)以及 get_score 的p50/p99延迟
+
+用法:
+    python benchmarks/bench_whitelist.py --sizes 10000,1000000,10000000 --lookups 200000
+    python benchmarks/bench_whitelist.py --sizes 10000000 --backends sqlite   # JSON后端在千万级需要数GB内存
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVICES_DIR = os.path.join(os.path.dirname(__file__), '..', 'services')
+sys.path.append(SERVICES_DIR)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+
+def make_host(i: int) -> str:
+    return f'www.site{i}.example{i % 997}.com'
+
+
+def write_json_whitelist(path: str, size: int):
+    """流式写出JSON快照，避免生成阶段占用大量内存"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for i in range(size):
+            if i:
+                f.write(',')
+            f.write(json.dumps(make_host(i)))
+            f.write(f':{{"score": {i % 4 + 1}, "reason": "bench"}}')
+        f.write('}')
+
+
+def current_rss_mb() -> float:
+    """读取当前进程的常驻内存（MB）"""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def worker(backend: str, path: str, size: int, lookups: int, lru_size: int):
+    """子进程：加载白名单并执行查询，结果以JSON输出到stdout"""
+    import authority_whitelist
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    if backend == 'json':
+        whitelist = authority_whitelist.AuthorityWhitelist(path, path + '.journal')
+    else:
+        whitelist = authority_whitelist.SqliteAuthorityWhitelist(path, lru_size=lru_size, read_only=True)
+    load_seconds = time.perf_counter() - start
+
+    # 一半查询落在1000个热点host上，其余均匀分布，另有10%未命中
+    rng = random.Random(42)
+    hot = [rng.randrange(size) for _ in range(1000)]
+    keys = []
+    for _ in range(lookups):
+        r = rng.random()
+        if r < 0.1:
+            keys.append(f'missing{rng.randrange(size)}.com')
+        elif r < 0.55:
+            keys.append(make_host(rng.choice(hot)))
+        else:
+            keys.append(make_host(rng.randrange(size)))
+
+    latencies = []
+    for key in keys:
+        t0 = time.perf_counter_ns()
+        whitelist.get_score(key)
+        latencies.append((time.perf_counter_ns() - t0) / 1000)
+
+    print(json.dumps({
+        'load_s': load_seconds,
+        'rss_mb': current_rss_mb() - rss_before,
+        'p50_us': percentile(latencies, 50),
+        'p99_us': percentile(latencies, 99)
+    }))
+
+
+def run_worker(backend: str, path: str, size: int, lookups: int, lru_size: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, '--worker', backend, '--path', path, '--sizes', str(size),
+         '--lookups', str(lookups), '--lru-size', str(lru_size)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    # 白名单模块可能打印日志，结果在最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='白名单JSON/SQLite后端的内存与查询延迟基准测试')
+    parser.add_argument('--sizes', default='10000,1000000,10000000', help='逗号分隔的host数量')
+    parser.add_argument('--backends', default='json,sqlite', help='逗号分隔的后端')
+    parser.add_argument('--lookups', type=int, default=200000, help='每个组合的查询次数')
+    parser.add_argument('--lru-size', type=int, default=4096, help='SQLite后端的LRU容量')
+    parser.add_argument('--workdir', default=None, help='生成数据的目录（默认临时目录）')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--path', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    if args.worker:
+        worker(args.worker, args.path, sizes[0], args.lookups, args.lru_size)
+        return
+
+    from migrate_whitelist_to_sqlite import migrate
+
+    backends = args.backends.split(',')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_whitelist_')
+    os.makedirs(workdir, exist_ok=True)
+    rows = []
+    for size in sizes:
+        json_path = os.path.join(workdir, f'whitelist_{size}.json')
+        db_path = os.path.join(workdir, f'whitelist_{size}.db')
+        if not os.path.exists(json_path):
+            print(f"生成 {size} 个host的JSON白名单...")
+            write_json_whitelist(json_path, size)
+        if 'sqlite' in backends and not os.path.exists(db_path):
+            print("迁移到SQLite...")
+            migrate(json_path, json_path + '.journal', db_path)
+
+        for backend in backends:
+            path = json_path if backend == 'json' else db_path
+            result = run_worker(backend, path, size, args.lookups, args.lru_size)
+            rows.append((backend, size, result))
+
+    print(f"\n{'后端':<10}{'host数':>12}{'加载(s)':>10}{'RSS(MB)':>10}{'p50(us)':>10}{'p99(us)':>10}")
+    for backend, size, r in rows:
+        print(f"{backend:<10}{size:>12}{r['load_s']:>10.2f}{r['rss_mb']:>10.1f}{r['p50_us']:>10.2f}{r['p99_us']:>10.2f}")
+    print(f"\n数据目录: {workdir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+离线批量查询工具
+逐行读取JSONL格式的query文件，用进程池执行与 /api/query 相同的流水线（响应缓存、白名单、相关性缓存照常生效），
+结果按完成顺序逐行追加写入JSONL。每完成一行更新一次检查点，中断后用同一命令重新运行即从断点继续，
+已写出结果的query不会重新打分。在途query数有上限，内存占用与输入文件大小无关
+
+输入每行一个JSON对象，除query外均可省略：
+    {"query": "考研数学二大纲", "selected_engines": [], "engine_mode": "adaptive", "top_k": 10, "deadline_ms": 3000}
+也可以直接是JSON字符串："考研数学二大纲"
+
+输出每行一个响应（与 /api/query 一致），附带输入行号 line（从0开始）；失败的行为
+    {"line": 3, "query": "...", "success": false, "error": "..."}
+
+多个worker进程需要SQLite白名单后端；默认的JSON后端下只用1个worker进程
+
+用法:
+    python scripts/batch_query.py queries.jsonl results.jsonl
+    AUTHORITY_WHITELIST_BACKEND=sqlite python scripts/batch_query.py queries.jsonl results.jsonl --workers 4
+    python scripts/batch_query.py queries.jsonl results.jsonl --restart   # 忽略检查点，从头开始
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing.util import Finalize
+from typing import Dict, Iterator, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'services'))
+
+from authority_whitelist import WHITELIST_BACKEND, get_whitelist
+from query_pipeline import run_cached_query_pipeline
+from request_params import parse_top_k, parse_deadline_ms, parse_engine_mode
+
+# SQLite白名单后端下的默认worker进程数
+DEFAULT_WORKERS = 4
+
+# 行号超过 水位线 + 在途上限 * SPAN_FACTOR 时暂停提交：
+# 某个query很慢时，后面已完成的行号都要记在检查点里，这里限制它们的数量
+SPAN_FACTOR = 8
+
+
+def init_worker(verbose: bool):
+    """worker进程初始化"""
+    if not verbose:
+        # 流水线的逐条日志在批量模式下没有意义
+        sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    # 进程池的worker退出时不执行atexit，白名单剩余的待写条目改由multiprocessing的退出钩子落盘
+    Finalize(None, get_whitelist().close, exitpriority=10)
+
+
+def parse_request(raw: bytes) -> Dict:
+    """
+    解析输入的一行，top_k、deadline_ms、engine_mode 与 /api/query 使用同样的校验
+
+    Returns:
+        {query, selected_engines, top_k, deadline_ms, engine_mode}
+
+    Raises:
+        ValueError: 不是合法JSON、缺少非空的query，或参数不合法
+    """
+    request = json.loads(raw)
+    if isinstance(request, str):
+        request = {'query': request}
+    if not isinstance(request, dict) or not isinstance(request.get('query'), str) or not request['query'].strip():
+        raise ValueError('每行必须是包含非空query的JSON对象或JSON字符串')
+    return {
+        'query': request['query'].strip(),
+        'selected_engines': request.get('selected_engines') or [],
+        'top_k': parse_top_k(request),
+        'deadline_ms': parse_deadline_ms(request),
+        'engine_mode': parse_engine_mode(request)
+    }
+
+
+def run_line(line_no: int, raw: bytes) -> Tuple[bool, str]:
+    """
+    在worker进程中执行一行查询
+
+    Returns:
+        (是否成功, 输出行的JSON文本)
+    """
+    query = None
+    try:
+        request = parse_request(raw)
+        query = request['query']
+        response = run_cached_query_pipeline(query, request['selected_engines'], request['top_k'],
+                                             request['deadline_ms'], request['engine_mode'])
+        return True, json.dumps(dict({'line': line_no}, **response), ensure_ascii=False)
+    except Exception as e:
+        return False, json.dumps({'line': line_no, 'query': query, 'success': False, 'error': str(e)},
+                                 ensure_ascii=False)
+
+
+def count_lines(path: str) -> int:
+    """统计输入行数（分块读取，用于计算进度和预计剩余时间）"""
+    count = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            count += chunk.count(b'\n')
+            last = chunk[-1:]
+    return count + (last != b'\n')
+
+
+def iter_lines(path: str, start_line: int, start_offset: int) -> Iterator[Tuple[int, int, bytes]]:
+    """从指定行号和字节偏移开始逐行产出 (行号, 行首偏移, 行内容)"""
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        line_no, offset = start_line, start_offset
+        for raw in f:
+            yield line_no, offset, raw
+            line_no += 1
+            offset += len(raw)
+
+
+class Checkpoint:
+    """
+    断点状态：
+    - watermark: 行号小于它的行都已写出，input_offset 是该行在输入文件中的字节偏移
+    - done_above: 水位线以上已写出的行号（按完成顺序输出，所以水位线以上会有空洞）
+    - output_offset: 与以上状态一致的输出文件长度，恢复时截掉其后的内容（这些行会重新执行）
+    """
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.watermark = 0
+        self.input_offset = 0
+        self.done_above = set()
+        self.output_offset = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def load(self) -> bool:
+        """读取检查点，不存在时返回False"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['input'] != self.input_path:
+            raise ValueError(f"检查点对应的输入文件是 {state['input']}，与本次输入不一致")
+        self.watermark = state['watermark']
+        self.input_offset = state['input_offset']
+        self.done_above = set(state['done_above'])
+        self.output_offset = state['output_offset']
+        self.succeeded = state['succeeded']
+        self.failed = state['failed']
+        return True
+
+    def save(self):
+        """先写临时文件再原子替换，避免写到一半时中断损坏检查点"""
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'input': self.input_path,
+                'watermark': self.watermark,
+                'input_offset': self.input_offset,
+                'done_above': sorted(self.done_above),
+                'output_offset': self.output_offset,
+                'succeeded': self.succeeded,
+                'failed': self.failed
+            }, f)
+        os.replace(tmp_file, self.path)
+
+    def is_done(self, line_no: int) -> bool:
+        return line_no < self.watermark or line_no in self.done_above
+
+    def mark_done(self, line_no: int, offsets: Dict[int, int]):
+        """
+        记录一行已写出，并尽量推进水位线
+
+        Args:
+            line_no: 已写出的行号
+            offsets: 从水位线到下一个待读行之间各行的行首偏移（推进时用于更新 input_offset，并移除已越过的行）
+        """
+        self.done_above.add(line_no)
+        while self.watermark in self.done_above:
+            self.done_above.remove(self.watermark)
+            offsets.pop(self.watermark, None)
+            self.watermark += 1
+        self.input_offset = offsets[self.watermark]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run(input_path: str, output_path: str, checkpoint_path: str, workers: int, max_in_flight: int,
+        restart: bool, progress_interval: float, verbose: bool):
+    """
+    执行批量查询
+
+    Args:
+        input_path: 输入JSONL
+        output_path: 输出JSONL
+        checkpoint_path: 检查点文件
+        workers: worker进程数
+        max_in_flight: 同时在途的query数上限
+        restart: 忽略已有检查点，从头开始（清空输出文件）
+        progress_interval: 打印进度的间隔（秒）
+        verbose: 是否输出worker进程中流水线的日志
+    """
+    total = count_lines(input_path)
+    checkpoint = Checkpoint(checkpoint_path, input_path)
+    resumed = not restart and checkpoint.load()
+
+    output = open(output_path, 'r+b' if resumed else 'wb')
+    if resumed:
+        # 截掉最后一次检查点之后写出的行，它们不在 done_above 中，会重新执行
+        output.truncate(checkpoint.output_offset)
+        output.seek(checkpoint.output_offset)
+        print(f"从检查点继续: 已完成 {checkpoint.watermark + len(checkpoint.done_above)}/{total} 行 "
+              f"(成功 {checkpoint.succeeded}, 失败 {checkpoint.failed})")
+    else:
+        checkpoint.save()
+
+    done_before = checkpoint.watermark + len(checkpoint.done_above)
+    completed = 0
+    start = time.perf_counter()
+    last_report = start
+
+    # 从水位线到下一个待读行之间各行的行首偏移，条数受 SPAN_FACTOR 限制
+    offsets: Dict[int, int] = {checkpoint.watermark: checkpoint.input_offset}
+    span = max_in_flight * SPAN_FACTOR
+    pending = {}
+    lines = iter_lines(input_path, checkpoint.watermark, checkpoint.input_offset)
+    next_line = checkpoint.watermark
+    exhausted = False
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(verbose,))
+    try:
+        while True:
+            # 补满在途窗口
+            while not exhausted and len(pending) < max_in_flight and next_line - checkpoint.watermark < span:
+                line = next(lines, None)
+                if line is None:
+                    exhausted = True
+                    break
+                line_no, offset, raw = line
+                next_line = line_no + 1
+                offsets[next_line] = offset + len(raw)
+                if checkpoint.is_done(line_no):
+                    continue
+                if not raw.strip():
+                    # 空行直接视为完成
+                    checkpoint.mark_done(line_no, offsets)
+                    continue
+                pending[executor.submit(run_line, line_no, raw)] = line_no
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                line_no = pending.pop(future)
+                ok, text = future.result()
+                output.write(text.encode('utf-8') + b'\n')
+                if ok:
+                    checkpoint.succeeded += 1
+                else:
+                    checkpoint.failed += 1
+                checkpoint.mark_done(line_no, offsets)
+                completed += 1
+            # 先把结果刷到文件，再写检查点：检查点记录的输出长度总是已经落盘
+            output.flush()
+            checkpoint.output_offset = output.tell()
+            checkpoint.save()
+
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                last_report = now
+                report_progress(done_before + completed, total, completed, now - start, checkpoint.failed)
+    except KeyboardInterrupt:
+        print(f"\n已中断，检查点已保存，重新运行同一命令即可继续: {checkpoint_path}")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        output.close()
+    executor.shutdown()
+    checkpoint.save()
+
+    elapsed = time.perf_counter() - start
+    print(f"✓ 批量查询完成: 本次 {completed} 条，累计成功 {checkpoint.succeeded}、失败 {checkpoint.failed}，"
+          f"耗时 {format_duration(elapsed)}，吞吐 {completed / elapsed * 60 if elapsed else 0:.1f} query/分钟 -> {output_path}")
+
+
+def report_progress(done: int, total: int, completed: int, elapsed: float, failed: int):
+    """打印进度、吞吐与预计剩余时间（按本次运行的平均吞吐估算）"""
+    rate = completed / elapsed if elapsed else 0
+    eta = format_duration((total - done) / rate) if rate else '--:--:--'
+    print(f"  进度 {done}/{total} ({done / total if total else 1:.1%})  吞吐 {rate * 60:.1f} query/分钟  "
+          f"失败 {failed}  预计剩余 {eta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线批量执行JSONL中的查询')
+    parser.add_argument('input', help='输入文件，JSONL格式，每行一个query')
+    parser.add_argument('output', help='输出文件，JSONL格式，每行一个响应')
+    parser.add_argument('--checkpoint', help='检查点文件，默认为 输出文件.ckpt')
+    parser.add_argument('--workers', type=int,
+                        help=f'worker进程数，默认SQLite白名单后端为{DEFAULT_WORKERS}、JSON后端为1')
+    parser.add_argument('--max-in-flight', type=int, help='同时在途的query数上限，默认为 worker数*4')
+    parser.add_argument('--restart', action='store_true', help='忽略已有检查点，从头开始')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='打印进度的间隔（秒）')
+    parser.add_argument('--verbose', action='store_true', help='输出流水线的逐条日志')
+    args = parser.parse_args()
+
+    if args.workers is None:
+        args.workers = 1 if WHITELIST_BACKEND == 'json' else DEFAULT_WORKERS
+    if args.workers < 1:
+        parser.error('--workers 必须是正整数')
+    if args.workers > 1 and WHITELIST_BACKEND == 'json':
+        # JSON快照由各进程按自己的内存副本合并写回，多进程并发写会互相覆盖
+        parser.error('JSON白名单不支持多个进程同时写入，请先迁移到SQLite后端'
+                     '（AUTHORITY_WHITELIST_BACKEND=sqlite），或使用 --workers 1')
+
+    run(args.input, args.output, args.checkpoint or args.output + '.ckpt', args.workers,
+        args.max_in_flight or args.workers * 4, args.restart, args.progress_interval, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+词面预筛阈值校准工具
+读取保存下来的 /api/query 响应（JSONL，每行一个响应），用其中LLM给出的相关性标签校准
+LEXICAL_PREFILTER_THRESHOLD：在相关结果被误过滤的比例可接受的前提下，尽量多过滤
+
+分数按线上的批次重算：线上每次打分只对未命中相关性缓存的结果计算IDF，且少于 LEXICAL_PREFILTER_MIN_BATCH 条时不预筛。
+惰性打分（带top_k）的响应按权威性分档多次打分，批次无法从响应中还原，不参与校准
+
+用法:
+    python scripts/calibrate_prefilter.py responses.jsonl --miss-rates 0,0.01,0.02,0.05
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'services'))
+
+from lexical_prefilter import bm25_scores, calibrate_threshold, PREFILTER_MIN_BATCH
+from result_processor import UNSCORED_REASON
+
+
+def load_samples(path: str):
+    """返回 (归一化分数数组, LLM标签数组, 跳过的惰性打分响应数)，只使用来源为LLM的结果"""
+    scores, labels = [], []
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            response = json.loads(line)
+            items = [item for engine_items in response.get('raw_results_by_engine', {}).values()
+                     for item in engine_items]
+            if any(item.get('relevance_reason') == UNSCORED_REASON for item in items):
+                skipped += 1
+                continue
+            # 与线上一致：IDF只按未命中缓存、进入预筛的那批结果计算
+            batch = [item for item in items if item.get('relevance_source') != 'cache']
+            if len(batch) < PREFILTER_MIN_BATCH:
+                continue
+            batch_scores = bm25_scores(response['query'], [f"{i['title']} {i['content']}" for i in batch])
+            for item, score in zip(batch, batch_scores):
+                if item.get('relevance_source', 'llm') == 'llm' and item.get('relevance_score') in [0, 1, 2]:
+                    scores.append(score)
+                    labels.append(item['relevance_score'])
+    return np.array(scores), np.array(labels), skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='校准词面预筛阈值')
+    parser.add_argument('responses', help='保存的 /api/query 响应，JSONL格式')
+    parser.add_argument('--miss-rates', default='0,0.01,0.02,0.05', help='可接受的相关结果误过滤比例，逗号分隔')
+    args = parser.parse_args()
+
+    scores, labels, skipped = load_samples(args.responses)
+    if skipped:
+        print(f"跳过惰性打分（带top_k）的响应: {skipped} 条")
+    if len(scores) == 0:
+        print("没有可用的LLM标注样本")
+        return
+    print(f"样本数: {len(scores)}，相关(1/2): {(labels > 0).sum()}，无关(0): {(labels == 0).sum()}\n")
+
+    print(f"{'误过滤上限':>10}{'阈值':>10}{'过滤比例':>10}{'过滤中无关占比':>16}")
+    for rate in [float(r) for r in args.miss_rates.split(',')]:
+        threshold = calibrate_threshold(scores, labels, rate)
+        rejected = scores < threshold
+        precision = (labels[rejected] == 0).mean() if rejected.any() else 1.0
+        print(f"{rate:>10.2%}{threshold:>10.4f}{rejected.mean():>10.2%}{precision:>16.2%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+白名单迁移工具
+把JSON快照（以及尚未合并的追加日志）导入SQLite库，供 AUTHORITY_WHITELIST_BACKEND=sqlite 使用
+
+用法:
+    python scripts/migrate_whitelist_to_sqlite.py
+    python scripts/migrate_whitelist_to_sqlite.py --json services/authority_whitelist.json --db /data/authority_whitelist.db
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'services'))
+
+from authority_whitelist import WHITELIST_FILE, JOURNAL_FILE, WHITELIST_DB, create_schema, insert_hosts, read_journal
+
+# 每个事务写入的条数
+BATCH_SIZE = 50000
+
+
+def iter_entries(json_file: str, journal_file: str):
+    """先产出快照中的条目，再产出日志中的条目（后写覆盖先写）"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    yield from snapshot.items()
+    yield from read_journal(journal_file)
+
+
+def migrate(json_file: str, journal_file: str, db_file: str) -> int:
+    """
+    执行迁移
+
+    Args:
+        json_file: JSON快照路径
+        journal_file: 追加日志路径（不存在时跳过）
+        db_file: 目标SQLite库路径
+
+    Returns:
+        写入的条目数
+    """
+    conn = sqlite3.connect(db_file)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    create_schema(conn)
+
+    batch = []
+    total = 0
+    for entry in iter_entries(json_file, journal_file):
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            insert_hosts(conn, batch)
+            total += len(batch)
+            batch = []
+            print(f"  已写入 {total} 条")
+    insert_hosts(conn, batch)
+    total += len(batch)
+
+    # 把WAL合并回主库，便于只读分发
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把JSON白名单迁移到SQLite')
+    parser.add_argument('--json', default=WHITELIST_FILE, help='JSON快照路径')
+    parser.add_argument('--journal', default=JOURNAL_FILE, help='追加日志路径')
+    parser.add_argument('--db', default=WHITELIST_DB, help='目标SQLite库路径')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    total = migrate(args.json, args.journal, args.db)
+    conn = sqlite3.connect(args.db)
+    count = conn.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+    conn.close()
+    print(f"✓ 迁移完成: 写入 {total} 条，库中共 {count} 个host，耗时 {time.perf_counter() - start:.1f}s -> {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+异步运行时
+进程内共享的后台事件循环：所有异步查询跑在同一个循环上，共用连接池，
+同步代码（如Flask视图）通过 run_coroutine 提交协程并等待结果
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable, Coroutine, Optional
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取共享的后台事件循环（首次调用时启动）"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='async-pipeline-loop', daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def run_coroutine(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """
+    在共享事件循环上执行协程并阻塞等待结果
+
+    Args:
+        coro: 要执行的协程
+        timeout: 最长等待秒数，None表示一直等待
+
+    Returns:
+        协程的返回值
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    return future.result(timeout)
+
+
+class LoopLocal:
+    """
+    按事件循环隔离的资源缓存
+
+    httpx.AsyncClient、asyncio.Semaphore 等对象只能在创建它们的事件循环中使用，
+    这里为每个循环各创建一份，循环销毁后自动释放。
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._values = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._values.get(loop)
+            if value is None:
+                value = self._factory()
+                self._values[loop] = value
+        return value
@@ -2,32 +2,46 @@
 权威性打分服务
 评估网站域名(host)的权威性: 1(极低权威), 2(一般权威), 3(中高权威), 4(顶级权威)
 """
-from openai import OpenAI
 import json
 import re
 import ast
 import time
+import asyncio
 import traceback
-from typing import Dict, Tuple, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Tuple, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from authority_whitelist import get_whitelist
-
-# API配置
-API_KEY = "MAAS680934ffb1a349259ed7beae4272175b"
-BASE_URL = "http://redservingapi.devops.xiaohongshu.com/v1"
-MODEL = "qwen3-30b-a3b"
-
-
-def get_response(messages):
-    """调用LLM获取响应"""
-    client = OpenAI(
-        api_key=API_KEY,
-        base_url=BASE_URL
+from host_rules import normalize_host
+from llm_client import chat_completion, async_chat_completion, REQUEST_TIMEOUT
+from singleflight import SingleFlight
+from request_context import submit_in_context
+from deadline import Deadline, DeadlineExceeded, iter_completed, wait_until
+from result_processor import mark_authority_unscored
+from fast_scoring import FAST_SCORING, fast_system_prompt, fast_label, fast_label_async, is_fast_reason, reusable
+
+# 进程内正在打分的host：并发请求中同一host只调用一次LLM，其余调用方等待同一结果
+_authority_flights = SingleFlight()
+
+
+def get_response(messages, timeout: float = REQUEST_TIMEOUT, deadline: Optional[Deadline] = None):
+    """调用LLM获取响应（复用共享的长连接客户端；到达 deadline 时不再在调度器中排队）"""
+    completion = chat_completion(
+        messages,
+        deadline=deadline,
+        stream=False,
+        max_tokens=1024,
+        temperature=0.1,
+        timeout=timeout
     )
+    reasoning_content = completion.choices[0].message.reasoning_content if hasattr(completion.choices[0].message, 'reasoning_content') else None
+    content = completion.choices[0].message.content
+    return reasoning_content, content
+
 
-    completion = client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
+async def get_response_async(messages):
+    """异步调用LLM获取响应"""
+    completion = await async_chat_completion(
+        messages,
         stream=False,
         max_tokens=1024,
         temperature=0.1
@@ -146,8 +160,20 @@ USER_PROMPT_TEMPLATE = '''现在，请你分析Url对应的host，给出网站Ho
 host:{host}
 '''
 
+# 快速打分：打分标准不变，只输出一个标签token
+AUTHORITY_LABELS = (1, 2, 3, 4)
+FAST_SYSTEM_PROMPT = fast_system_prompt(SYSTEM_PROMPT, AUTHORITY_LABELS)
+
+
+def build_messages(system_prompt: str, host: str) -> List[Dict]:
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': USER_PROMPT_TEMPLATE.format(host=host)}
+    ]
+
 
-def score_authority(host: str, max_retries: int = 3, auto_add_to_whitelist: bool = True) -> Tuple[int, str]:
+def score_authority(host: str, max_retries: int = 3, auto_add_to_whitelist: bool = True,
+                    fast: bool = FAST_SCORING, deadline: Optional[Deadline] = None) -> Tuple[int, str]:
     """
     评估单个host的权威性（支持白名单）
 
@@ -155,42 +181,86 @@ def score_authority(host: str, max_retries: int = 3, auto_add_to_whitelist: bool
         host: 网站域名
         max_retries: 最大重试次数
         auto_add_to_whitelist: 是否自动添加到白名单
+        fast: 快速模式，只输出标签不生成理由；失败或置信度不足时回退为完整打分
+        deadline: 请求截止时间，到期后不再发起新的尝试（抛出 DeadlineExceeded）
 
     Returns:
         (权威性分数 1/2/3/4, 判断依据)
     """
-    # 1. 先查白名单
+    # 1. 先查白名单（完整模式下不复用快速打分写入的条目，重新打分后覆盖）
     whitelist = get_whitelist()
     cached_score, cached_reason = whitelist.get_score(host)
-    if cached_score is not None:
+    if cached_score is not None and reusable(cached_reason, fast):
         print(f"✓ 白名单命中: {host} -> {cached_score}")
         return cached_score, cached_reason
 
-    # 2. 白名单未命中，调用LLM
-    messages = [
-        {'role': 'system', 'content': SYSTEM_PROMPT},
-        {'role': 'user', 'content': USER_PROMPT_TEMPLATE.format(host=host)}
-    ]
+    # 2. 白名单未命中，调用LLM（其他请求正在给同一host打分时直接等待其结果）
+    while True:
+        try:
+            result, shared = _authority_flights.do(normalize_host(host), _score_authority_llm,
+                                                   host, max_retries, auto_add_to_whitelist, fast, deadline)
+            break
+        except DeadlineExceeded:
+            # 等待的是其他请求发起的打分，它的截止时间先到了：本请求还有时间就重新发起
+            if deadline is not None and deadline.expired():
+                raise
+    if shared:
+        print(f"✓ 复用进行中的权威性打分: {host} -> {result[0]}")
+    return result
+
+
+def _score_authority_llm(host: str, max_retries: int, auto_add_to_whitelist: bool, fast: bool,
+                         deadline: Optional[Deadline]) -> Tuple[int, str]:
+    """调用LLM评估host的权威性（由 score_authority 经请求合并调用）"""
+    # 等待合并期间其他调用方可能刚把该host写入白名单
+    whitelist = get_whitelist()
+    cached_score, cached_reason = whitelist.get_score(host)
+    if cached_score is not None and reusable(cached_reason, fast):
+        return cached_score, cached_reason
+
+    result = None
+    if fast:
+        if deadline:
+            deadline.check()
+        result = fast_label(build_messages(FAST_SYSTEM_PROMPT, host), AUTHORITY_LABELS,
+                            timeout=deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT,
+                            deadline=deadline)
+    if result is None:
+        result = request_authority(host, max_retries, deadline)
+
+    # 3. 自动添加到白名单
+    if auto_add_to_whitelist and result[0] in AUTHORITY_LABELS:
+        whitelist.add_host(normalize_host(host), *result)
+    return result
+
+
+def request_authority(host: str, max_retries: int = 3, deadline: Optional[Deadline] = None) -> Tuple[int, str]:
+    """完整模式调用LLM评估host的权威性（带理由，不查也不写白名单；deadline 到期后不再重试）"""
+    messages = build_messages(SYSTEM_PROMPT, host)
 
     for attempt in range(max_retries):
+        if deadline:
+            deadline.check()
         try:
-            reasoning_content, response_text = get_response(messages)
+            reasoning_content, response_text = get_response(
+                messages, timeout=deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT,
+                deadline=deadline
+            )
 
             parsed_result = parse_json_block(response_text)
             score = parsed_result.get("标签", -1)
             reason = parsed_result.get("判断依据", "解析失败")
 
             if score in [1, 2, 3, 4]:
-                # 3. 自动添加到白名单
-                if auto_add_to_whitelist:
-                    whitelist.add_host(host, score, reason)
                 return score, reason
             else:
                 raise ValueError(f"无效的标签值: {score}")
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             if attempt < max_retries - 1:
-                time.sleep(1)
+                time.sleep(deadline.timeout(1) if deadline else 1)
                 continue
             else:
                 print(f"权威性打分失败 (host={host}): {str(e)}")
@@ -199,34 +269,36 @@ def score_authority(host: str, max_retries: int = 3, auto_add_to_whitelist: bool
     return -1, "打分失败"
 
 
-def score_authority_batch(results: list, max_workers: int = 128) -> list:
+def score_authority_batch(results: list, max_workers: int = 128, deadline: Optional[Deadline] = None) -> list:
     """
     批量评估权威性（使用缓存避免重复评估相同host）
 
     Args:
         results: 搜索结果列表，每个包含 {url, title, content, engine, host, relevance_score, relevance_reason}
         max_workers: 最大并发数
+        deadline: 请求截止时间，届时仍未打完分的host标记为未打分
 
     Returns:
         添加了权威性分数的结果列表
     """
     print(f"\n开始权威性打分...")
 
-    # 提取所有唯一的host
-    unique_hosts = list(set([r['host'] for r in results]))
+    # 提取所有唯一的host（按归一化后的host去重，www./m./端口不同的写法只打一次分）
+    unique_hosts = list(set([normalize_host(r['host']) for r in results]))
     print(f"  共 {len(unique_hosts)} 个不同的host需要评分")
 
     # 缓存host的权威性分数
     host_scores = {}
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
         future_to_host = {
-            executor.submit(score_authority, host): host
+            submit_in_context(executor, score_authority, host, deadline=deadline): host
             for host in unique_hosts
         }
 
         completed = 0
-        for future in as_completed(future_to_host):
+        for future in iter_completed(future_to_host, deadline, 'authority'):
             host = future_to_host[future]
             try:
                 score, reason = future.result()
@@ -236,17 +308,39 @@ def score_authority_batch(results: list, max_workers: int = 128) -> list:
                 if completed % 10 == 0:
                     print(f"  进度: {completed}/{len(unique_hosts)}")
 
+            except DeadlineExceeded:
+                deadline.mark_timed_out('authority')
+                continue
             except Exception as e:
                 print(f"  处理host {host} 失败: {str(e)}")
                 host_scores[host] = {'score': -1, 'reason': "打分失败"}
+    finally:
+        # 截止时间已到时不等待进行中的打分，排队中的直接取消
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return apply_host_scores(results, host_scores)
 
-    # 将权威性分数添加到结果中
+
+def apply_host_scores(results: list, host_scores: Dict[str, Dict]) -> list:
+    """
+    将host的权威性分数写回每条结果，并打印分布统计
+
+    Args:
+        results: 搜索结果列表
+        host_scores: {归一化host: {'score': 分数, 'reason': 理由}}，缺少的host标记为未打分
+
+    Returns:
+        添加了权威性分数的结果列表
+    """
     scored_results = []
     for result in results:
         result_copy = result.copy()
-        host = result_copy['host']
-        result_copy['authority_score'] = host_scores[host]['score']
-        result_copy['authority_reason'] = host_scores[host]['reason']
+        host = normalize_host(result_copy['host'])
+        if host in host_scores:
+            result_copy['authority_score'] = host_scores[host]['score']
+            result_copy['authority_reason'] = host_scores[host]['reason']
+        else:
+            mark_authority_unscored(result_copy)
         scored_results.append(result_copy)
 
     # 统计
@@ -260,10 +354,136 @@ def score_authority_batch(results: list, max_workers: int = 128) -> list:
     print(f"  一般权威(2): {score_counts[2]}")
     print(f"  极低权威(1): {score_counts[1]}")
     print(f"  失败(-1): {score_counts[-1]}")
+    if score_counts.get(None):
+        print(f"  超时未打分: {score_counts[None]}")
 
     return scored_results
 
 
+async def score_authority_async(host: str, max_retries: int = 3, auto_add_to_whitelist: bool = True,
+                                fast: bool = FAST_SCORING) -> Tuple[int, str]:
+    """
+    score_authority 的异步版本（同样先查白名单）
+
+    Args:
+        host: 网站域名
+        max_retries: 最大重试次数
+        auto_add_to_whitelist: 是否自动添加到白名单
+        fast: 快速模式
+
+    Returns:
+        (权威性分数 1/2/3/4, 判断依据)
+    """
+    whitelist = get_whitelist()
+    cached_score, cached_reason = whitelist.get_score(host)
+    if cached_score is not None and reusable(cached_reason, fast):
+        print(f"✓ 白名单命中: {host} -> {cached_score}")
+        return cached_score, cached_reason
+
+    # 与同步版本共用合并登记表，同步与异步请求之间同样只打一次分
+    result, shared = await _authority_flights.do_async(normalize_host(host), _score_authority_llm_async,
+                                                       host, max_retries, auto_add_to_whitelist, fast)
+    if shared:
+        print(f"✓ 复用进行中的权威性打分: {host} -> {result[0]}")
+    return result
+
+
+async def _score_authority_llm_async(host: str, max_retries: int, auto_add_to_whitelist: bool,
+                                     fast: bool) -> Tuple[int, str]:
+    """_score_authority_llm 的异步版本"""
+    whitelist = get_whitelist()
+    cached_score, cached_reason = whitelist.get_score(host)
+    if cached_score is not None and reusable(cached_reason, fast):
+        return cached_score, cached_reason
+
+    result = await fast_label_async(build_messages(FAST_SYSTEM_PROMPT, host), AUTHORITY_LABELS) if fast else None
+    if result is None:
+        result = await request_authority_async(host, max_retries)
+
+    if auto_add_to_whitelist and result[0] in AUTHORITY_LABELS:
+        whitelist.add_host(normalize_host(host), *result)
+    return result
+
+
+async def request_authority_async(host: str, max_retries: int = 3) -> Tuple[int, str]:
+    """request_authority 的异步版本"""
+    messages = build_messages(SYSTEM_PROMPT, host)
+
+    for attempt in range(max_retries):
+        try:
+            reasoning_content, response_text = await get_response_async(messages)
+
+            parsed_result = parse_json_block(response_text)
+            score = parsed_result.get("标签", -1)
+            reason = parsed_result.get("判断依据", "解析失败")
+
+            if score in [1, 2, 3, 4]:
+                return score, reason
+            else:
+                raise ValueError(f"无效的标签值: {score}")
+
+        except Exception as e:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(1)
+                continue
+            else:
+                print(f"权威性打分失败 (host={host}): {str(e)}")
+                return -1, "打分失败"
+
+    return -1, "打分失败"
+
+
+def get_authority_flight_stats() -> Dict:
+    """权威性打分的请求合并统计"""
+    return _authority_flights.get_stats()
+
+
+async def score_authority_batch_async(results: list, deadline: Optional[Deadline] = None) -> list:
+    """
+    score_authority_batch 的异步版本：去重后的host在同一个事件循环上并发打分
+
+    Args:
+        results: 搜索结果列表，每个包含 {url, title, content, engine, host}
+        deadline: 请求截止时间，届时仍未打完分的host被取消并标记为未打分
+
+    Returns:
+        添加了权威性分数的结果列表
+    """
+    print(f"\n开始异步权威性打分...")
+
+    unique_hosts = list(set([normalize_host(r['host']) for r in results]))
+    print(f"  共 {len(unique_hosts)} 个不同的host需要评分")
+
+    tasks = {asyncio.ensure_future(score_authority_async(host)): host for host in unique_hosts}
+    done = await wait_until(tasks, deadline, 'authority')
+
+    host_scores = {}
+    for task, host in tasks.items():
+        if task not in done:
+            continue
+        if task.exception() is not None:
+            print(f"  处理host {host} 失败: {str(task.exception())}")
+            host_scores[host] = {'score': -1, 'reason': "打分失败"}
+        else:
+            score, reason = task.result()
+            host_scores[host] = {'score': score, 'reason': reason}
+
+    return apply_host_scores(results, host_scores)
+
+
+def explain_authority(host: str) -> Tuple[int, str]:
+    """
+    按需生成理由：用完整模式重新评估host（快速模式写入白名单的条目不带理由）
+    白名单中没有该host或只有快速打分的条目时，把完整结果写回白名单
+    """
+    score, reason = request_authority(host)
+    whitelist = get_whitelist()
+    cached_score, cached_reason = whitelist.get_score(host)
+    if score in AUTHORITY_LABELS and (cached_score is None or is_fast_reason(cached_reason)):
+        whitelist.add_host(normalize_host(host), score, reason)
+    return score, reason
+
+
 # 测试代码
 if __name__ == '__main__':
     # 测试单个打分
@@ -1,13 +1,42 @@
 """
 权威网站白名单管理
 支持动态添加和持久化存储
+
+默认的JSON后端采用 快照 + 追加日志(write-behind) 的方式：
+- 新增host先写入内存字典（读取无需加锁），再进入待写队列
+- 后台线程批量把待写队列追加到日志文件，单次写入成本与白名单规模无关
+- 日志条数超过快照规模的一定比例时，合并进快照文件并清空日志
+
+百万级以上host可切换为SQLite后端（见 SqliteAuthorityWhitelist），按需查询不整表载入内存
 """
+import atexit
 import json
 import os
-from typing import Dict, Tuple
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from host_rules import HostRuleTrie, normalize_host, host_variants, is_rule_pattern
 
 # 白名单文件路径
 WHITELIST_FILE = os.path.join(os.path.dirname(__file__), 'authority_whitelist.json')
+# 追加日志文件路径（每行一条 {"host", "score", "reason"}）
+JOURNAL_FILE = os.path.join(os.path.dirname(__file__), 'authority_whitelist.journal')
+
+# 后台刷盘：最长间隔（秒）与触发立即刷盘的待写条数
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH_SIZE = 256
+# 日志条数 >= max(COMPACT_MIN_ENTRIES, 快照条数 * COMPACT_RATIO) 时合并进快照，
+# 按比例触发保证合并的摊还成本不随白名单规模增长
+COMPACT_MIN_ENTRIES = 1000
+COMPACT_RATIO = 0.5
+
+# 存储后端：json（快照+日志，整表常驻内存）或 sqlite（磁盘索引 + 进程内LRU，适合百万级host）
+WHITELIST_BACKEND = os.getenv('AUTHORITY_WHITELIST_BACKEND', 'json')
+WHITELIST_DB = os.getenv('AUTHORITY_WHITELIST_DB', os.path.join(os.path.dirname(__file__), 'authority_whitelist.db'))
+WHITELIST_READ_ONLY = os.getenv('AUTHORITY_WHITELIST_READONLY', '') == '1'
+LRU_SIZE = int(os.getenv('AUTHORITY_WHITELIST_LRU_SIZE', '4096'))
 
 # 默认白名单（初始化）
 DEFAULT_WHITELIST = {
@@ -22,6 +51,10 @@ DEFAULT_WHITELIST = {
     'www.fudan.edu.cn': {'score': 4, 'reason': '复旦大学'},
     'www.zju.edu.cn': {'score': 4, 'reason': '浙江大学'},
 
+    # 后缀规则：覆盖所有子域名（精确条目与更具体的规则优先）
+    '*.gov.cn': {'score': 4, 'reason': '政府机构域名'},
+    '*.edu.cn': {'score': 4, 'reason': '教育机构域名'},
+
     # 官方平台（分数4）
     'support.microsoft.com': {'score': 4, 'reason': 'Microsoft官方支持'},
     'developer.mozilla.org': {'score': 4, 'reason': 'MDN官方文档'},
@@ -45,33 +78,30 @@ DEFAULT_WHITELIST = {
 }
 
 
-class AuthorityWhitelist:
-    """权威网站白名单管理器"""
+class _WriteBehindWhitelist:
+    """
+    白名单的公共部分：host归一化与规则匹配、分数校验、后台批量持久化
 
-    def __init__(self):
-        self.whitelist = self._load_whitelist()
+    子类实现 _get_exact（精确查找）、_remember（写入内存/缓存，供读取立即可见）和 _persist（批量落盘）
+    """
 
-    def _load_whitelist(self) -> Dict:
-        """从文件加载白名单"""
-        if os.path.exists(WHITELIST_FILE):
-            try:
-                with open(WHITELIST_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"加载白名单失败: {e}，使用默认白名单")
-                return DEFAULT_WHITELIST.copy()
-        else:
-            # 首次运行，保存默认白名单
-            self._save_whitelist(DEFAULT_WHITELIST)
-            return DEFAULT_WHITELIST.copy()
+    def _load_rules(self, entries: Iterable[Tuple[str, Dict]]):
+        """从白名单条目中挑出 *.gov.cn 之类的规则，建立规则树"""
+        self._rules = HostRuleTrie()
+        for host, entry in entries:
+            if is_rule_pattern(host):
+                self._rules.add(host, entry['score'], entry['reason'])
 
-    def _save_whitelist(self, whitelist: Dict):
-        """保存白名单到文件"""
-        try:
-            with open(WHITELIST_FILE, 'w', encoding='utf-8') as f:
-                json.dump(whitelist, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存白名单失败: {e}")
+    def _get_exact(self, host: str) -> Optional[Tuple[int, str]]:
+        raise NotImplementedError
+
+    def _resolve(self, normalized: str) -> Optional[Tuple[int, str]]:
+        """先按精确条目（含 www./m. 写法）查找，再匹配最具体的后缀规则"""
+        for candidate in host_variants(normalized):
+            value = self._get_exact(candidate)
+            if value is not None:
+                return value
+        return self._rules.match(normalized)
 
     def get_score(self, host: str) -> Tuple[int, str]:
         """
@@ -80,10 +110,37 @@ class AuthorityWhitelist:
         Returns:
             (分数, 理由) 如果不在白名单中返回 (None, None)
         """
-        if host in self.whitelist:
-            entry = self.whitelist[host]
-            return entry['score'], entry['reason']
-        return None, None
+        value = self._resolve(normalize_host(host))
+        return value if value else (None, None)
+
+    def _start_writer(self):
+        # 待写队列，由后台线程批量持久化
+        self._pending: List[Tuple[str, Dict]] = []
+        self._pending_lock = threading.Lock()
+        # 保证落盘操作互斥（后台线程与close()都可能刷盘）
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+        self._writer = threading.Thread(target=self._writer_loop, name='whitelist-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _writer_loop(self):
+        """后台刷盘线程"""
+        while not self._stopped.is_set():
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"白名单刷盘失败: {e}")
+
+    def _remember(self, host: str, entry: Dict):
+        raise NotImplementedError
+
+    def _persist(self, batch: List[Tuple[str, Dict]]):
+        raise NotImplementedError
 
     def add_host(self, host: str, score: int, reason: str):
         """
@@ -98,32 +155,310 @@ class AuthorityWhitelist:
             print(f"无效的分数: {score}，必须在1-4之间")
             return
 
-        self.whitelist[host] = {
+        entry = {
             'score': score,
             'reason': reason
         }
-        self._save_whitelist(self.whitelist)
+        if is_rule_pattern(host):
+            self._rules.add(host, score, reason)
+        self._remember(host, entry)
+
+        # 持久化交给后台线程批量完成
+        with self._pending_lock:
+            self._pending.append((host, entry))
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._wakeup.set()
         print(f"✓ 已添加到白名单: {host} -> {score} ({reason})")
 
+    def flush(self):
+        """把待写队列批量持久化"""
+        with self._io_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            self._persist(batch)
+
+    def close(self):
+        """停止后台线程并把剩余待写条目落盘"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._writer.join(timeout=5)
+        self.flush()
+
+
+class AuthorityWhitelist(_WriteBehindWhitelist):
+    """权威网站白名单管理器（JSON快照 + 追加日志，整表常驻内存）"""
+
+    def __init__(self, whitelist_file: str = WHITELIST_FILE, journal_file: str = JOURNAL_FILE):
+        self.whitelist_file = whitelist_file
+        self.journal_file = journal_file
+        self.whitelist = self._load_whitelist()
+        self._journal_entries = self._replay_journal()
+        self._load_rules(self.whitelist.items())
+        self._start_writer()
+
+    def _load_whitelist(self) -> Dict:
+        """从文件加载白名单"""
+        if os.path.exists(self.whitelist_file):
+            try:
+                with open(self.whitelist_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"加载白名单失败: {e}，使用默认白名单")
+                return DEFAULT_WHITELIST.copy()
+        else:
+            # 首次运行，保存默认白名单
+            self._save_whitelist(DEFAULT_WHITELIST)
+            return DEFAULT_WHITELIST.copy()
+
+    def _replay_journal(self) -> int:
+        """把日志中尚未合并的条目重放到内存白名单，返回日志条数"""
+        count = 0
+        for host, entry in read_journal(self.journal_file):
+            self.whitelist[host] = entry
+            count += 1
+        return count
+
+    def _save_whitelist(self, whitelist: Dict) -> bool:
+        """
+        保存白名单快照（先写临时文件再原子替换，避免写到一半时崩溃损坏快照）
+
+        Returns:
+            快照是否已替换成功
+        """
+        tmp_file = self.whitelist_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(whitelist, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.whitelist_file)
+            return True
+        except Exception as e:
+            print(f"保存白名单失败: {e}")
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            return False
+
+    def _remember(self, host: str, entry: Dict):
+        # 单次字典赋值是原子的，get_score 无需加锁
+        self.whitelist[host] = entry
+
+    def _persist(self, batch: List[Tuple[str, Dict]]):
+        """追加写日志，日志过长时合并进快照"""
+        if batch:
+            lines = ''.join(
+                json.dumps({'host': host, 'score': entry['score'], 'reason': entry['reason']}, ensure_ascii=False) + '\n'
+                for host, entry in batch
+            )
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
+            self._journal_entries += len(batch)
+
+        if self._journal_entries >= max(COMPACT_MIN_ENTRIES, int(len(self.whitelist) * COMPACT_RATIO)):
+            self._compact()
+
+    def _compact(self):
+        """把日志合并进快照并清空日志（调用方需持有 _io_lock）"""
+        # 此时日志里的条目都已在内存字典中；dict.copy() 在GIL下是原子的
+        snapshot = self.whitelist.copy()
+        if not self._save_whitelist(snapshot):
+            # 快照没有写成功时保留日志（其中的条目只在日志里），下次刷盘时再尝试合并
+            print(f"✗ 白名单日志合并失败，保留日志: {self._journal_entries} 条")
+            return
+        open(self.journal_file, 'w', encoding='utf-8').close()
+        print(f"✓ 白名单日志已合并进快照: {self._journal_entries} 条日志, 快照共 {len(snapshot)} 个host")
+        self._journal_entries = 0
+
+    def _get_exact(self, host: str) -> Optional[Tuple[int, str]]:
+        entry = self.whitelist.get(host)
+        return (entry['score'], entry['reason']) if entry else None
+
     def get_stats(self) -> Dict:
         """获取白名单统计信息"""
         stats = {1: 0, 2: 0, 3: 0, 4: 0}
-        for entry in self.whitelist.values():
+        # 先整体拷贝，避免遍历过程中其他线程新增host导致 "dict changed size during iteration"
+        for entry in self.whitelist.copy().values():
             stats[entry['score']] = stats.get(entry['score'], 0) + 1
         return {
             'total': len(self.whitelist),
-            'distribution': stats
+            'distribution': stats,
+            'rules': self._rules.size
         }
 
 
+class SqliteAuthorityWhitelist(_WriteBehindWhitelist):
+    """
+    基于SQLite的白名单管理器（适合百万~千万级host）
+
+    - host为主键（WITHOUT ROWID聚簇索引），按需查询，不把整表载入内存
+    - 查询前有一个小的进程内LRU缓存，热点host不落到SQLite
+    - WAL模式下多个gunicorn worker可同时读同一个库文件；read_only=True 时以只读方式打开，
+      新增的host只在本进程缓存中可见
+    """
+
+    def __init__(self, db_file: str = WHITELIST_DB, lru_size: int = LRU_SIZE, read_only: bool = False):
+        self.db_file = db_file
+        self.read_only = read_only
+        self._local = threading.local()
+
+        # host -> (score, reason)，未命中的host缓存为None
+        self._lru: 'OrderedDict[str, Optional[Tuple[int, str]]]' = OrderedDict()
+        self._lru_size = lru_size
+        self._lru_lock = threading.Lock()
+        self._lru_hits = 0
+        self._lru_misses = 0
+
+        if not read_only:
+            conn = self._connect()
+            create_schema(conn)
+            if conn.execute('SELECT 1 FROM hosts LIMIT 1').fetchone() is None:
+                # 首次运行，写入默认白名单
+                insert_hosts(conn, DEFAULT_WHITELIST.items())
+        self._load_rules(self._select_rules())
+        self._start_writer()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f'file:{self.db_file}?mode=ro', uri=True, timeout=30)
+            else:
+                conn = sqlite3.connect(self.db_file, timeout=30)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _cache_get(self, host: str):
+        with self._lru_lock:
+            if host in self._lru:
+                self._lru.move_to_end(host)
+                self._lru_hits += 1
+                return True, self._lru[host]
+            self._lru_misses += 1
+            return False, None
+
+    def _cache_put(self, host: str, value: Optional[Tuple[int, str]]):
+        with self._lru_lock:
+            self._lru[host] = value
+            self._lru.move_to_end(host)
+            if len(self._lru) > self._lru_size:
+                self._lru.popitem(last=False)
+
+    def _select_rules(self) -> Iterator[Tuple[str, Dict]]:
+        """用主键范围查询取出规则条目（'*.' 与 '.' 开头），不扫全表"""
+        rows = self._connect().execute(
+            "SELECT host, score, reason FROM hosts"
+            " WHERE (host >= '*.' AND host < '*/') OR (host >= '.' AND host < '/')"
+        ).fetchall()
+        for host, score, reason in rows:
+            yield host, {'score': score, 'reason': reason}
+
+    def _get_exact(self, host: str) -> Optional[Tuple[int, str]]:
+        row = self._connect().execute(
+            'SELECT score, reason FROM hosts WHERE host = ?', (host,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def get_score(self, host: str) -> Tuple[int, str]:
+        """
+        获取host的权威性分数（LRU以归一化host为键，未命中再走主键索引和规则树）
+
+        Returns:
+            (分数, 理由) 如果不在白名单中返回 (None, None)
+        """
+        normalized = normalize_host(host)
+        found, value = self._cache_get(normalized)
+        if not found:
+            value = self._resolve(normalized)
+            self._cache_put(normalized, value)
+        return value if value else (None, None)
+
+    def _remember(self, host: str, entry: Dict):
+        if is_rule_pattern(host):
+            # 新规则可能改变任意已缓存host的结果
+            with self._lru_lock:
+                self._lru.clear()
+        else:
+            self._cache_put(normalize_host(host), (entry['score'], entry['reason']))
+
+    def _persist(self, batch: List[Tuple[str, Dict]]):
+        """在一个事务中批量写入"""
+        if batch and not self.read_only:
+            insert_hosts(self._connect(), batch)
+
+    def get_stats(self) -> Dict:
+        """获取白名单统计信息"""
+        stats = {1: 0, 2: 0, 3: 0, 4: 0}
+        rows = self._connect().execute('SELECT score, COUNT(*) FROM hosts GROUP BY score').fetchall()
+        for score, count in rows:
+            stats[score] = count
+        with self._lru_lock:
+            lru = {'size': len(self._lru), 'hits': self._lru_hits, 'misses': self._lru_misses}
+        return {
+            'total': sum(stats.values()),
+            'distribution': stats,
+            'rules': self._rules.size,
+            'lru': lru
+        }
+
+
+def create_schema(conn: sqlite3.Connection):
+    """创建SQLite白名单表"""
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS hosts ('
+        ' host TEXT PRIMARY KEY,'
+        ' score INTEGER NOT NULL,'
+        ' reason TEXT NOT NULL'
+        ') WITHOUT ROWID'
+    )
+    conn.commit()
+
+
+def insert_hosts(conn: sqlite3.Connection, entries: Iterable[Tuple[str, Dict]]):
+    """在一个事务中批量写入 (host, {'score', 'reason'})"""
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO hosts (host, score, reason) VALUES (?, ?, ?)',
+            ((host, entry['score'], entry['reason']) for host, entry in entries)
+        )
+
+
+def read_journal(journal_file: str) -> Iterator[Tuple[str, Dict]]:
+    """逐行读取追加日志，返回 (host, {'score', 'reason'})"""
+    if not os.path.exists(journal_file):
+        return
+    with open(journal_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程崩溃时最后一行可能只写了一半
+                continue
+            yield record['host'], {'score': record['score'], 'reason': record['reason']}
+
+
 # 全局单例
 _whitelist_instance = None
+_whitelist_lock = threading.Lock()
+
+def get_whitelist():
+    """
+    获取白名单单例
 
-def get_whitelist() -> AuthorityWhitelist:
-    """获取白名单单例"""
+    存储后端由环境变量 AUTHORITY_WHITELIST_BACKEND 决定：json（默认）或 sqlite
+    """
     global _whitelist_instance
     if _whitelist_instance is None:
-        _whitelist_instance = AuthorityWhitelist()
+        with _whitelist_lock:
+            if _whitelist_instance is None:
+                if WHITELIST_BACKEND == 'sqlite':
+                    _whitelist_instance = SqliteAuthorityWhitelist(read_only=WHITELIST_READ_ONLY)
+                else:
+                    _whitelist_instance = AuthorityWhitelist()
     return _whitelist_instance
 
 
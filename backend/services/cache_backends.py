@@ -0,0 +1,216 @@
+"""
+通用缓存后端
+按容量LRU淘汰 + TTL过期，提供内存与SQLite（重启后仍保留）两种实现，接口一致：
+
+    cache.get(key) -> (value, stored_at) 或 None
+    cache.set(key, value)
+    cache.get_stats() -> 命中/未命中等计数
+
+value 需可JSON序列化（SQLite后端以JSON存储）
+以query为键的缓存（搜索、相关性、整个响应）统一用 normalize_query 归一化
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 磁盘缓存目录（backend/.cache）
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '.cache')
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询词：全半角统一、小写、合并空白"""
+    return ' '.join(unicodedata.normalize('NFKC', query).lower().split())
+
+
+class _CacheCounters:
+    """命中/未命中/淘汰/过期计数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class MemoryCache:
+    """进程内LRU缓存"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = _CacheCounters()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._data[key]
+                entry = None
+                self._counters.expirations += 1
+            if entry is not None:
+                self._data.move_to_end(key)
+        with self._counters.lock:
+            if entry is None:
+                self._counters.misses += 1
+            else:
+                self._counters.hits += 1
+        return entry
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            with self._counters.lock:
+                self._counters.evictions += evicted
+
+    def get_stats(self) -> Dict:
+        stats = self._counters.snapshot()
+        stats.update({'backend': 'memory', 'size': len(self._data), 'max_entries': self.max_entries, 'ttl': self.ttl})
+        return stats
+
+
+class SqliteCache:
+    """
+    SQLite磁盘缓存，进程重启后仍然有效
+
+    按最近访问时间近似LRU：条目数超过上限的一定比例后，一次性删掉最久未访问的部分
+    """
+
+    # 超过上限多少比例时触发一次批量淘汰
+    EVICT_SLACK = 0.1
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._counters = _CacheCounters()
+        self._size_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' stored_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)')
+        self._size = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        conn = self._connect()
+        row = conn.execute('SELECT value, stored_at FROM cache WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        entry = None
+        if row is not None:
+            if now - row[1] > self.ttl:
+                with conn:
+                    conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                with self._size_lock:
+                    self._size -= 1
+                with self._counters.lock:
+                    self._counters.expirations += 1
+            else:
+                with conn:
+                    conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+                entry = (json.loads(row[0]), row[1])
+        with self._counters.lock:
+            if entry is None:
+                self._counters.misses += 1
+            else:
+                self._counters.hits += 1
+        return entry
+
+    def set(self, key: str, value: Any):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            cursor = conn.execute('UPDATE cache SET value = ?, stored_at = ?, accessed_at = ? WHERE key = ?',
+                                  (json.dumps(value, ensure_ascii=False), now, now, key))
+            if cursor.rowcount == 0:
+                conn.execute('INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+                             (key, json.dumps(value, ensure_ascii=False), now, now))
+                with self._size_lock:
+                    self._size += 1
+        if self._size > self.max_entries * (1 + self.EVICT_SLACK):
+            self._evict()
+
+    def _evict(self):
+        """删掉最久未访问的条目，使条目数回到上限"""
+        conn = self._connect()
+        with self._size_lock:
+            overflow = self._size - self.max_entries
+            if overflow <= 0:
+                return
+            with conn:
+                conn.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)',
+                    (overflow,)
+                )
+            self._size = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        with self._counters.lock:
+            self._counters.evictions += overflow
+
+    def get_stats(self) -> Dict:
+        stats = self._counters.snapshot()
+        stats.update({'backend': 'sqlite', 'size': self._size, 'max_entries': self.max_entries, 'ttl': self.ttl})
+        return stats
+
+
+def create_cache(backend: str, name: str, max_entries: int, ttl: float):
+    """
+    按名称创建缓存
+
+    Args:
+        backend: 'memory' 或 'sqlite'（磁盘文件为 backend/.cache/<name>.db）
+        name: 缓存名称
+        max_entries: 最大条目数
+        ttl: 过期时间（秒）
+
+    Returns:
+        MemoryCache 或 SqliteCache
+    """
+    if backend == 'sqlite':
+        return SqliteCache(os.path.join(CACHE_DIR, f'{name}.db'), max_entries, ttl)
+    if backend != 'memory':
+        print(f"未知的缓存后端: {backend}，使用内存缓存")
+    return MemoryCache(max_entries, ttl)
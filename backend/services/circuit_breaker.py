@@ -0,0 +1,150 @@
+"""
+熔断器与重试退避
+按最近若干次调用的失败率（超时、异常以及过慢的调用都算失败）决定是否暂时跳过某个上游：
+- closed: 正常放行，失败率超过阈值后转为 open
+- open: 直接拒绝，冷却时间过后转为 half_open
+- half_open: 只放行少量探测请求，探测成功则恢复为 closed，失败则重新 open
+"""
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    带抖动的指数退避（full jitter）：在 [0, min(cap, base * 2^attempt)] 内随机取值，
+    避免大量并发请求在同一时刻一起重试
+
+    Args:
+        attempt: 第几次重试（从0开始）
+        base: 初始退避时间（秒）
+        cap: 退避时间上限（秒）
+
+    Returns:
+        本次重试前等待的秒数
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """线程安全的熔断器，同步与异步调用方共用"""
+
+    def __init__(self,
+                 name: str,
+                 window_size: int = 20,
+                 min_calls: int = 5,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: float = 10.0,
+                 open_seconds: float = 30.0,
+                 half_open_probes: int = 1):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        # 最近的调用结果 (是否失败, 耗时)
+        self._window: Deque[Tuple[bool, float]] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        # 统计
+        self._rejected = 0
+        self._open_count = 0
+
+    def _transition_locked(self, state: str):
+        if state == self._state:
+            return
+        print(f"⚡ 熔断器 {self.name}: {self._state} -> {state}")
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._open_count += 1
+        elif state == CLOSED:
+            self._window.clear()
+        self._probes_in_flight = 0
+
+    def _current_state_locked(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition_locked(HALF_OPEN)
+        return self._state
+
+    def allow(self) -> bool:
+        """是否放行本次调用；half_open 状态下放行即占用一个探测名额"""
+        with self._lock:
+            state = self._current_state_locked()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self):
+        """
+        放行后调用没有得出结果（被取消、因截止时间放弃等）时归还名额，不计入成功或失败；
+        否则 half_open 下的探测名额一直被占用，熔断器再也不会离开 half_open
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record(self, success: bool, latency: float):
+        """
+        记录一次调用结果
+
+        Args:
+            success: 调用是否成功
+            latency: 调用耗时（秒），超过 slow_call_seconds 的成功调用也按失败计
+        """
+        failed = not success or latency > self.slow_call_seconds
+        with self._lock:
+            state = self._current_state_locked()
+            if state == HALF_OPEN:
+                self._transition_locked(OPEN if failed else CLOSED)
+                if not failed:
+                    self._window.append((failed, latency))
+                return
+            if state == OPEN:
+                return
+            self._window.append((failed, latency))
+            if len(self._window) >= self.min_calls and self._failure_rate_locked() >= self.failure_rate_threshold:
+                self._transition_locked(OPEN)
+
+    def _failure_rate_locked(self) -> float:
+        if not self._window:
+            return 0.0
+        return sum(1 for failed, _ in self._window if failed) / len(self._window)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state_locked()
+
+    def get_stats(self) -> Dict:
+        """熔断器状态、最近窗口内的失败率和平均耗时"""
+        with self._lock:
+            state = self._current_state_locked()
+            latencies = [latency for _, latency in self._window]
+            stats = {
+                'state': state,
+                'recent_calls': len(self._window),
+                'failure_rate': round(self._failure_rate_locked(), 3),
+                'avg_latency_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+                'rejected': self._rejected,
+                'open_count': self._open_count
+            }
+            if state == OPEN:
+                stats['retry_in_seconds'] = round(max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0), 1)
+            return stats
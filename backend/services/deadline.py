@@ -0,0 +1,121 @@
+"""
+请求截止时间
+客户端通过 deadline_ms 给出整个请求的时间预算，Deadline 对象显式传给搜索和打分的各个阶段：
+每个阶段最多等到截止时间，届时仍未完成的工作被取消，结果标记为未打分，
+超时的阶段记录在 timed_out_stages 中
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, as_completed
+from typing import Iterable, Iterator, List, Optional, Set
+
+
+# 上游调用失败时剩余时间不足该值（秒），视为失败由截止时间截断的超时导致
+BUDGET_EXHAUSTED_SLACK = 0.05
+
+
+class DeadlineExceeded(Exception):
+    """截止时间已到，不再发起新的上游调用"""
+
+
+class Deadline:
+    """一次请求的截止时间"""
+
+    def __init__(self, budget_ms: int):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        self._lock = threading.Lock()
+        self._timed_out_stages: List[str] = []
+
+    def remaining(self) -> float:
+        """剩余时间（秒），已过期时为0"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        """截止时间已到时抛出 DeadlineExceeded"""
+        if self.expired():
+            raise DeadlineExceeded('已到达请求截止时间')
+
+    def timeout(self, cap: float) -> float:
+        """单次上游调用的超时：不超过原有超时 cap，也不超过剩余时间"""
+        return min(cap, self.remaining())
+
+    def mark_timed_out(self, stage: str):
+        """记录在截止时间前未完成的阶段"""
+        with self._lock:
+            if stage not in self._timed_out_stages:
+                self._timed_out_stages.append(stage)
+
+    @property
+    def timed_out_stages(self) -> List[str]:
+        with self._lock:
+            return list(self._timed_out_stages)
+
+
+def time_left(deadline: Optional[Deadline]) -> Optional[float]:
+    """剩余时间（秒），没有截止时间时返回None（用作 wait/as_completed 的 timeout）"""
+    return deadline.remaining() if deadline else None
+
+
+def budget_exhausted(deadline: Optional[Deadline], timeout: float, cap: float) -> bool:
+    """
+    单次上游调用的失败是否由调用方的时间预算耗尽导致：超时被剩余时间截断（小于原有超时 cap），
+    且失败时预算已基本用完。这类失败不反映上游是否健康，不计入熔断器
+
+    Args:
+        deadline: 截止时间
+        timeout: 本次调用实际使用的超时（秒）
+        cap: 原有超时（秒）
+    """
+    return deadline is not None and timeout < cap and deadline.remaining() <= BUDGET_EXHAUSTED_SLACK
+
+
+def iter_completed(futures: Iterable[Future], deadline: Optional[Deadline], stage: str) -> Iterator[Future]:
+    """
+    as_completed 的截止时间版本：到截止时间后停止产出，并记录超时阶段
+
+    Args:
+        futures: 线程池任务
+        deadline: 截止时间，None表示一直等到全部完成
+        stage: 阶段名称（写入 timed_out_stages）
+    """
+    try:
+        yield from as_completed(futures, timeout=time_left(deadline))
+    except FutureTimeoutError:
+        deadline.mark_timed_out(stage)
+
+
+async def wait_until(tasks: Iterable[asyncio.Future], deadline: Optional[Deadline], stage: str) -> Set[asyncio.Future]:
+    """
+    等待异步任务直到全部完成或到达截止时间，未完成的任务被取消
+
+    Args:
+        tasks: 异步任务
+        deadline: 截止时间，None表示一直等到全部完成
+        stage: 阶段名称（写入 timed_out_stages）
+
+    Returns:
+        已完成的任务集合
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return set()
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=time_left(deadline))
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    if pending:
+        deadline.mark_timed_out(stage)
+        for task in pending:
+            task.cancel()
+    return done
+
+
+def timed_out_stages(deadline: Optional[Deadline]) -> List[str]:
+    return deadline.timed_out_stages if deadline else []
@@ -0,0 +1,185 @@
+"""
+自适应引擎选择
+每次查询打分完成后，按引擎记录它的产出：返回的结果中有多少是其他引擎没有返回的（独有URL），
+有多少达到权威性≥3且相关性=2（优质结果），两者兼有的才是该引擎真正的增量价值。
+adaptive 模式下只调用在延迟预算内、且独有优质结果占比足够高的引擎，并给出每个引擎被选中或跳过的原因
+"""
+import os
+import random
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from result_processor import url_key
+
+ENGINE_MODES = ('all', 'adaptive')
+# 默认引擎模式：all 调用全部（选中的）引擎，adaptive 按产出与耗时选择
+ENGINE_MODE = os.getenv('SEARCH_ENGINE_MODE', 'all')
+# 每个引擎保留最近多少次查询的产出
+ENGINE_STATS_WINDOW = int(os.getenv('ENGINE_STATS_WINDOW', '200'))
+# 样本不足时不做判断，继续调用
+ENGINE_MIN_SAMPLES = int(os.getenv('ENGINE_MIN_SAMPLES', '20'))
+# 独有优质结果占比低于该值的引擎被跳过
+ENGINE_MIN_YIELD = float(os.getenv('ENGINE_MIN_YIELD', '0.05'))
+# 未指定 deadline_ms 时的搜索延迟预算（毫秒）
+ENGINE_LATENCY_BUDGET_MS = float(os.getenv('ENGINE_LATENCY_BUDGET_MS', '5000'))
+# 至少调用的引擎数（含命中缓存的引擎）
+ENGINE_MIN_ENGINES = int(os.getenv('ENGINE_MIN_ENGINES', '2'))
+# 被跳过的引擎仍以该概率调用，保持其统计不过时
+ENGINE_EXPLORE_RATE = float(os.getenv('ENGINE_EXPLORE_RATE', '0.05'))
+
+# 优质结果的标准
+GOOD_AUTHORITY = 3
+GOOD_RELEVANCE = 2
+
+
+class EngineYieldTracker:
+    """单个引擎最近若干次查询的产出（线程安全）"""
+
+    def __init__(self, window_size: int = 200):
+        self._lock = threading.Lock()
+        # 每次查询一条：(返回结果数, 独有结果数, 已打分结果数, 优质结果数, 独有优质结果数)
+        self._window: Deque[Tuple[int, int, int, int, int]] = deque(maxlen=window_size)
+
+    def record(self, results: int, unique: int, scored: int, good: int, unique_good: int):
+        with self._lock:
+            self._window.append((results, unique, scored, good, unique_good))
+
+    def get_stats(self) -> Dict:
+        """
+        Returns:
+            queries: 样本（查询）数
+            unique_share: 独有URL占返回结果的比例
+            good_share: 优质结果占已打分结果的比例
+            unique_good_share: 独有且优质的结果占已打分结果的比例
+        """
+        with self._lock:
+            totals = [sum(column) for column in zip(*self._window)] if self._window else [0] * 5
+            queries = len(self._window)
+        results, unique, scored, good, unique_good = totals
+        return {
+            'queries': queries,
+            'unique_share': round(unique / results, 3) if results else 0.0,
+            'good_share': round(good / scored, 3) if scored else 0.0,
+            'unique_good_share': round(unique_good / scored, 3) if scored else 0.0
+        }
+
+
+_trackers: Dict[str, EngineYieldTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_yield_tracker(engine_name: str) -> EngineYieldTracker:
+    """获取引擎的产出统计（每个引擎一个，进程内共享）"""
+    tracker = _trackers.get(engine_name)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.setdefault(engine_name, EngineYieldTracker(ENGINE_STATS_WINDOW))
+    return tracker
+
+
+def get_engine_yield_stats() -> Dict[str, Dict]:
+    with _trackers_lock:
+        names = list(_trackers)
+    return {name: get_yield_tracker(name).get_stats() for name in names}
+
+
+def is_good(result: Dict) -> bool:
+    return (result.get('authority_score') or 0) >= GOOD_AUTHORITY and result.get('relevance_score') == GOOD_RELEVANCE
+
+
+def is_scored(result: Dict) -> bool:
+    return result.get('relevance_status') != 'unscored' and result.get('authority_status') != 'unscored'
+
+
+def record_engine_yield(raw_results: List[Dict], scored_results: List[Dict], engine_names: Iterable[str]):
+    """
+    按引擎记录一次查询的产出
+
+    Args:
+        raw_results: 去重前的搜索结果（含各引擎各自返回的重复URL）
+        scored_results: 去重并打分后的结果
+        engine_names: 本次调用的引擎（没有返回结果的引擎也记一次0产出）
+    """
+    engines_by_url: Dict[str, set] = {}
+    for r in raw_results:
+        engines_by_url.setdefault(url_key(r), set()).add(r['engine'])
+    scored_by_url = {url_key(r): r for r in scored_results}
+
+    for engine in engine_names:
+        results = unique = scored = good = unique_good = 0
+        seen = set()
+        for r in raw_results:
+            key = url_key(r)
+            if r['engine'] != engine or key in seen:
+                continue
+            seen.add(key)
+            results += 1
+            only_here = engines_by_url[key] == {engine}
+            unique += only_here
+            outcome = scored_by_url.get(key)
+            if outcome is None or not is_scored(outcome):
+                continue
+            scored += 1
+            if is_good(outcome):
+                good += 1
+                unique_good += only_here
+        get_yield_tracker(engine).record(results, unique, scored, good, unique_good)
+
+
+def select_engines(candidates: Dict[str, str], cached: Iterable[str], mode: str, budget_ms: float,
+                   latency_p90: Callable[[str], Optional[float]]) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """
+    决定本次查询实际调用哪些引擎
+
+    Args:
+        candidates: 候选引擎 {引擎名称: 引擎代码}
+        cached: 命中搜索缓存的引擎（不产生调用，总是使用）
+        mode: 'all' 或 'adaptive'
+        budget_ms: 搜索的延迟预算（毫秒）
+        latency_p90: 查询引擎近期p90耗时（秒）的函数，样本不足时返回None
+
+    Returns:
+        (需要调用的引擎 {名称: 代码}, 每个候选引擎的决定 {名称: {selected, reason, p90_ms, 产出统计}})
+    """
+    cached = set(cached)
+    decisions: Dict[str, Dict] = {}
+    skipped: List[str] = []
+
+    for name in candidates:
+        p90 = latency_p90(name)
+        decision = dict(get_yield_tracker(name).get_stats(), p90_ms=round(p90 * 1000, 1) if p90 is not None else None)
+        decisions[name] = decision
+        if name in cached:
+            decision.update(selected=True, reason='命中搜索缓存')
+        elif mode != 'adaptive':
+            decision.update(selected=True, reason='全部引擎模式')
+        elif decision['queries'] < ENGINE_MIN_SAMPLES:
+            decision.update(selected=True, reason=f"样本不足({decision['queries']}/{ENGINE_MIN_SAMPLES})，继续调用")
+        elif p90 is not None and p90 * 1000 > budget_ms:
+            decision.update(selected=False, reason=f"近期p90耗时{p90 * 1000:.0f}ms超过延迟预算{budget_ms:.0f}ms")
+            skipped.append(name)
+        elif decision['unique_good_share'] < ENGINE_MIN_YIELD:
+            decision.update(selected=False,
+                            reason=f"独有优质结果占比{decision['unique_good_share']:.1%}低于{ENGINE_MIN_YIELD:.1%}")
+            skipped.append(name)
+        else:
+            decision.update(selected=True, reason=f"独有优质结果占比{decision['unique_good_share']:.1%}，"
+                                                  f"p90耗时{decision['p90_ms']}ms")
+
+    # 保底：选中的引擎太少时，按独有优质结果占比补回被跳过的引擎（优先在延迟预算内的）
+    shortfall = ENGINE_MIN_ENGINES - sum(1 for d in decisions.values() if d['selected'])
+    if shortfall > 0:
+        skipped.sort(key=lambda name: ((decisions[name]['p90_ms'] or 0) > budget_ms,
+                                       -decisions[name]['unique_good_share']))
+        for name in skipped[:shortfall]:
+            decisions[name].update(selected=True, reason=f"保底至少调用{ENGINE_MIN_ENGINES}个引擎（{decisions[name]['reason']}）")
+        skipped = skipped[shortfall:]
+
+    # 探索：被跳过的引擎偶尔仍然调用，否则它们的统计永远停留在被跳过时
+    for name in skipped:
+        if random.random() < ENGINE_EXPLORE_RATE:
+            decisions[name].update(selected=True, reason=f"随机探索（{decisions[name]['reason']}）")
+
+    to_fetch = {name: code for name, code in candidates.items() if decisions[name]['selected'] and name not in cached}
+    return to_fetch, decisions
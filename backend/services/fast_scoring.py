@@ -0,0 +1,118 @@
+"""
+快速打分模式
+只让模型输出一个标签token：关闭qwen3的思考输出、max_tokens=1，并用该token的logprobs估计置信度。
+打分时不再生成理由，需要理由时通过 /api/explain 按需调用完整打分
+"""
+import math
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+from deadline import Deadline
+from llm_client import chat_completion, async_chat_completion, REQUEST_TIMEOUT
+
+# 是否默认使用快速打分；置信度低于阈值时回退为完整打分（0表示不回退）
+FAST_SCORING = os.getenv('LLM_FAST_SCORING', '0') == '1'
+FAST_MIN_CONFIDENCE = float(os.getenv('LLM_FAST_MIN_CONFIDENCE', '0'))
+FAST_TOP_LOGPROBS = 5
+# 快速打分的理由前缀：白名单和相关性缓存按它识别快速打分写入的条目，完整模式下不复用并由完整打分覆盖
+FAST_REASON_PREFIX = '快速打分'
+
+FAST_OUTPUT_FORMAT = '''## 输出格式
+只输出一个数字标签（{labels}），不要输出理由或任何其他内容。
+'''
+
+
+def fast_system_prompt(system_prompt: str, labels: Sequence[int]) -> str:
+    """打分标准与完整打分一致，只替换输出格式"""
+    return system_prompt[:system_prompt.index('## 输出格式')] + FAST_OUTPUT_FORMAT.format(
+        labels='、'.join(str(label) for label in labels)
+    )
+
+
+def fast_request_kwargs(timeout: float = REQUEST_TIMEOUT) -> Dict:
+    """单token输出的请求参数"""
+    return {
+        'stream': False,
+        'max_tokens': 1,
+        'temperature': 0,
+        'logprobs': True,
+        'top_logprobs': FAST_TOP_LOGPROBS,
+        'timeout': timeout,
+        # qwen3 关闭思考输出，否则单个token会被思考内容占用
+        'extra_body': {'chat_template_kwargs': {'enable_thinking': False}}
+    }
+
+
+def parse_fast_label(completion, labels: Sequence[int]) -> Tuple[int, Optional[float]]:
+    """
+    解析单token标签，并由top_logprobs计算置信度
+
+    置信度为该标签在所有合法标签候选中的归一化概率；接口未返回logprobs时为None
+
+    Raises:
+        ValueError: 输出不是合法标签
+    """
+    choice = completion.choices[0]
+    text = (choice.message.content or '').strip()
+    if not text[:1].isdigit() or int(text[:1]) not in labels:
+        raise ValueError(f"无效的标签值: {text!r}")
+    label = int(text[:1])
+
+    logprobs = getattr(choice, 'logprobs', None)
+    if not logprobs or not logprobs.content:
+        return label, None
+    first = logprobs.content[0]
+    probs = {label: math.exp(first.logprob)}
+    for candidate in first.top_logprobs or []:
+        token = candidate.token.strip()
+        if token.isdigit() and int(token) in labels:
+            probs[int(token)] = max(probs.get(int(token), 0.0), math.exp(candidate.logprob))
+    return label, probs[label] / sum(probs.values())
+
+
+def fast_reason(confidence: Optional[float]) -> str:
+    """快速打分没有理由，用置信度代替"""
+    return FAST_REASON_PREFIX if confidence is None else f'{FAST_REASON_PREFIX}（置信度{confidence:.2f}）'
+
+
+def is_fast_reason(reason) -> bool:
+    """是否为快速打分写入的占位理由"""
+    return isinstance(reason, str) and reason.startswith(FAST_REASON_PREFIX)
+
+
+def reusable(reason, fast: bool) -> bool:
+    """已保存的打分能否复用：快速模式下都能复用，完整模式下只复用带真实理由的条目"""
+    return fast or not is_fast_reason(reason)
+
+
+def accept_fast_label(label: int, confidence: Optional[float]) -> Optional[Tuple[int, str]]:
+    """置信度足够时返回 (标签, 理由)，否则返回None由调用方回退为完整打分"""
+    if confidence is not None and confidence < FAST_MIN_CONFIDENCE:
+        return None
+    return label, fast_reason(confidence)
+
+
+def fast_label(messages, labels: Sequence[int], timeout: float = REQUEST_TIMEOUT,
+               deadline: Optional[Deadline] = None) -> Optional[Tuple[int, str]]:
+    """
+    快速打分一次（deadline 用于在调度器排队时放弃）
+
+    Returns:
+        (标签, 理由)；调用失败或置信度不足时返回None
+    """
+    try:
+        completion = chat_completion(messages, deadline=deadline, **fast_request_kwargs(timeout))
+        return accept_fast_label(*parse_fast_label(completion, labels))
+    except Exception as e:
+        print(f"快速打分失败，回退为完整打分: {str(e)}")
+        return None
+
+
+async def fast_label_async(messages, labels: Sequence[int], timeout: float = REQUEST_TIMEOUT) -> Optional[Tuple[int, str]]:
+    """fast_label 的异步版本"""
+    try:
+        completion = await async_chat_completion(messages, **fast_request_kwargs(timeout))
+        return accept_fast_label(*parse_fast_label(completion, labels))
+    except Exception as e:
+        print(f"快速打分失败，回退为完整打分: {str(e)}")
+        return None
@@ -0,0 +1,87 @@
+"""
+对冲请求（hedged requests）
+某个上游在其最近的p90耗时内还没有返回时，再发一个相同的请求，取先返回的结果，用来削掉长尾。
+- LatencyTracker: 每个上游最近若干次成功调用的耗时，算出对冲阈值
+- HedgeBudget: 全局对冲预算，对冲请求数不超过普通请求数的一定比例，避免把负载翻倍
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class LatencyTracker:
+    """滑动窗口内的耗时分布（线程安全）"""
+
+    def __init__(self, window_size: int = 500, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window_size)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """窗口内的耗时分位数（秒），样本不足 min_samples 时返回None"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(pct * len(samples)))]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {'samples': 0}
+        pick = lambda pct: round(samples[min(len(samples) - 1, int(pct * len(samples)))] * 1000, 1)
+        return {'samples': len(samples), 'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99)}
+
+
+class HedgeBudget:
+    """
+    对冲预算：每个普通请求积累 ratio 个额度，每次对冲消耗1个，额度上限为 burst。
+    长期来看对冲请求数不超过普通请求数的 ratio 倍
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._credits = 0.0
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._denied = 0
+
+    def on_request(self):
+        """登记一次普通请求"""
+        with self._lock:
+            self._requests += 1
+            self._credits = min(self.burst, self._credits + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """申请一次对冲，预算不足时返回False"""
+        with self._lock:
+            if self._credits >= 1:
+                self._credits -= 1
+                self._hedged += 1
+                return True
+            self._denied += 1
+            return False
+
+    def on_hedge_win(self):
+        """对冲请求先于原请求返回"""
+        with self._lock:
+            self._hedge_wins += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'ratio': self.ratio,
+                'requests': self._requests,
+                'hedged': self._hedged,
+                'hedge_wins': self._hedge_wins,
+                'denied': self._denied,
+                'credits': round(self._credits, 2)
+            }
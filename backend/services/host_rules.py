@@ -0,0 +1,107 @@
+"""
+host规则匹配
+host归一化，以及按域名层级（反转标签）组织的后缀/通配规则树，
+让 *.gov.cn、*.edu.cn 之类的一条规则覆盖所有子域名
+"""
+from typing import Dict, List, Optional, Tuple
+
+# 归一化时去掉的子域前缀（移动站、www站与主站视为同一站点）
+STRIP_PREFIXES = ('www.', 'm.')
+
+
+def normalize_host(host: str) -> str:
+    """
+    归一化host：小写，去掉userinfo、端口、末尾的点，以及 www./m. 前缀
+
+    Args:
+        host: 原始host（URL的netloc）
+
+    Returns:
+        归一化后的host，如 'User@WWW.PKU.edu.cn:443' -> 'pku.edu.cn'
+    """
+    host = (host or '').strip().lower()
+    host = host.rpartition('@')[2]
+    if host.startswith('['):
+        # IPv6地址，只去掉端口
+        return host.split(']')[0] + ']'
+    host = host.split(':')[0].rstrip('.')
+    for prefix in STRIP_PREFIXES:
+        # 去掉前缀后至少保留一个点，避免把 www.cn 变成 cn
+        if host.startswith(prefix) and '.' in host[len(prefix):]:
+            return host[len(prefix):]
+    return host
+
+
+def host_variants(normalized: str) -> List[str]:
+    """归一化host在白名单中可能的精确写法（白名单历史上按原始netloc存储）"""
+    return [normalized] + [prefix + normalized for prefix in STRIP_PREFIXES]
+
+
+def is_rule_pattern(host: str) -> bool:
+    """是否为规则写法：'*.gov.cn'（仅子域名）或 '.gov.cn'（自身及子域名）"""
+    return host.startswith('*.') or host.startswith('.')
+
+
+class _Node:
+    __slots__ = ('children', 'subdomains', 'apex')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        # 匹配该域名的所有子域名
+        self.subdomains: Optional[Tuple[int, str]] = None
+        # 匹配该域名本身
+        self.apex: Optional[Tuple[int, str]] = None
+
+
+class HostRuleTrie:
+    """
+    按反转标签存储的域名规则树
+
+    'news.pku.edu.cn' 依次走 cn -> edu -> pku -> news，沿途记录最深的命中规则，
+    因此 *.pku.edu.cn 优先于 *.edu.cn（最具体的规则生效）
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self.size = 0
+
+    def add(self, pattern: str, score: int, reason: str):
+        """
+        添加规则
+
+        Args:
+            pattern: '*.gov.cn' 或 '.gov.cn'
+            score: 权威性分数
+            reason: 理由
+        """
+        include_apex = not pattern.startswith('*.')
+        domain = pattern[2:] if pattern.startswith('*.') else pattern.lstrip('.')
+        node = self._root
+        for label in reversed(domain.lower().split('.')):
+            node = node.children.setdefault(label, _Node())
+        if node.subdomains is None:
+            self.size += 1
+        node.subdomains = (score, reason)
+        if include_apex:
+            node.apex = (score, reason)
+
+    def match(self, host: str) -> Optional[Tuple[int, str]]:
+        """
+        查找归一化host命中的最具体规则
+
+        Returns:
+            (分数, 理由)，未命中返回 None
+        """
+        labels = host.split('.')
+        node = self._root
+        best = None
+        for depth, label in enumerate(reversed(labels), start=1):
+            node = node.children.get(label)
+            if node is None:
+                break
+            if depth == len(labels):
+                if node.apex is not None:
+                    best = node.apex
+            elif node.subdomains is not None:
+                best = node.subdomains
+        return best
@@ -0,0 +1,128 @@
+"""
+词面预筛
+在调用LLM打相关性之前，用字符n-gram + BM25快速估计query与title+content的词面匹配程度，
+与query几乎没有共同词面的结果直接判为无关(0)，只有不确定的结果才交给LLM。
+中文按连续汉字的二元组切分，英文/数字按整词切分，不依赖分词器
+"""
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# 是否开启预筛，以及判为无关的归一化分数阈值（0~1，越大过滤越多）
+PREFILTER_ENABLED = os.getenv('LEXICAL_PREFILTER', '1') == '1'
+PREFILTER_THRESHOLD = float(os.getenv('LEXICAL_PREFILTER_THRESHOLD', '0.05'))
+# 一批不足该条数时不预筛：IDF按本批文档计算，文档太少时区分不出常见词和稀有词
+PREFILTER_MIN_BATCH = int(os.getenv('LEXICAL_PREFILTER_MIN_BATCH', '5'))
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CJK_RUN = r'[㐀-䶿一-鿿豈-﫿]+'
+_TOKEN_PATTERN = re.compile(f'({_CJK_RUN})|([a-z0-9]+)')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分为词面单元：连续汉字取字符二元组（单字保留单字），英文和数字取整词
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        词面单元列表
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    tokens = []
+    for cjk, word in _TOKEN_PATTERN.findall(text):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def bm25_scores(query: str, documents: Sequence[str]) -> np.ndarray:
+    """
+    计算每篇文档对query的归一化BM25分数
+
+    IDF按本批文档计算；分数除以该query理论上限（本批出现过的每个词面都在文档中大量出现），
+    因此落在 [0, 1) 区间，可跨query使用同一个阈值。本批没有任何文档包含的词面不计入上限：
+    它们的IDF最大，计入后会把所有文档（包括完全匹配其余词面的）都压到阈值以下
+
+    Args:
+        query: 搜索查询
+        documents: 文档文本列表
+
+    Returns:
+        形如 (len(documents),) 的分数数组；query切不出词面时全部为1，没有文档包含任何词面时全部为0
+    """
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    if not query_terms or not documents:
+        return np.ones(len(documents))
+
+    term_index = {term: j for j, term in enumerate(query_terms)}
+    tf = np.zeros((len(documents), len(query_terms)))
+    doc_lengths = np.zeros(len(documents))
+    for i, document in enumerate(documents):
+        tokens = tokenize(document)
+        doc_lengths[i] = len(tokens)
+        for term, count in Counter(t for t in tokens if t in term_index).items():
+            tf[i, term_index[term]] = count
+
+    n_docs = len(documents)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avg_length = max(doc_lengths.mean(), 1.0)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / avg_length)
+    scores = (idf * tf * (BM25_K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+    upper = (idf * (BM25_K1 + 1))[df > 0].sum()
+    return scores / upper if upper > 0 else scores
+
+
+def prefilter(results: List[Dict], query: str, threshold: float = PREFILTER_THRESHOLD) -> Tuple[List[int], np.ndarray]:
+    """
+    找出词面明显不匹配、可以直接判为无关的结果
+
+    Args:
+        results: 搜索结果列表，每个包含 {title, content}
+        query: 搜索查询
+        threshold: 归一化BM25分数低于该值的判为无关
+
+    Returns:
+        (判为无关的结果下标列表, 每条结果的归一化分数)；不足 PREFILTER_MIN_BATCH 条时不判任何结果
+    """
+    documents = [f"{r.get('title', '')} {r.get('content', '')}" for r in results]
+    scores = bm25_scores(query, documents)
+    if len(results) < PREFILTER_MIN_BATCH:
+        return [], scores
+    rejected = [i for i, score in enumerate(scores) if score < threshold]
+    return rejected, scores
+
+
+def calibrate_threshold(scores: Sequence[float], labels: Sequence[int], max_miss_rate: float = 0.01) -> float:
+    """
+    根据已有LLM标注校准阈值：在相关结果(标签1/2)被误判为无关的比例不超过 max_miss_rate 的前提下，
+    取能过滤最多结果的阈值
+
+    Args:
+        scores: 归一化BM25分数
+        labels: 对应的LLM相关性标签
+        max_miss_rate: 允许误过滤的相关结果比例
+
+    Returns:
+        阈值
+    """
+    scores = np.asarray(scores, dtype=float)
+    relevant = np.sort(scores[np.asarray(labels) > 0])
+    if len(relevant) == 0:
+        return 0.0
+    allowed = int(np.floor(len(relevant) * max_miss_rate))
+    # 阈值取第 allowed 个相关结果的分数：严格小于它的相关结果至多 allowed 个
+    return float(relevant[allowed])
@@ -0,0 +1,277 @@
+"""
+LLM客户端
+相关性打分与权威性打分共用的长连接客户端，提供可调的HTTP连接池和使用统计
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from async_runtime import LoopLocal
+from deadline import Deadline
+from llm_scheduler import get_llm_scheduler
+from request_context import current_request
+
+# API配置
+API_KEY = "MAAS680934ffb1a349259ed7beae4272175b"
+BASE_URL = "http://redservingapi.devops.xiaohongshu.com/v1"
+MODEL = "qwen3-30b-a3b"
+
+# 连接池配置（可通过环境变量调整）
+POOL_MAX_CONNECTIONS = int(os.getenv('LLM_POOL_MAX_CONNECTIONS', '256'))
+POOL_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_POOL_MAX_KEEPALIVE_CONNECTIONS', '128'))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv('LLM_POOL_KEEPALIVE_EXPIRY', '60'))
+REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '60'))
+# 异步客户端：单个事件循环上允许的最大在途调用数（同时也是连接池上限）
+ASYNC_MAX_CONCURRENCY = int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', '2048'))
+
+
+class _CallStats:
+    """线程安全的调用统计：在途数、峰值、总次数、失败数、累计耗时和token用量"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._total_calls = 0
+        self._failed_calls = 0
+        self._total_latency = 0.0
+        self._prompt_tokens = 0
+        self._completion_tokens = 0
+
+    def start(self) -> float:
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        return time.perf_counter()
+
+    def finish(self, start: float, failed: bool):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._in_flight -= 1
+            self._total_calls += 1
+            self._total_latency += elapsed
+            if failed:
+                self._failed_calls += 1
+
+    def record_usage(self, completion):
+        """
+        记录一次调用的token用量（接口返回的 usage），同时累加到当前请求上
+
+        Args:
+            completion: ChatCompletion 对象，没有 usage 时忽略
+        """
+        usage = getattr(completion, 'usage', None)
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        with self._lock:
+            self._prompt_tokens += prompt_tokens
+            self._completion_tokens += completion_tokens
+        request = current_request()
+        if request is not None:
+            request.add_counts(llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'peak_in_flight': self._peak_in_flight,
+                'total_calls': self._total_calls,
+                'failed_calls': self._failed_calls,
+                'avg_latency_ms': round(self._total_latency / self._total_calls * 1000, 1) if self._total_calls else 0.0,
+                'prompt_tokens': self._prompt_tokens,
+                'completion_tokens': self._completion_tokens,
+            }
+
+
+class LLMClient:
+    """
+    线程安全的长连接LLM客户端
+
+    所有打分线程共用同一个OpenAI客户端及其底层httpx连接池，
+    避免每次调用都重新创建客户端和TCP/TLS连接。
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: str,
+                 max_connections: int = 256,
+                 max_keepalive_connections: int = 128,
+                 keepalive_expiry: float = 60.0,
+                 timeout: float = 60.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+
+        self._http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=timeout
+        )
+        self._client = OpenAI(api_key=api_key, base_url=base_url, http_client=self._http_client)
+
+        # 使用统计
+        self._stats = _CallStats()
+
+    def chat(self, messages, model: str = MODEL, deadline: Optional[Deadline] = None, **kwargs):
+        """
+        调用chat completions接口
+
+        Args:
+            messages: 对话消息列表
+            model: 模型名称
+            deadline: 请求截止时间，到期仍在调度器中排队时抛出 DeadlineExceeded
+            **kwargs: 透传给 chat.completions.create 的参数
+
+        Returns:
+            ChatCompletion 对象
+        """
+        # 先在全局调度器排队拿到执行名额（并发上限、限速、按请求轮转）
+        with get_llm_scheduler().slot(deadline):
+            start = self._stats.start()
+            failed = False
+            try:
+                completion = self._client.chat.completions.create(model=model, messages=messages, **kwargs)
+                self._stats.record_usage(completion)
+                return completion
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._stats.finish(start, failed)
+
+    def _pool_connections(self) -> Optional[Dict]:
+        """读取底层连接池中的连接数（依赖httpcore内部结构，取不到时返回None）"""
+        try:
+            connections = list(self._http_client._transport._pool.connections)
+        except AttributeError:
+            return None
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {'open': len(connections), 'idle': idle, 'active': len(connections) - idle}
+
+    def get_stats(self) -> Dict:
+        """获取连接池与调用统计信息"""
+        stats = self._stats.snapshot()
+        in_flight = stats['in_flight']
+
+        stats['pool'] = {
+            'max_connections': self.max_connections,
+            'max_keepalive_connections': self.max_keepalive_connections,
+            'keepalive_expiry': self.keepalive_expiry,
+            'utilization': round(in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+            'connections': self._pool_connections()
+        }
+        return stats
+
+    def close(self):
+        """关闭底层连接池"""
+        self._http_client.close()
+
+
+# 全局单例
+_client_instance = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """获取LLM客户端单例"""
+    global _client_instance
+    if _client_instance is None:
+        with _client_lock:
+            if _client_instance is None:
+                _client_instance = LLMClient(
+                    api_key=API_KEY,
+                    base_url=BASE_URL,
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                    timeout=REQUEST_TIMEOUT
+                )
+    return _client_instance
+
+
+def chat_completion(messages, **kwargs):
+    """使用共享客户端调用LLM"""
+    return get_llm_client().chat(messages, **kwargs)
+
+
+class AsyncLLMClient:
+    """
+    异步LLM客户端（每个事件循环一份）
+
+    在一个事件循环上承载大量并发调用，用信号量限制在途调用数，
+    不再为每个调用占用一个操作系统线程。
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: str,
+                 max_concurrency: int = 2048,
+                 keepalive_expiry: float = 60.0,
+                 timeout: float = 60.0,
+                 stats: _CallStats = None):
+        self.max_concurrency = max_concurrency
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=timeout
+        )
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http_client)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._stats = stats or _CallStats()
+
+    async def chat(self, messages, model: str = MODEL, **kwargs):
+        """异步调用chat completions接口"""
+        async with get_llm_scheduler().slot_async(), self._semaphore:
+            start = self._stats.start()
+            failed = False
+            try:
+                completion = await self._client.chat.completions.create(model=model, messages=messages, **kwargs)
+                self._stats.record_usage(completion)
+                return completion
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._stats.finish(start, failed)
+
+
+# 所有事件循环上的异步客户端共用一份统计
+_async_stats = _CallStats()
+_async_clients = LoopLocal(lambda: AsyncLLMClient(
+    api_key=API_KEY,
+    base_url=BASE_URL,
+    max_concurrency=ASYNC_MAX_CONCURRENCY,
+    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    timeout=REQUEST_TIMEOUT,
+    stats=_async_stats
+))
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """获取当前事件循环的异步LLM客户端"""
+    return _async_clients.get()
+
+
+async def async_chat_completion(messages, **kwargs):
+    """使用当前事件循环的共享异步客户端调用LLM"""
+    return await get_async_llm_client().chat(messages, **kwargs)
+
+
+def get_async_llm_stats() -> Dict:
+    """获取异步客户端的调用统计"""
+    stats = _async_stats.snapshot()
+    stats['max_concurrency'] = ASYNC_MAX_CONCURRENCY
+    return stats
@@ -0,0 +1,226 @@
+"""
+LLM调用调度器
+进程内所有LLM调用（同步线程与异步协程）都先在这里排队拿到执行名额：
+- 并发上限：同时在途的调用数不超过 max_concurrency
+- 令牌桶限速：每秒最多发起 rate_per_second 次调用，允许 burst 次突发
+- 按请求轮转：每个查询请求一个等待队列，名额在请求之间轮流分配，
+  60条结果的查询不会把只有6条结果的查询饿死
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Hashable, Optional
+
+from deadline import Deadline, DeadlineExceeded, time_left
+from request_context import current_request
+
+# qwen3-30b 上游的调度配置
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '64'))
+LLM_RATE_LIMIT = float(os.getenv('LLM_RATE_LIMIT', '0'))           # 每秒调用数，0表示不限速
+LLM_RATE_BURST = int(os.getenv('LLM_RATE_BURST', str(LLM_MAX_CONCURRENCY)))
+
+# 等待时间分位数统计的样本窗口
+WAIT_SAMPLE_SIZE = 2000
+
+
+class _Ticket:
+    """一次排队中的调用，同步调用方用Event等待，异步调用方用事件循环上的Future等待"""
+
+    __slots__ = ('request_key', 'enqueued_at', 'granted', 'event', 'loop', 'future')
+
+    def __init__(self, request_key: Hashable, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.request_key = request_key
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class LLMScheduler:
+    """并发上限 + 令牌桶 + 按请求轮转的调度器"""
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_second: float = 0.0, burst: int = 1):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = max(burst, 1)
+
+        self._lock = threading.Lock()
+        # 请求 -> 该请求的等待队列；_order 为轮转顺序
+        self._queues: Dict[Hashable, Deque[_Ticket]] = OrderedDict()
+        self._order: Deque[Hashable] = deque()
+        self._running = 0
+        self._waiting = 0
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._timer: Optional[threading.Timer] = None
+
+        # 指标
+        self._granted_total = 0
+        self._peak_waiting = 0
+        self._wait_total = 0.0
+        self._wait_samples: Deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+    def _refill_locked(self):
+        if self.rate_per_second <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def _dispatch_locked(self):
+        """在名额和令牌允许的范围内，按请求轮转把名额分给排队的调用"""
+        self._refill_locked()
+        while self._order and self._running < self.max_concurrency:
+            if self.rate_per_second > 0 and self._tokens < 1:
+                self._schedule_timer_locked((1 - self._tokens) / self.rate_per_second)
+                return
+            request_key = self._order.popleft()
+            queue = self._queues[request_key]
+            ticket = queue.popleft()
+            if queue:
+                self._order.append(request_key)
+            else:
+                del self._queues[request_key]
+
+            if self.rate_per_second > 0:
+                self._tokens -= 1
+            self._running += 1
+            self._waiting -= 1
+            wait = time.perf_counter() - ticket.enqueued_at
+            self._granted_total += 1
+            self._wait_total += wait
+            self._wait_samples.append(wait)
+            ticket.grant()
+
+    def _schedule_timer_locked(self, delay: float):
+        """令牌不足时，等下一个令牌生成后再分配"""
+        if self._timer is not None:
+            return
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch_locked()
+
+    def _enqueue(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Ticket:
+        ctx = current_request()
+        request_key = ctx.request_id if ctx else None
+        ticket = _Ticket(request_key, loop)
+        with self._lock:
+            queue = self._queues.get(request_key)
+            if queue is None:
+                queue = self._queues[request_key] = deque()
+                self._order.append(request_key)
+            queue.append(ticket)
+            self._waiting += 1
+            self._peak_waiting = max(self._peak_waiting, self._waiting)
+            self._dispatch_locked()
+        return ticket
+
+    def _cancel(self, ticket: _Ticket):
+        """调用方在拿到名额前放弃（异步任务被取消、同步等待到达截止时间）：从队列移除；已拿到名额则归还"""
+        with self._lock:
+            if ticket.granted:
+                self._release_locked()
+                return
+            queue = self._queues.get(ticket.request_key)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._waiting -= 1
+                if not queue:
+                    del self._queues[ticket.request_key]
+                    self._order.remove(ticket.request_key)
+
+    def _release_locked(self):
+        self._running -= 1
+        self._dispatch_locked()
+
+    def release(self):
+        with self._lock:
+            self._release_locked()
+
+    @contextmanager
+    def slot(self, deadline: Optional[Deadline] = None):
+        """
+        同步调用：阻塞直到拿到执行名额
+
+        Args:
+            deadline: 请求截止时间，到期仍未拿到名额时放弃排队
+
+        Raises:
+            DeadlineExceeded: 等待名额期间到达截止时间
+        """
+        ticket = self._enqueue()
+        if not ticket.event.wait(time_left(deadline)):
+            # 超时与分配同时发生时 _cancel 会归还刚拿到的名额
+            self._cancel(ticket)
+            raise DeadlineExceeded('等待LLM执行名额时已到达请求截止时间')
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """异步调用：等待名额期间不占用线程"""
+        ticket = self._enqueue(asyncio.get_running_loop())
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict:
+        """调度指标：并发、排队深度与等待时间分位数"""
+        with self._lock:
+            samples = sorted(self._wait_samples)
+            stats = {
+                'max_concurrency': self.max_concurrency,
+                'rate_per_second': self.rate_per_second,
+                'running': self._running,
+                'queue_depth': self._waiting,
+                'waiting_requests': len(self._queues),
+                'peak_queue_depth': self._peak_waiting,
+                'granted_total': self._granted_total,
+                'avg_wait_ms': round(self._wait_total / self._granted_total * 1000, 1) if self._granted_total else 0.0
+            }
+        for name, pct in (('p50_wait_ms', 0.5), ('p99_wait_ms', 0.99)):
+            stats[name] = round(samples[min(len(samples) - 1, int(pct * len(samples)))] * 1000, 1) if samples else 0.0
+        return stats
+
+
+_llm_scheduler = None
+_llm_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """获取LLM上游的调度器单例"""
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        with _llm_scheduler_lock:
+            if _llm_scheduler is None:
+                _llm_scheduler = LLMScheduler('llm', LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT, LLM_RATE_BURST)
+    return _llm_scheduler
@@ -0,0 +1,790 @@
+"""
+查询处理流水线
+串联搜索、host提取、URL去重、打分和结果组装，供普通接口和流式接口共用
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Generator, Iterator, List, Optional, Tuple
+
+from websearch_service import (get_search_results, get_search_results_async, resolve_engines,
+                               call_single_engine, build_search_stats, get_breaker_stats,
+                               get_hedge_stats, get_search_cache_stats)
+from relevance_scorer import (score_relevance_batch, score_relevance_batch_async, get_relevance_cache_stats,
+                              explain_relevance)
+from authority_scorer import (score_authority, score_authority_batch, score_authority_batch_async,
+                              get_authority_flight_stats, explain_authority, apply_host_scores)
+from host_rules import normalize_host
+from result_processor import (add_host_to_results, format_final_results, deduplicate_by_url_keep_longest,
+                              canonicalize_results, url_key, record_url_merges,
+                              mark_unscored, score_or_lowest)
+from llm_client import get_llm_client, get_async_llm_stats
+from cache_backends import create_cache, normalize_query
+from singleflight import SingleFlight
+from llm_scheduler import get_llm_scheduler
+from request_context import RequestContext, current_request, request_scope, run_in_request, submit_in_context
+from token_budget import CONTENT_TOKEN_BUDGET
+from engine_selector import record_engine_yield, get_engine_yield_stats, ENGINE_MODE
+from deadline import Deadline, timed_out_stages
+
+# 整个查询响应的缓存配置：后端 memory/sqlite/off，容量与过期时间（秒）
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+
+# 批量查询：同时进行搜索的query数（每个query再并发调用各引擎）；同时进行相关性打分的query数
+BATCH_SEARCH_CONCURRENCY = int(os.getenv('BATCH_SEARCH_CONCURRENCY', '16'))
+BATCH_SCORING_CONCURRENCY = int(os.getenv('BATCH_SCORING_CONCURRENCY', '32'))
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+# 相同 (query, 引擎) 的并发请求只跑一次流水线
+_query_flights = SingleFlight()
+
+
+class EmptySearchResultsError(Exception):
+    """所有搜索引擎都没有返回结果"""
+
+
+def score_results(results: List[Dict], query: str, deadline: Optional[Deadline] = None) -> List[Dict]:
+    """
+    并行进行权威性与相关性打分，并合并两类分数
+
+    Args:
+        results: 已提取host并去重的搜索结果
+        query: 搜索查询
+        deadline: 请求截止时间
+
+    Returns:
+        同时包含权威性和相关性分数的结果列表（顺序与输入一致）
+    """
+    if not results:
+        return []
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        authority_future = submit_in_context(executor, score_authority_batch, results, deadline=deadline)
+        relevance_future = submit_in_context(executor, score_relevance_batch, results, query, deadline=deadline)
+        authority_scored = authority_future.result()
+        relevance_scored = relevance_future.result()
+
+    return merge_scores(authority_scored, relevance_scored)
+
+
+def merge_scores(authority_scored: List[Dict], relevance_scored: List[Dict]) -> List[Dict]:
+    """按位置合并权威性打分结果与相关性打分结果"""
+    if len(authority_scored) != len(relevance_scored):
+        raise ValueError("权威性和相关性结果数量不一致")
+
+    combined_results = []
+    for auth_result, rel_result in zip(authority_scored, relevance_scored):
+        combined = auth_result.copy()
+        combined['relevance_score'] = rel_result.get('relevance_score', -1)
+        combined['relevance_reason'] = rel_result.get('relevance_reason', '')
+        combined['relevance_source'] = rel_result.get('relevance_source', '')
+        combined['relevance_status'] = rel_result.get('relevance_status', 'scored')
+        combined_results.append(combined)
+
+    return combined_results
+
+
+def iter_lazy_relevance(authority_scored: List[Dict], top_k: int) -> Generator[List[int], List[Dict], List[Dict]]:
+    """
+    惰性相关性打分的调度：按权威性从高到低分档，只给能进入前top_k的结果打相关性
+
+    每一档内先打 "还缺的名额数" 条；若该档已有足够多的满分(2)结果，则前top_k已经确定，
+    否则继续打该档剩余结果。一档全部打完仍不够top_k时进入下一档。同步与异步流水线共用本调度
+
+    Args:
+        authority_scored: 已打权威性分的结果
+        top_k: 需要确定最终顺序的结果数
+
+    Yields:
+        下一批需要打相关性的结果下标；调用方 send 回这批结果的相关性打分结果（顺序一致）
+
+    Returns:
+        合并后的结果列表，未打分的结果标记为 unscored
+    """
+    combined = [r.copy() for r in authority_scored]
+    tiers = {}
+    for index, r in enumerate(combined):
+        tiers.setdefault(score_or_lowest(r.get('authority_score')), []).append(index)
+
+    remaining = top_k
+    scored = set()
+    for authority in sorted(tiers, reverse=True):
+        if remaining <= 0:
+            break
+        tier = tiers[authority]
+        position = 0
+        top_count = 0
+        while position < len(tier) and top_count < remaining:
+            chunk = tier[position:position + remaining - top_count]
+            position += len(chunk)
+            relevance_scored = yield chunk
+            for index, rel_result in zip(chunk, relevance_scored):
+                combined[index]['relevance_score'] = rel_result.get('relevance_score', -1)
+                combined[index]['relevance_reason'] = rel_result.get('relevance_reason', '')
+                combined[index]['relevance_source'] = rel_result.get('relevance_source', '')
+                combined[index]['relevance_status'] = rel_result.get('relevance_status', 'scored')
+                if combined[index]['relevance_status'] != 'unscored':
+                    scored.add(index)
+                if rel_result.get('relevance_score') == 2:
+                    top_count += 1
+        remaining -= len(tier) if top_count < remaining else remaining
+
+    for index, r in enumerate(combined):
+        # 到截止时间未打分的结果已带有超时标记
+        if index not in scored and r.get('relevance_status') != 'unscored':
+            mark_unscored(r)
+    print(f"  惰性打分: 共 {len(combined)} 条，打相关性 {len(scored)} 条，跳过 {len(combined) - len(scored)} 条")
+    return combined
+
+
+def score_results_lazy(results: List[Dict], query: str, top_k: int, deadline: Optional[Deadline] = None) -> List[Dict]:
+    """
+    惰性模式：先打权威性，再按权威性从高到低只给前top_k所需的结果打相关性
+
+    Args:
+        results: 已提取host并去重的搜索结果
+        query: 搜索查询
+        top_k: 需要确定最终顺序的结果数
+        deadline: 请求截止时间（到期后剩余的批次直接标记为未打分，不再调用LLM）
+
+    Returns:
+        合并后的结果列表（未打分的结果 relevance_score 为 None）
+    """
+    authority_scored = score_authority_batch(results, deadline=deadline)
+    planner = iter_lazy_relevance(authority_scored, top_k)
+    try:
+        chunk = next(planner)
+        while True:
+            chunk = planner.send(score_relevance_batch([authority_scored[i] for i in chunk], query, deadline=deadline))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def score_results_lazy_async(results: List[Dict], query: str, top_k: int,
+                                   deadline: Optional[Deadline] = None) -> List[Dict]:
+    """score_results_lazy 的异步版本"""
+    authority_scored = await score_authority_batch_async(results, deadline=deadline)
+    planner = iter_lazy_relevance(authority_scored, top_k)
+    try:
+        chunk = next(planner)
+        while True:
+            chunk = planner.send(await score_relevance_batch_async([authority_scored[i] for i in chunk], query,
+                                                                   deadline=deadline))
+    except StopIteration as stop:
+        return stop.value
+
+
+def sort_results(results: List[Dict]) -> List[Dict]:
+    """按权威性降序、相关性降序排序（未打分的结果排在同档最后）"""
+    return sorted(
+        results,
+        key=lambda x: (
+            -score_or_lowest(x.get('authority_score', -1)),  # 权威性降序（4->3->2->1）
+            -score_or_lowest(x.get('relevance_score', -1))   # 相关性降序（2->1->0）
+        )
+    )
+
+
+def build_token_usage(request: Optional[RequestContext]) -> Dict:
+    """本次请求的LLM token用量与content裁剪情况（用于对照耗时和打分质量调整token预算）"""
+    counts = request.counts() if request else {}
+    return {
+        'llm_calls': counts.get('llm_calls', 0),
+        'prompt_tokens': counts.get('prompt_tokens', 0),
+        'completion_tokens': counts.get('completion_tokens', 0),
+        'content_token_budget': CONTENT_TOKEN_BUDGET,
+        'trimmed_contents': counts.get('trimmed_contents', 0),
+        'content_tokens_before_trim': counts.get('content_tokens_before_trim', 0),
+        'content_tokens_after_trim': counts.get('content_tokens_after_trim', 0)
+    }
+
+
+def build_query_response(query: str, combined_results: List[Dict], search_stats: Dict,
+                         deadline: Optional[Deadline] = None) -> Dict:
+    """
+    组装 /api/query 的返回体
+
+    Args:
+        query: 搜索查询
+        combined_results: 打分完成的全部结果
+        search_stats: 搜索阶段的统计信息
+        deadline: 请求截止时间（用于记录超时的阶段）
+
+    Returns:
+        与 /api/query 一致的响应字典
+    """
+    final_results = format_final_results(sort_results(combined_results))
+
+    # 统计信息（包含所有打分结果）
+    stats = {
+        'search_engines': search_stats['engines'],
+        'search_circuit_breakers': search_stats.get('circuit_breakers', {}),
+        'engine_selection': search_stats.get('engine_selection', {}),
+        'relevance_distribution': {},
+        'authority_distribution': {},
+        'relevance_sources': {},
+        'unscored': 0,
+        'authority_unscored': 0,
+        'timed_out_stages': timed_out_stages(deadline)
+    }
+
+    for r in combined_results:
+        # 未打分（惰性模式跳过或超时）的维度不计入对应分布
+        if r.get('authority_status') == 'unscored':
+            stats['authority_unscored'] += 1
+        else:
+            auth_score = r.get('authority_score', -1)
+            stats['authority_distribution'][auth_score] = stats['authority_distribution'].get(auth_score, 0) + 1
+        if r.get('relevance_status') == 'unscored':
+            stats['unscored'] += 1
+            continue
+        rel_score = r.get('relevance_score', -1)
+        rel_source = r.get('relevance_source', '')
+        stats['relevance_distribution'][rel_score] = stats['relevance_distribution'].get(rel_score, 0) + 1
+        stats['relevance_sources'][rel_source] = stats['relevance_sources'].get(rel_source, 0) + 1
+
+    # 相关性缓存、词面预筛、近似重复聚类与URL规范化省下的LLM调用（按逐条打分计）
+    request = current_request()
+    stats['llm_calls_saved'] = {
+        'relevance_cache': stats['relevance_sources'].get('cache', 0),
+        'lexical_prefilter': stats['relevance_sources'].get('prefilter', 0),
+        'near_duplicate': stats['relevance_sources'].get('near_duplicate', 0),
+        'url_canonicalization': request.counts().get('url_variants_merged', 0) if request else 0
+    }
+    stats['token_usage'] = build_token_usage(request)
+    counts = request.counts() if request else {}
+    stats['search_cache'] = {'hits': counts.get('search_cache_hits', 0), 'stale': counts.get('search_cache_stale', 0)}
+
+    # 按引擎分组原始结果
+    raw_results_by_engine = {}
+    for r in combined_results:
+        engine = r.get('engine', 'unknown')
+        if engine not in raw_results_by_engine:
+            raw_results_by_engine[engine] = []
+        raw_results_by_engine[engine].append({
+            'url': r['url'],
+            'title': r['title'],
+            'content': r['content'],
+            'host': r['host'],
+            'relevance_score': r.get('relevance_score', -1),
+            'relevance_reason': r.get('relevance_reason', ''),
+            'relevance_source': r.get('relevance_source', ''),
+            'relevance_status': r.get('relevance_status', 'scored'),
+            'authority_score': r.get('authority_score', -1),
+            'authority_reason': r.get('authority_reason', ''),
+            'authority_status': r.get('authority_status', 'scored')
+        })
+
+    return {
+        'success': True,
+        'query': query,
+        'total_raw_results': len(combined_results),
+        'total_filtered_results': len(final_results),
+        'results': final_results,
+        'raw_results_by_engine': raw_results_by_engine,
+        'stats': stats
+    }
+
+
+def get_response_cache():
+    """获取响应缓存单例（RESPONSE_CACHE_BACKEND=off 时返回None）"""
+    global _response_cache
+    if RESPONSE_CACHE_BACKEND == 'off':
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = create_cache(RESPONSE_CACHE_BACKEND, 'responses',
+                                               RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+    return _response_cache
+
+
+def response_cache_key(query: str, selected_engines: List[str] = None, top_k: Optional[int] = None,
+                       engine_mode: Optional[str] = None) -> str:
+    """响应缓存键：归一化query + 排序后的实际引擎列表（未选引擎与全选等价）+ 惰性模式的top_k + 引擎模式"""
+    engines = sorted(resolve_engines(selected_engines))
+    return json.dumps([normalize_query(query), engines, top_k, engine_mode or ENGINE_MODE], ensure_ascii=False)
+
+
+def selected_engine_names(search_stats: Dict) -> List[str]:
+    """本次实际使用（调用或命中缓存）的引擎"""
+    return [name for name, decision in search_stats.get('engine_selection', {}).get('engines', {}).items()
+            if decision['selected']]
+
+
+def get_cached_response(key: str):
+    """查响应缓存，命中时返回带缓存信息的响应，否则返回None"""
+    cache = get_response_cache()
+    cached = cache.get(key) if cache else None
+    if cached is None:
+        return None
+    response, stored_at = cached
+    print(f"✓ 响应缓存命中，缓存时长 {time.time() - stored_at:.1f}s")
+    return with_cache_info(response, True, time.time() - stored_at)
+
+
+def flight_key(key: str, deadline_ms: Optional[int]) -> str:
+    """请求合并的键：只有截止时间相同的请求才合并，短预算的请求不会等待长预算请求的结果"""
+    return key if deadline_ms is None else f'{key}|deadline={deadline_ms}'
+
+
+def store_response(key: str, response: Dict):
+    cache = get_response_cache()
+    # 因截止时间而不完整的响应不缓存
+    if cache and not response['stats'].get('timed_out_stages'):
+        cache.set(key, response)
+
+
+def with_cache_info(response: Dict, hit: bool, age_seconds: float = 0.0, coalesced: bool = False) -> Dict:
+    """
+    在响应上附加缓存信息（不修改缓存中的对象）
+
+    Args:
+        response: 查询响应
+        hit: 是否命中响应缓存
+        age_seconds: 缓存时长（秒）
+        coalesced: 是否与其他并发的相同请求合并执行
+    """
+    return dict(response, cache={'hit': hit, 'age_seconds': round(age_seconds, 1), 'coalesced': coalesced})
+
+
+def run_cached_query_pipeline(query: str, selected_engines: List[str] = None, top_k: Optional[int] = None,
+                              deadline_ms: Optional[int] = None, engine_mode: Optional[str] = None) -> Dict:
+    """
+    带响应缓存与请求合并的 run_query_pipeline
+
+    Args:
+        query: 搜索查询
+        selected_engines: 选中的搜索引擎列表
+        top_k: 惰性模式下需要确定顺序的结果数，None表示全部打分
+        deadline_ms: 整个请求的时间预算（毫秒），None表示不限
+        engine_mode: 'all' 或 'adaptive'，None时使用 SEARCH_ENGINE_MODE
+
+    Returns:
+        /api/query 的响应字典，附带 cache 字段 {hit, age_seconds, coalesced}
+    """
+    deadline = Deadline(deadline_ms) if deadline_ms else None
+    key = response_cache_key(query, selected_engines, top_k, engine_mode)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+
+    def run():
+        # 本次请求内的LLM调用在调度器中归为同一队列，与其他并发请求轮流获得执行名额
+        with request_scope(query):
+            response = run_query_pipeline(query, selected_engines, top_k, deadline, engine_mode)
+        # 先写缓存再结束合并，之后到达的请求直接命中缓存
+        store_response(key, response)
+        return response
+
+    response, coalesced = _query_flights.do(flight_key(key, deadline_ms), run)
+    if coalesced:
+        print(f"✓ 合并到进行中的相同查询: {query}")
+    return with_cache_info(response, False, coalesced=coalesced)
+
+
+async def run_cached_query_pipeline_async(query: str, selected_engines: List[str] = None,
+                                          top_k: Optional[int] = None, deadline_ms: Optional[int] = None,
+                                          engine_mode: Optional[str] = None) -> Dict:
+    """run_cached_query_pipeline 的异步版本（与同步请求共用缓存和合并登记表）"""
+    deadline = Deadline(deadline_ms) if deadline_ms else None
+    key = response_cache_key(query, selected_engines, top_k, engine_mode)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+
+    async def run():
+        with request_scope(query):
+            response = await run_query_pipeline_async(query, selected_engines, top_k, deadline, engine_mode)
+        store_response(key, response)
+        return response
+
+    response, coalesced = await _query_flights.do_async(flight_key(key, deadline_ms), run)
+    if coalesced:
+        print(f"✓ 合并到进行中的相同查询: {query}")
+    return with_cache_info(response, False, coalesced=coalesced)
+
+
+def run_query_pipeline(query: str, selected_engines: List[str] = None, top_k: Optional[int] = None,
+                       deadline: Optional[Deadline] = None, engine_mode: Optional[str] = None) -> Dict:
+    """
+    完整执行一次查询：等待所有引擎返回后统一打分
+
+    Args:
+        query: 搜索查询
+        selected_engines: 选中的搜索引擎列表
+        top_k: 惰性模式下需要确定顺序的结果数，None表示全部打分
+        deadline: 请求截止时间，届时仍未完成的搜索和打分被放弃，结果标记为未打分
+        engine_mode: 'all' 或 'adaptive'
+
+    Returns:
+        /api/query 的响应字典
+    """
+    # 1. 调用搜索引擎获取结果（支持引擎筛选与自适应选择）
+    print("\n[步骤 1/6] 搜索引擎查询...")
+    search_results, search_stats = get_search_results(query, selected_engines, deadline, engine_mode)
+
+    if not search_results:
+        raise EmptySearchResultsError('未获取到搜索结果')
+
+    # 2. URL规范化并提取host
+    print("\n[步骤 2/6] URL规范化并提取host...")
+    raw_results = add_host_to_results(canonicalize_results(search_results))
+
+    # 3. 早期URL去重（保留content最长的）
+    print("\n[步骤 3/6] URL去重(保留content最长)...")
+    search_results = deduplicate_by_url_keep_longest(raw_results)
+
+    # 4. 并行进行权威性与相关性打分（惰性模式下先打权威性，再按需打相关性）
+    if top_k:
+        print(f"\n[步骤 4/6] 权威性打分后按需打相关性(top_k={top_k})...")
+        combined_results = score_results_lazy(search_results, query, top_k, deadline)
+    else:
+        print("\n[步骤 4/6] 权威性与相关性打分(并行)...")
+        combined_results = score_results(search_results, query, deadline)
+    record_engine_yield(raw_results, combined_results, selected_engine_names(search_stats))
+
+    # 5. 排序、格式化并统计
+    print("\n[步骤 5/6] 排序结果...")
+    print("\n[步骤 6/6] 格式化输出...")
+    response = build_query_response(query, combined_results, search_stats, deadline)
+
+    print(f"\n{'='*60}")
+    print(f"处理完成!")
+    print(f"  原始结果数: {response['total_raw_results']}")
+    print(f"  排序后数量: {response['total_filtered_results']}")
+    print(f"  排序规则: 权威性(4→3→2→1) -> 相关性(2→1→0)")
+    usage = response['stats']['token_usage']
+    print(f"  LLM token: prompt {usage['prompt_tokens']} / completion {usage['completion_tokens']}"
+          f"（{usage['llm_calls']} 次调用，裁剪content {usage['trimmed_contents']} 条）")
+    print(f"{'='*60}\n")
+
+    return response
+
+
+async def run_query_pipeline_async(query: str, selected_engines: List[str] = None,
+                                   top_k: Optional[int] = None, deadline: Optional[Deadline] = None,
+                                   engine_mode: Optional[str] = None) -> Dict:
+    """
+    run_query_pipeline 的异步版本：搜索与两类打分的全部上游调用都在同一个事件循环上并发，
+    不再为每个调用创建线程，返回的JSON与 run_query_pipeline 一致
+
+    Args:
+        query: 搜索查询
+        selected_engines: 选中的搜索引擎列表
+        top_k: 惰性模式下需要确定顺序的结果数，None表示全部打分
+        deadline: 请求截止时间，届时仍未完成的上游调用被取消
+        engine_mode: 'all' 或 'adaptive'
+
+    Returns:
+        /api/query 的响应字典
+    """
+    print("\n[异步 1/4] 搜索引擎查询...")
+    search_results, search_stats = await get_search_results_async(query, selected_engines, deadline, engine_mode)
+
+    if not search_results:
+        raise EmptySearchResultsError('未获取到搜索结果')
+
+    print("\n[异步 2/4] 提取host并URL去重...")
+    raw_results = add_host_to_results(canonicalize_results(search_results))
+    search_results = deduplicate_by_url_keep_longest(raw_results)
+
+    if top_k:
+        print(f"\n[异步 3/4] 权威性打分后按需打相关性(top_k={top_k})...")
+        combined_results = await score_results_lazy_async(search_results, query, top_k, deadline)
+    else:
+        print("\n[异步 3/4] 权威性与相关性打分(并发)...")
+        authority_scored, relevance_scored = await asyncio.gather(
+            score_authority_batch_async(search_results, deadline),
+            score_relevance_batch_async(search_results, query, deadline)
+        )
+        combined_results = merge_scores(authority_scored, relevance_scored)
+    record_engine_yield(raw_results, combined_results, selected_engine_names(search_stats))
+
+    print("\n[异步 4/4] 排序并格式化输出...")
+    response = build_query_response(query, combined_results, search_stats, deadline)
+    print(f"\n异步查询完成! 排序后数量: {response['total_filtered_results']}")
+    return response
+
+
+def stream_query_pipeline(query: str, selected_engines: List[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    流式执行查询：每个引擎返回后立即对该批结果去重、提取host并打分
+
+    Args:
+        query: 搜索查询
+        selected_engines: 选中的搜索引擎列表
+
+    Yields:
+        (事件名, 数据) 元组，事件依次为：
+        - search: 某个引擎返回 {engine, count}
+        - results: 某个引擎的结果打分完成 {engine, results}
+        - done: 全部完成，数据与 /api/query 的响应一致
+
+    命中响应缓存时直接产出 done 事件；流式请求不参与请求合并，完成后写入响应缓存
+    """
+    # 流式接口总是调用全部（选中的）引擎
+    key = response_cache_key(query, selected_engines, engine_mode='all')
+    cached = get_cached_response(key)
+    if cached is not None:
+        yield 'done', cached
+        return
+
+    engines_to_use = resolve_engines(selected_engines)
+    print(f"\n开始流式搜索: '{query}'，共 {len(engines_to_use)} 个搜索引擎")
+
+    # 生成器在调用方的上下文里逐步执行，打分任务显式带上本次请求的上下文
+    request = RequestContext(query)
+    # 规范化URL -> 首次出现的原始URL
+    seen_urls: Dict[str, str] = {}
+    all_raw_results = []
+    all_scored_results = []
+
+    # 搜索与打分共用一个线程池：引擎返回后立刻提交打分任务，不等待其他引擎
+    executor = ThreadPoolExecutor(max_workers=max(len(engines_to_use), 1) * 2)
+    try:
+        search_futures = {
+            executor.submit(run_in_request, request, call_single_engine, query, name, code): name
+            for name, code in engines_to_use.items()
+        }
+        score_futures = {}
+        pending = set(search_futures)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in search_futures:
+                    engine_name = search_futures[future]
+                    try:
+                        batch = future.result()
+                    except Exception as e:
+                        print(f"✗ {engine_name} 执行失败: {str(e)}")
+                        batch = []
+
+                    all_raw_results.extend(batch)
+                    yield 'search', {'engine': engine_name, 'count': len(batch)}
+
+                    # 批内保留content最长的，跨批次只保留首次出现的（规范化）URL
+                    batch = run_in_request(request, deduplicate_by_url_keep_longest,
+                                           add_host_to_results(canonicalize_results(batch)))
+                    repeated = [r for r in batch if url_key(r) in seen_urls]
+                    run_in_request(request, record_url_merges,
+                                   sum(1 for r in repeated if seen_urls[url_key(r)] != r['url']))
+                    batch = [r for r in batch if url_key(r) not in seen_urls]
+                    seen_urls.update((url_key(r), r['url']) for r in batch)
+                    if not batch:
+                        continue
+
+                    score_future = executor.submit(run_in_request, request, score_results, batch, query)
+                    score_futures[score_future] = engine_name
+                    pending.add(score_future)
+                else:
+                    engine_name = score_futures[future]
+                    scored = future.result()
+                    all_scored_results.extend(scored)
+                    yield 'results', {
+                        'engine': engine_name,
+                        'results': format_final_results(sort_results(scored))
+                    }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not all_raw_results:
+        raise EmptySearchResultsError('未获取到搜索结果')
+
+    record_engine_yield(all_raw_results, all_scored_results, engines_to_use)
+    response = run_in_request(request, build_query_response, query, all_scored_results,
+                              build_search_stats(all_raw_results, engines_to_use))
+    store_response(key, response)
+    print(f"\n流式查询完成! 排序后数量: {response['total_filtered_results']}")
+    yield 'done', with_cache_info(response, False)
+
+
+def run_batch_query_pipeline(queries: List[str], selected_engines: List[str] = None,
+                             engine_mode: Optional[str] = None) -> Iterator[Dict]:
+    """
+    批量执行查询，每个query完成后立即产出其响应（/api/query/batch 逐行输出NDJSON）
+
+    1. 归一化后相同的query只执行一次，命中响应缓存的直接产出
+    2. 各query的搜索在 BATCH_SEARCH_CONCURRENCY 的并发上限内进行，某个query搜索完成后立即开始它的相关性打分
+    3. 权威性打分按归一化host在整批内共享：每个host只提交一次，之后遇到同一host的query等待同一个结果
+    4. 某个query的相关性打分和它涉及的host都完成后立即产出，不等待其他query
+
+    Args:
+        queries: 查询列表
+        selected_engines: 选中的搜索引擎列表
+        engine_mode: 'all' 或 'adaptive'
+
+    Yields:
+        {'type': 'result', 'index': 下标, ...与 /api/query 一致的响应}
+        {'type': 'error', 'index': 下标, 'query': 查询, 'error': 原因}
+        最后一条 {'type': 'summary', ...整批统计}
+    """
+    started_at = time.time()
+    keys = [response_cache_key(query, selected_engines, None, engine_mode) for query in queries]
+    # 缓存键 -> 该键对应的所有下标（第一个下标实际执行）
+    indices_by_key: Dict[str, List[int]] = {}
+    summary = {'type': 'summary', 'queries': len(queries), 'unique_queries': 0, 'cache_hits': 0,
+               'succeeded': 0, 'failed': 0, 'hosts_per_query_total': 0, 'unique_hosts': 0}
+
+    def result_lines(key: str, response: Dict):
+        for index in indices_by_key[key]:
+            summary['succeeded'] += 1
+            yield dict(response, type='result', index=index)
+
+    def error_lines(key: str, error: str):
+        for index in indices_by_key[key]:
+            summary['failed'] += 1
+            yield {'type': 'error', 'index': index, 'query': queries[index], 'error': error}
+
+    to_run = []
+    cached_responses = {}
+    for index, key in enumerate(keys):
+        if key in indices_by_key:
+            indices_by_key[key].append(index)
+            continue
+        indices_by_key[key] = [index]
+        cached = get_cached_response(key)
+        if cached is not None:
+            cached_responses[key] = cached
+        else:
+            to_run.append(key)
+    summary['unique_queries'] = len(indices_by_key)
+    summary['cache_hits'] = len(cached_responses)
+    for key, cached in cached_responses.items():
+        yield from result_lines(key, cached)
+
+    requests = {key: RequestContext(queries[indices_by_key[key][0]]) for key in to_run}
+    searched: Dict[str, Tuple[List[Dict], Dict]] = {}
+    # 整批共享的权威性打分：归一化host -> Future[(分数, 理由)]，只在主线程中读写
+    host_futures: Dict[str, Future] = {}
+    authority_request = RequestContext('batch:authority')
+    search_executor = ThreadPoolExecutor(max_workers=BATCH_SEARCH_CONCURRENCY)
+    scoring_executor = ThreadPoolExecutor(max_workers=BATCH_SCORING_CONCURRENCY)
+    # 权威性任务不等待其他任务，与等待它们的相关性任务分开，避免线程池互相占满
+    authority_executor = ThreadPoolExecutor(max_workers=BATCH_SCORING_CONCURRENCY)
+
+    def score_query(results: List[Dict], hosts: Dict[str, Future]) -> List[Dict]:
+        """相关性打分，再等待本query涉及的host打完权威性分后合并"""
+        relevance_scored = score_relevance_batch(results, current_request().label)
+        host_scores = {}
+        for host, future in hosts.items():
+            try:
+                score, reason = future.result()
+                host_scores[host] = {'score': score, 'reason': reason}
+            except Exception as e:
+                print(f"  处理host {host} 失败: {str(e)}")
+                host_scores[host] = {'score': -1, 'reason': "打分失败"}
+        return merge_scores(apply_host_scores(results, host_scores), relevance_scored)
+
+    try:
+        # future -> ('search' 或 'score', 缓存键)
+        pending = {
+            search_executor.submit(run_in_request, requests[key], get_search_results,
+                                   requests[key].label, selected_engines, None, engine_mode): ('search', key)
+            for key in to_run
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = pending.pop(future)
+                request = requests[key]
+
+                if stage == 'search':
+                    # 搜索完成：提交尚未出现过的host，并开始该query的打分
+                    try:
+                        search_results, search_stats = future.result()
+                    except Exception as e:
+                        yield from error_lines(key, str(e))
+                        continue
+                    if not search_results:
+                        yield from error_lines(key, '未获取到搜索结果')
+                        continue
+                    raw_results = add_host_to_results(canonicalize_results(search_results))
+                    results = run_in_request(request, deduplicate_by_url_keep_longest, raw_results)
+                    searched[key] = (raw_results, search_stats)
+                    hosts = {}
+                    for host in set(normalize_host(r['host']) for r in results):
+                        if host not in host_futures:
+                            host_futures[host] = authority_executor.submit(run_in_request, authority_request,
+                                                                           score_authority, host)
+                        hosts[host] = host_futures[host]
+                    summary['hosts_per_query_total'] += len(hosts)
+                    pending[scoring_executor.submit(run_in_request, request, score_query, results, hosts)] = ('score', key)
+                    continue
+
+                # 打分完成：立即产出
+                raw_results, search_stats = searched[key]
+                try:
+                    combined_results = future.result()
+                    record_engine_yield(raw_results, combined_results, selected_engine_names(search_stats))
+                    response = run_in_request(request, build_query_response, request.label, combined_results, search_stats)
+                except Exception as e:
+                    yield from error_lines(key, str(e))
+                    continue
+                store_response(key, response)
+                yield from result_lines(key, with_cache_info(response, False))
+    finally:
+        search_executor.shutdown(wait=False, cancel_futures=True)
+        scoring_executor.shutdown(wait=False, cancel_futures=True)
+        authority_executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.time() - started_at
+    summary['unique_hosts'] = len(host_futures)
+    summary['authority_lookups_saved'] = summary['hosts_per_query_total'] - summary['unique_hosts']
+    summary['elapsed_seconds'] = round(elapsed, 2)
+    summary['queries_per_minute'] = round(len(queries) / elapsed * 60, 1) if elapsed > 0 else 0.0
+    print(f"\n批量查询完成: {summary['succeeded']} 成功 / {summary['failed']} 失败，"
+          f"{summary['hosts_per_query_total']} 次host评估整批去重后 {summary['unique_hosts']} 个host，"
+          f"耗时 {elapsed:.1f}s（{summary['queries_per_minute']} query/分钟）")
+    yield summary
+
+
+def explain_score(kind: str, data: Dict) -> Dict:
+    """
+    按需生成打分理由（快速打分模式下结果不带理由）：以完整模式重新打分
+
+    Args:
+        kind: relevance 或 authority
+        data: relevance 需要 query/title/content（给出url时结果写回相关性缓存），authority 需要 host
+
+    Raises:
+        ValueError: kind 不支持或缺少必需字段
+    """
+    if kind == 'relevance':
+        query = (data.get('query') or '').strip()
+        if not query:
+            raise ValueError('query不能为空')
+        score, reason = explain_relevance(query, data.get('title') or '', data.get('content') or '',
+                                          data.get('url') or None)
+    elif kind == 'authority':
+        host = (data.get('host') or '').strip()
+        if not host:
+            raise ValueError('host不能为空')
+        score, reason = explain_authority(host)
+    else:
+        raise ValueError('type必须是relevance或authority')
+    return {'type': kind, 'score': score, 'reason': reason}
+
+
+def get_service_stats() -> Dict:
+    """汇总各服务组件的运行统计（供 /api/stats 使用）"""
+    return {
+        'llm_client': get_llm_client().get_stats(),
+        'async_llm_client': get_async_llm_stats(),
+        'llm_scheduler': get_llm_scheduler().get_stats(),
+        'search_circuit_breakers': get_breaker_stats(),
+        'search_hedging': get_hedge_stats(),
+        'search_cache': get_search_cache_stats(),
+        'engine_yield': get_engine_yield_stats(),
+        'relevance_cache': get_relevance_cache_stats(),
+        'response_cache': get_response_cache().get_stats() if get_response_cache() else {'backend': 'off'},
+        'query_singleflight': _query_flights.get_stats(),
+        'authority_singleflight': get_authority_flight_stats()
+    }
@@ -2,34 +2,88 @@
 相关性打分服务
 评估URL内容与查询的相关性: 0(无关), 1(弱相关), 2(高相关)
 """
-from openai import OpenAI
 import json
+import os
 import re
 import ast
 import time
+import asyncio
+import hashlib
+import threading
 import traceback
-from typing import Dict, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# API配置
-API_KEY = "MAAS680934ffb1a349259ed7beae4272175b"
-BASE_URL = "http://redservingapi.devops.xiaohongshu.com/v1"
-MODEL = "qwen3-30b-a3b"
-
-
-def get_response(messages):
-    """调用LLM获取响应"""
-    client = OpenAI(
-        api_key=API_KEY,
-        base_url=BASE_URL
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import chat_completion, async_chat_completion, REQUEST_TIMEOUT
+from cache_backends import create_cache, normalize_query
+from lexical_prefilter import prefilter, PREFILTER_ENABLED, PREFILTER_THRESHOLD
+from request_context import submit_in_context
+from deadline import Deadline, DeadlineExceeded, iter_completed, wait_until
+from result_processor import (mark_unscored, TIMEOUT_REASON, near_duplicate_groups, NEAR_DUP_ENABLED,
+                              canonicalize_results)
+from fast_scoring import FAST_SCORING, fast_system_prompt, fast_label, fast_label_async, reusable
+from token_budget import trim_content
+
+# 相关性缓存配置：后端 memory/sqlite/off，容量与过期时间（秒）
+RELEVANCE_CACHE_BACKEND = os.getenv('RELEVANCE_CACHE_BACKEND', 'memory')
+RELEVANCE_CACHE_SIZE = int(os.getenv('RELEVANCE_CACHE_SIZE', '100000'))
+RELEVANCE_CACHE_TTL = float(os.getenv('RELEVANCE_CACHE_TTL', str(24 * 3600)))
+
+# 批量打分：每次LLM调用携带的候选条数（1 表示逐条打分）
+RELEVANCE_BATCH_SIZE = int(os.getenv('RELEVANCE_BATCH_SIZE', '1'))
+
+_relevance_cache = None
+_relevance_cache_lock = threading.Lock()
+
+
+def get_relevance_cache():
+    """获取相关性缓存单例（RELEVANCE_CACHE_BACKEND=off 时返回None）"""
+    global _relevance_cache
+    if RELEVANCE_CACHE_BACKEND == 'off':
+        return None
+    if _relevance_cache is None:
+        with _relevance_cache_lock:
+            if _relevance_cache is None:
+                _relevance_cache = create_cache(RELEVANCE_CACHE_BACKEND, 'relevance',
+                                                RELEVANCE_CACHE_SIZE, RELEVANCE_CACHE_TTL)
+    return _relevance_cache
+
+
+def get_relevance_cache_stats() -> Dict:
+    """相关性缓存的命中统计"""
+    cache = get_relevance_cache()
+    return cache.get_stats() if cache else {'backend': 'off'}
+
+
+def relevance_cache_key(query: str, result: Dict) -> str:
+    """缓存键：归一化query + 规范化URL + title/content的哈希（页面内容变化后自动失效）"""
+    digest = hashlib.sha1(f"{result['title']}\x00{result['content']}".encode('utf-8')).hexdigest()
+    return json.dumps([normalize_query(query), result.get('canonical_url') or result['url'], digest], ensure_ascii=False)
+
+
+def get_response(messages, max_tokens: int = 1024, timeout: float = REQUEST_TIMEOUT,
+                 deadline: Optional[Deadline] = None):
+    """调用LLM获取响应（复用共享的长连接客户端；到达 deadline 时不再在调度器中排队）"""
+    completion = chat_completion(
+        messages,
+        deadline=deadline,
+        stream=False,
+        max_tokens=max_tokens,
+        temperature=0.1,
+        timeout=timeout
     )
+    reasoning_content = completion.choices[0].message.reasoning_content if hasattr(completion.choices[0].message, 'reasoning_content') else None
+    content = completion.choices[0].message.content
+    return reasoning_content, content
 
-    completion = client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
+
+async def get_response_async(messages, max_tokens: int = 1024, timeout: float = REQUEST_TIMEOUT):
+    """异步调用LLM获取响应"""
+    completion = await async_chat_completion(
+        messages,
         stream=False,
-        max_tokens=1024,
-        temperature=0.1
+        max_tokens=max_tokens,
+        temperature=0.1,
+        timeout=timeout
     )
     reasoning_content = completion.choices[0].message.reasoning_content if hasattr(completion.choices[0].message, 'reasoning_content') else None
     content = completion.choices[0].message.content
@@ -62,6 +116,40 @@ def parse_json_block(txt: str) -> dict:
             return {}
 
 
+def parse_json_array(txt: str) -> list:
+    """从文本中提取JSON数组（批量打分的输出）"""
+    json_start = txt.find('```json')
+    if json_start != -1:
+        json_start += 7
+        json_end = txt.find('```', json_start)
+        json_str = txt[json_start:json_end].strip() if json_end != -1 else ""
+    else:
+        json_str = ""
+        start = txt.find('[')
+        if start != -1:
+            depth = 0
+            for i in range(start, len(txt)):
+                if txt[i] == '[':
+                    depth += 1
+                elif txt[i] == ']':
+                    depth -= 1
+                    if depth == 0:
+                        json_str = txt[start:i+1]
+                        break
+
+    if not json_str:
+        return []
+
+    try:
+        parsed = json.loads(json_str)
+    except json.JSONDecodeError:
+        try:
+            parsed = ast.literal_eval(json_str)
+        except Exception:
+            return []
+    return parsed if isinstance(parsed, list) else []
+
+
 def extract_json_from_text(text: str) -> str:
     """从文本中提取完整的JSON字符串"""
     start = text.find('{')
@@ -142,8 +230,43 @@ Query为: {query}
 对应Url的Title为:{title},对应Url的Content为:{content}
 '''
 
+# 快速打分：打分标准与单条一致，只输出一个标签token
+RELEVANCE_LABELS = (0, 1, 2)
+FAST_SYSTEM_PROMPT = fast_system_prompt(SYSTEM_PROMPT, RELEVANCE_LABELS)
+
+# 批量打分：打分标准与单条一致，只替换输出格式
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT[:SYSTEM_PROMPT.index('## 输出格式')] + '''## 输出格式
+输入包含多条候选网页，以[编号]区分。请对每一条独立打分，按编号顺序输出一个JSON数组，条数必须与候选数一致：
+```json
+[
+  {"编号": 1, "标签": 0、1、2, "判断依据": "简要说明理由，不超过15个字"},
+  {"编号": 2, "标签": 0、1、2, "判断依据": "简要说明理由，不超过15个字"}
+]
+```
+'''
+
+BATCH_USER_PROMPT_TEMPLATE = '''现在，请你分别判断下面每条候选网页与Query的相关性。
+Query为: {query}
+
+{candidates}
+'''
 
-def score_relevance(query: str, title: str, content: str, max_retries: int = 3) -> Tuple[int, str]:
+BATCH_CANDIDATE_TEMPLATE = '''[{number}] Title:{title}
+Content:{content}
+'''
+
+
+def build_messages(system_prompt: str, query: str, title: str, content: str) -> List[Dict]:
+    """构造单条打分请求（content按token预算裁剪）"""
+    content = trim_content(query, content)
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': USER_PROMPT_TEMPLATE.format(query=query, title=title, content=content)}
+    ]
+
+
+def score_relevance(query: str, title: str, content: str, max_retries: int = 3,
+                    deadline: Optional[Deadline] = None, fast: bool = FAST_SCORING) -> Tuple[int, str]:
     """
     评估单个URL的相关性
 
@@ -152,18 +275,31 @@ def score_relevance(query: str, title: str, content: str, max_retries: int = 3)
         title: 网页标题
         content: 网页内容
         max_retries: 最大重试次数
+        deadline: 请求截止时间，到期后不再发起新的尝试（抛出 DeadlineExceeded）
+        fast: 快速模式，只输出标签不生成理由；失败或置信度不足时回退为完整打分
 
     Returns:
         (相关性分数 0/1/2, 判断依据)
     """
-    messages = [
-        {'role': 'system', 'content': SYSTEM_PROMPT},
-        {'role': 'user', 'content': USER_PROMPT_TEMPLATE.format(query=query, title=title, content=content)}
-    ]
+    if fast:
+        if deadline:
+            deadline.check()
+        result = fast_label(build_messages(FAST_SYSTEM_PROMPT, query, title, content), RELEVANCE_LABELS,
+                            timeout=deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT,
+                            deadline=deadline)
+        if result is not None:
+            return result
+
+    messages = build_messages(SYSTEM_PROMPT, query, title, content)
 
     for attempt in range(max_retries):
+        if deadline:
+            deadline.check()
         try:
-            reasoning_content, response_text = get_response(messages)
+            reasoning_content, response_text = get_response(
+                messages, timeout=deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT,
+                deadline=deadline
+            )
 
             parsed_result = parse_json_block(response_text)
             score = parsed_result.get("标签", -1)
@@ -174,6 +310,8 @@ def score_relevance(query: str, title: str, content: str, max_retries: int = 3)
             else:
                 raise ValueError(f"无效的标签值: {score}")
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             if attempt < max_retries - 1:
                 time.sleep(1)
@@ -185,54 +323,259 @@ def score_relevance(query: str, title: str, content: str, max_retries: int = 3)
     return -1, "打分失败"
 
 
-def score_relevance_batch(results: list, query: str, max_workers: int = 128) -> list:
+def build_group_messages(query: str, items: List[Dict]) -> List[Dict]:
+    """构造一次携带多条候选的打分请求（每条content分别按token预算裁剪）"""
+    candidates = '\n'.join(
+        BATCH_CANDIDATE_TEMPLATE.format(number=n, title=item['title'], content=trim_content(query, item['content']))
+        for n, item in enumerate(items, start=1)
+    )
+    return [
+        {'role': 'system', 'content': BATCH_SYSTEM_PROMPT},
+        {'role': 'user', 'content': BATCH_USER_PROMPT_TEMPLATE.format(query=query, candidates=candidates)}
+    ]
+
+
+def parse_group_labels(response_text: str, count: int) -> Dict[int, Tuple[int, str]]:
+    """
+    解析批量打分输出
+
+    Returns:
+        {候选下标(从0开始): (分数, 理由)}，只包含解析成功的条目
+    """
+    labels = {}
+    for entry in parse_json_array(response_text):
+        if not isinstance(entry, dict):
+            continue
+        number = entry.get("编号")
+        score = entry.get("标签", -1)
+        if isinstance(number, int) and 1 <= number <= count and score in [0, 1, 2]:
+            labels[number - 1] = (score, entry.get("判断依据", "解析失败"))
+    return labels
+
+
+def group_max_tokens(count: int) -> int:
+    """批量输出的token上限随候选数增长"""
+    return 1024 + 64 * count
+
+
+def score_relevance_group(query: str, items: List[Dict], max_retries: int = 2,
+                          deadline: Optional[Deadline] = None) -> Dict[int, Tuple[int, str]]:
+    """
+    一次LLM调用评估多条候选的相关性
+
+    Args:
+        query: 搜索查询
+        items: 候选结果列表，每个包含 {title, content}
+        max_retries: 一条都解析不出来时的最大尝试次数
+        deadline: 请求截止时间，到期后不再发起新的尝试（抛出 DeadlineExceeded）
+
+    Returns:
+        {候选下标: (分数, 理由)}，缺失的条目由调用方回退为逐条打分
+    """
+    messages = build_group_messages(query, items)
+    for attempt in range(max_retries):
+        if deadline:
+            deadline.check()
+        try:
+            reasoning_content, response_text = get_response(
+                messages, max_tokens=group_max_tokens(len(items)),
+                timeout=deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT,
+                deadline=deadline
+            )
+            labels = parse_group_labels(response_text, len(items))
+            if labels:
+                return labels
+            raise ValueError("批量输出解析失败")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if attempt < max_retries - 1:
+                time.sleep(1)
+                continue
+            print(f"批量相关性打分失败: {str(e)}")
+    return {}
+
+
+def split_groups(indices: List[int], size: int) -> List[List[int]]:
+    return [indices[i:i + size] for i in range(0, len(indices), size)]
+
+
+def plan_relevance_batch(results: list, query: str) -> Tuple[List[Dict], List[int], List[str], Dict[int, List[int]]]:
+    """
+    先查相关性缓存，再用词面预筛过滤明显无关的结果，两者都直接填好分数；
+    剩下的结果按内容近似重复聚类，每组只有代表调用LLM
+
+    Args:
+        results: 搜索结果列表
+        query: 搜索查询
+
+    Returns:
+        (结果副本列表, 需要调用LLM的下标列表, 每条结果的缓存键, 代表下标 -> 同组其他结果下标)
     """
-    批量评估相关性
+    cache = get_relevance_cache()
+    final_results = []
+    pending = []
+    keys = []
+
+    for index, r in enumerate(results):
+        result = r.copy()
+        key = relevance_cache_key(query, r)
+        cached = cache.get(key) if cache else None
+        # 完整模式下不复用快速打分写入的条目，重新打分后覆盖
+        if cached is not None and reusable(cached[0]['reason'], FAST_SCORING):
+            value, _ = cached
+            result['relevance_score'] = value['score']
+            result['relevance_reason'] = value['reason']
+            result['relevance_source'] = 'cache'
+        else:
+            pending.append(index)
+        keys.append(key)
+        final_results.append(result)
+
+    if cache:
+        print(f"  相关性缓存命中: {len(results) - len(pending)}/{len(results)}")
+
+    if PREFILTER_ENABLED and pending:
+        rejected, _ = prefilter([results[i] for i in pending], query, PREFILTER_THRESHOLD)
+        rejected_indices = set(pending[j] for j in rejected)
+        for index in rejected_indices:
+            final_results[index]['relevance_score'] = 0
+            final_results[index]['relevance_reason'] = '与query无共同词面'
+            final_results[index]['relevance_source'] = 'prefilter'
+        pending = [i for i in pending if i not in rejected_indices]
+        print(f"  词面预筛判为无关: {len(rejected_indices)} 条，节省 {len(rejected_indices)} 次LLM调用")
+
+    duplicates = {}
+    if NEAR_DUP_ENABLED and len(pending) > 1:
+        groups = near_duplicate_groups([results[i] for i in pending])
+        duplicates = {pending[group[0]]: [pending[j] for j in group[1:]] for group in groups if len(group) > 1}
+        followers = set(index for members in duplicates.values() for index in members)
+        if followers:
+            pending = [i for i in pending if i not in followers]
+            print(f"  近似重复内容: {len(followers)} 条复用同组代表的打分，节省 {len(followers)} 次LLM调用")
+
+    return final_results, pending, keys, duplicates
+
+
+def record_relevance(result: Dict, key: str, score: int, reason: str, source: str = 'llm'):
+    """写入LLM打分结果，打分成功的写回缓存"""
+    result['relevance_score'] = score
+    result['relevance_reason'] = reason
+    result['relevance_source'] = source
+    cache = get_relevance_cache()
+    if cache and score in [0, 1, 2]:
+        cache.set(key, {'score': score, 'reason': reason})
+
+
+def copy_to_duplicates(final_results: list, keys: List[str], duplicates: Dict[int, List[int]], unfinished: set):
+    """代表的打分复制给同组的近似重复结果；代表未打完分时同组结果一起计入未完成"""
+    for representative, members in duplicates.items():
+        if representative in unfinished:
+            unfinished.update(members)
+            continue
+        source = final_results[representative]
+        for index in members:
+            record_relevance(final_results[index], keys[index], source['relevance_score'],
+                             source['relevance_reason'], source='near_duplicate')
+
+
+def score_relevance_batch(results: list, query: str, max_workers: int = 128,
+                          deadline: Optional[Deadline] = None) -> list:
+    """
+    批量评估相关性（命中缓存的结果不再调用LLM）
 
     Args:
         results: 搜索结果列表，每个包含 {url, title, content, engine}
         query: 搜索查询
         max_workers: 最大并发数
+        deadline: 请求截止时间，届时仍未打完分的结果标记为未打分
 
     Returns:
-        添加了相关性分数的结果列表
+        添加了相关性分数的结果列表（顺序与输入一致）
     """
     print(f"\n开始相关性打分，共 {len(results)} 条结果...")
 
-    scored_results = []
+    final_results, pending, keys, duplicates = plan_relevance_batch(results, query)
+    unfinished = set(pending)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_index = {
-            executor.submit(score_relevance, query, result['title'], result['content']): i
-            for i, result in enumerate(results)
-        }
+    if pending:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # 批量模式：每个子批次一次LLM调用，各子批次并行；解析失败的条目回退为逐条打分
+            if RELEVANCE_BATCH_SIZE > 1:
+                groups = split_groups(pending, RELEVANCE_BATCH_SIZE)
+                print(f"  批量打分: {len(pending)} 条结果分为 {len(groups)} 个子批次")
+                future_to_group = {
+                    submit_in_context(executor, score_relevance_group, query, [results[i] for i in group],
+                                      deadline=deadline): group
+                    for group in groups
+                }
+                pending = []
+                for future in iter_completed(future_to_group, deadline, 'relevance'):
+                    group = future_to_group[future]
+                    try:
+                        labels = future.result()
+                    except Exception as e:
+                        print(f"  子批次打分失败: {str(e)}")
+                        labels = {}
+                    for position, index in enumerate(group):
+                        if position in labels:
+                            record_relevance(final_results[index], keys[index], *labels[position])
+                            unfinished.discard(index)
+                        else:
+                            pending.append(index)
+                if pending:
+                    print(f"  {len(pending)} 条结果回退为逐条打分")
+
+            if deadline and deadline.expired():
+                pending = []
+            future_to_index = {
+                submit_in_context(executor, score_relevance, query, results[i]['title'], results[i]['content'],
+                                  deadline=deadline): i
+                for i in pending
+            }
+
+            completed = 0
+            for future in iter_completed(future_to_index, deadline, 'relevance'):
+                index = future_to_index[future]
+                try:
+                    score, reason = future.result()
+                    record_relevance(final_results[index], keys[index], score, reason)
+                    unfinished.discard(index)
+
+                    completed += 1
+                    if completed % 10 == 0:
+                        print(f"  进度: {completed}/{len(pending)}")
+
+                except DeadlineExceeded:
+                    continue
+                except Exception as e:
+                    print(f"  处理索引 {index} 失败: {str(e)}")
+                    record_relevance(final_results[index], keys[index], -1, "打分失败")
+                    unfinished.discard(index)
+        finally:
+            # 截止时间已到时不等待进行中的打分，排队中的直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    copy_to_duplicates(final_results, keys, duplicates, unfinished)
+    mark_timed_out(final_results, unfinished, deadline)
+    print_relevance_summary(final_results)
+    return final_results
+
+
+def mark_timed_out(final_results: list, unfinished: set, deadline: Optional[Deadline]):
+    """到截止时间仍未打完分的结果标记为未打分"""
+    if not unfinished:
+        return
+    if deadline:
+        deadline.mark_timed_out('relevance')
+    for index in unfinished:
+        mark_unscored(final_results[index], TIMEOUT_REASON)
+    print(f"  到达截止时间，{len(unfinished)} 条结果未打分")
 
-        completed = 0
-        for future in as_completed(future_to_index):
-            index = future_to_index[future]
-            try:
-                score, reason = future.result()
-                result = results[index].copy()
-                result['relevance_score'] = score
-                result['relevance_reason'] = reason
-                scored_results.append((index, result))
-
-                completed += 1
-                if completed % 10 == 0:
-                    print(f"  进度: {completed}/{len(results)}")
-
-            except Exception as e:
-                print(f"  处理索引 {index} 失败: {str(e)}")
-                result = results[index].copy()
-                result['relevance_score'] = -1
-                result['relevance_reason'] = "打分失败"
-                scored_results.append((index, result))
-
-    # 按原始顺序排序
-    scored_results.sort(key=lambda x: x[0])
-    final_results = [r[1] for r in scored_results]
-
-    # 统计
+
+def print_relevance_summary(final_results: list):
+    """打印相关性打分的分布统计"""
     score_counts = {0: 0, 1: 0, 2: 0, -1: 0}
     for r in final_results:
         score_counts[r['relevance_score']] = score_counts.get(r['relevance_score'], 0) + 1
@@ -243,9 +586,156 @@ def score_relevance_batch(results: list, query: str, max_workers: int = 128) ->
     print(f"  无关(0): {score_counts[0]}")
     print(f"  失败(-1): {score_counts[-1]}")
 
+
+async def score_relevance_async(query: str, title: str, content: str, max_retries: int = 3,
+                                timeout: float = REQUEST_TIMEOUT, fast: bool = FAST_SCORING) -> Tuple[int, str]:
+    """
+    score_relevance 的异步版本
+
+    Args:
+        query: 搜索查询
+        title: 网页标题
+        content: 网页内容
+        max_retries: 最大重试次数
+        timeout: 单次LLM调用超时（秒）
+        fast: 快速模式
+
+    Returns:
+        (相关性分数 0/1/2, 判断依据)
+    """
+    if fast:
+        result = await fast_label_async(build_messages(FAST_SYSTEM_PROMPT, query, title, content), RELEVANCE_LABELS,
+                                        timeout=timeout)
+        if result is not None:
+            return result
+
+    messages = build_messages(SYSTEM_PROMPT, query, title, content)
+
+    for attempt in range(max_retries):
+        try:
+            reasoning_content, response_text = await get_response_async(messages, timeout=timeout)
+
+            parsed_result = parse_json_block(response_text)
+            score = parsed_result.get("标签", -1)
+            reason = parsed_result.get("判断依据", "解析失败")
+
+            if score in [0, 1, 2]:
+                return score, reason
+            else:
+                raise ValueError(f"无效的标签值: {score}")
+
+        except Exception as e:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(1)
+                continue
+            else:
+                print(f"相关性打分失败: {str(e)}")
+                return -1, "打分失败"
+
+    return -1, "打分失败"
+
+
+async def score_relevance_group_async(query: str, items: List[Dict], max_retries: int = 2,
+                                      timeout: float = REQUEST_TIMEOUT) -> Dict[int, Tuple[int, str]]:
+    """score_relevance_group 的异步版本（到截止时间时由调用方直接取消）"""
+    messages = build_group_messages(query, items)
+    for attempt in range(max_retries):
+        try:
+            reasoning_content, response_text = await get_response_async(
+                messages, max_tokens=group_max_tokens(len(items)), timeout=timeout
+            )
+            labels = parse_group_labels(response_text, len(items))
+            if labels:
+                return labels
+            raise ValueError("批量输出解析失败")
+        except Exception as e:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(1)
+                continue
+            print(f"批量相关性打分失败: {str(e)}")
+    return {}
+
+
+async def score_relevance_batch_async(results: list, query: str, deadline: Optional[Deadline] = None) -> list:
+    """
+    score_relevance_batch 的异步版本：所有结果在同一个事件循环上并发打分
+
+    Args:
+        results: 搜索结果列表，每个包含 {url, title, content, engine}
+        query: 搜索查询
+        deadline: 请求截止时间，届时仍未完成的打分被取消并标记为未打分
+
+    Returns:
+        添加了相关性分数的结果列表（顺序与输入一致）
+    """
+    print(f"\n开始异步相关性打分，共 {len(results)} 条结果...")
+
+    final_results, pending, keys, duplicates = plan_relevance_batch(results, query)
+    unfinished = set(pending)
+    timeout = deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT
+
+    if RELEVANCE_BATCH_SIZE > 1 and pending:
+        groups = split_groups(pending, RELEVANCE_BATCH_SIZE)
+        print(f"  批量打分: {len(pending)} 条结果分为 {len(groups)} 个子批次")
+        group_tasks = {
+            asyncio.ensure_future(score_relevance_group_async(query, [results[i] for i in group], timeout=timeout)): group
+            for group in groups
+        }
+        done = await wait_until(group_tasks, deadline, 'relevance')
+        pending = []
+        for task, group in group_tasks.items():
+            if task not in done:
+                continue
+            labels = {}
+            if task.exception() is not None:
+                print(f"  子批次打分失败: {str(task.exception())}")
+            else:
+                labels = task.result()
+            for position, index in enumerate(group):
+                if position in labels:
+                    record_relevance(final_results[index], keys[index], *labels[position])
+                    unfinished.discard(index)
+                else:
+                    pending.append(index)
+        if pending:
+            print(f"  {len(pending)} 条结果回退为逐条打分")
+
+    if deadline and deadline.expired():
+        pending = []
+    tasks = {
+        asyncio.ensure_future(score_relevance_async(query, results[i]['title'], results[i]['content'],
+                                                    timeout=timeout)): i
+        for i in pending
+    }
+    done = await wait_until(tasks, deadline, 'relevance')
+    for task, index in tasks.items():
+        if task not in done:
+            continue
+        unfinished.discard(index)
+        if task.exception() is not None:
+            print(f"  处理索引 {index} 失败: {str(task.exception())}")
+            record_relevance(final_results[index], keys[index], -1, "打分失败")
+        else:
+            record_relevance(final_results[index], keys[index], *task.result())
+
+    copy_to_duplicates(final_results, keys, duplicates, unfinished)
+    mark_timed_out(final_results, unfinished, deadline)
+    print_relevance_summary(final_results)
     return final_results
 
 
+def explain_relevance(query: str, title: str, content: str, url: Optional[str] = None) -> Tuple[int, str]:
+    """
+    按需生成理由：用完整模式重新打一次分（快速模式下打分结果不带理由）
+    给出url时把完整结果写回相关性缓存，覆盖快速打分写入的条目
+    """
+    score, reason = score_relevance(query, title, content, fast=False)
+    if url:
+        result = canonicalize_results([{'url': url, 'title': title, 'content': content}])[0]
+        record_relevance(result, relevance_cache_key(query, result), score, reason)
+    return score, reason
+
+
 # 测试代码
 if __name__ == '__main__':
     # 测试单个打分
@@ -0,0 +1,74 @@
+"""
+请求上下文
+用 ContextVar 标记当前代码属于哪一次查询请求，供LLM调度器按请求轮转等功能使用。
+asyncio任务会自动继承上下文；提交到线程池的任务需通过 submit_in_context 显式传递
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import Executor, Future
+from typing import Callable, Dict, Iterator, Optional
+
+_request_ids = itertools.count(1)
+
+
+class RequestContext:
+    """一次查询请求"""
+
+    def __init__(self, label: str = ''):
+        self.request_id = next(_request_ids)
+        self.label = label
+        self.started_at = time.time()
+        # 请求内的累计计数（LLM token用量等），打分线程共享同一个上下文，需加锁
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def add_counts(self, **counts: int):
+        """累加计数"""
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] = self._counts.get(name, 0) + value
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+_current_request: ContextVar[Optional[RequestContext]] = ContextVar('current_request', default=None)
+
+
+def current_request() -> Optional[RequestContext]:
+    """当前所在的请求，不在任何请求中时返回None"""
+    return _current_request.get()
+
+
+@contextmanager
+def request_scope(label: str = '') -> Iterator[RequestContext]:
+    """
+    在 with 块内开启一个新的请求上下文
+
+    Args:
+        label: 请求说明（一般为query）
+    """
+    ctx = RequestContext(label)
+    token = _current_request.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current_request.reset(token)
+
+
+def run_in_request(ctx: RequestContext, fn: Callable, *args, **kwargs):
+    """在指定请求上下文中执行函数（用于生成器等不便使用 request_scope 的场景）"""
+    token = _current_request.set(ctx)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_request.reset(token)
+
+
+def submit_in_context(executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """提交到线程池，并让任务继承当前的上下文（ThreadPoolExecutor默认不传递ContextVar）"""
+    return executor.submit(copy_context().run, fn, *args, **kwargs)
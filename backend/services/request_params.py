@@ -0,0 +1,84 @@
+"""
+查询参数校验
+HTTP接口（app.py）与离线批量工具（scripts/batch_query.py）共用，保证同样的参数得到同样的校验结果
+"""
+import os
+
+from engine_selector import ENGINE_MODES
+
+# 批量查询单批最多的query数
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '1000'))
+
+
+def parse_top_k(data: dict):
+    """
+    解析惰性打分参数 top_k
+
+    Returns:
+        正整数或None（None表示全部打分）
+
+    Raises:
+        ValueError: top_k 不是正整数
+    """
+    top_k = data.get('top_k')
+    if top_k is None:
+        return None
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k <= 0:
+        raise ValueError('top_k必须是正整数')
+    return top_k
+
+
+def parse_deadline_ms(data: dict):
+    """
+    解析请求的时间预算 deadline_ms
+
+    Returns:
+        正整数（毫秒）或None（None表示不限时）
+
+    Raises:
+        ValueError: deadline_ms 不是正整数
+    """
+    deadline_ms = data.get('deadline_ms')
+    if deadline_ms is None:
+        return None
+    if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, int) or deadline_ms <= 0:
+        raise ValueError('deadline_ms必须是正整数')
+    return deadline_ms
+
+
+def parse_engine_mode(data: dict):
+    """
+    解析引擎模式 engine_mode
+
+    Returns:
+        'all'、'adaptive' 或None（None表示使用服务端默认模式）
+
+    Raises:
+        ValueError: engine_mode 不是支持的模式
+    """
+    engine_mode = data.get('engine_mode')
+    if engine_mode is None:
+        return None
+    if engine_mode not in ENGINE_MODES:
+        raise ValueError(f"engine_mode必须是{'或'.join(ENGINE_MODES)}")
+    return engine_mode
+
+
+def parse_batch_queries(data: dict):
+    """
+    解析批量查询的 queries
+
+    Returns:
+        去掉首尾空白的query列表
+
+    Raises:
+        ValueError: queries 不是非空字符串列表，或超过 BATCH_MAX_QUERIES 条
+    """
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        raise ValueError('queries必须是非空列表')
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f'queries最多{BATCH_MAX_QUERIES}条')
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError('queries中的每一项都必须是非空字符串')
+    return [query.strip() for query in queries]
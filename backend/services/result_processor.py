@@ -1,9 +1,44 @@
 """
 结果处理器
-包含URL解析和结果筛选功能
+包含URL解析、URL规范化、近似重复聚类和结果筛选功能
 """
-from urllib.parse import urlparse
-from typing import List, Dict
+import os
+import unicodedata
+from fnmatch import fnmatch
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from request_context import current_request
+
+# 惰性打分模式下未打相关性分的结果
+UNSCORED_REASON = '未打分'
+# 到达请求截止时间仍未打完分的结果
+TIMEOUT_REASON = '超时未打分'
+
+# URL规范化规则（逗号分隔）：同一页面的 http/https、末尾斜杠、跟踪参数、#片段、移动站镜像视为同一URL
+URL_CANONICALIZE = os.getenv('URL_CANONICALIZE', '1') == '1'
+# 去掉的查询参数，支持通配符
+URL_TRACKING_PARAMS = tuple(p.strip().lower() for p in os.getenv(
+    'URL_TRACKING_PARAMS', 'utm_*,spm,spm_id_from,gclid,fbclid,yclid,mc_cid,mc_eid'
+).split(',') if p.strip())
+# 视为主站镜像的子域前缀（www. 与主站同样处理）
+URL_MIRROR_PREFIXES = tuple(p.strip().lower() for p in os.getenv(
+    'URL_MIRROR_PREFIXES', 'www.,m.,wap.,mobile.'
+).split(',') if p.strip())
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+# 近似重复聚类：转载、镜像到不同URL/host的同一篇文章只打一次相关性
+NEAR_DUP_ENABLED = os.getenv('NEAR_DUP_CLUSTERING', '1') == '1'
+# title+content字符三元组集合的Jaccard相似度（MinHash估计）不低于该值视为同一内容
+NEAR_DUP_THRESHOLD = float(os.getenv('NEAR_DUP_THRESHOLD', '0.8'))
+MINHASH_NUM_PERM = int(os.getenv('MINHASH_NUM_PERM', '64'))
+# 哈希族 h(x) = ((a*x + b) mod 2^64) >> 32（multiply-shift，a为奇数），uint64乘法自然回绕，不需要取模
+_minhash_rng = np.random.RandomState(20240601)
+_MINHASH_A = _minhash_rng.randint(0, np.iinfo(np.int64).max, size=MINHASH_NUM_PERM, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+_MINHASH_B = _minhash_rng.randint(0, np.iinfo(np.int64).max, size=MINHASH_NUM_PERM, dtype=np.int64).astype(np.uint64)
+_EMPTY_SIGNATURE = np.iinfo(np.uint64).max
 
 
 def extract_host(url: str) -> str:
@@ -24,6 +59,146 @@ def extract_host(url: str) -> str:
         return url
 
 
+def canonicalize_url(url: str) -> str:
+    """
+    URL规范化：统一为https、小写host、去掉默认端口和镜像子域前缀、去掉跟踪参数与#片段、
+    剩余查询参数排序、路径去掉末尾斜杠
+
+    Args:
+        url: 原始URL
+
+    Returns:
+        规范化后的URL，仅用于判断是否为同一页面（解析失败时原样返回）
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except Exception:
+        return url
+    if parsed.scheme.lower() not in DEFAULT_PORTS or not parsed.hostname:
+        return url
+
+    host = parsed.hostname.rstrip('.')
+    for prefix in URL_MIRROR_PREFIXES:
+        # 去掉前缀后至少保留一个点，避免把 www.cn 变成 cn
+        if host.startswith(prefix) and '.' in host[len(prefix):]:
+            host = host[len(prefix):]
+            break
+    try:
+        port = parsed.port
+    except ValueError:
+        port = None
+    if port and str(port) != DEFAULT_PORTS[parsed.scheme.lower()]:
+        host = f"{host}:{port}"
+
+    params = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not any(fnmatch(key.lower(), pattern) for pattern in URL_TRACKING_PARAMS)
+    )
+    path = parsed.path.rstrip('/')
+    return urlunparse(('https', host, path, parsed.params, urlencode(params), ''))
+
+
+def canonicalize_results(results: List[Dict]) -> List[Dict]:
+    """
+    为每个结果添加 canonical_url 字段（已有的不重复计算），去重和相关性缓存按它判断同一页面
+
+    Args:
+        results: 搜索结果列表
+
+    Returns:
+        同一个结果列表
+    """
+    for result in results:
+        if 'canonical_url' not in result:
+            result['canonical_url'] = canonicalize_url(result['url']) if URL_CANONICALIZE else result['url']
+    return results
+
+
+def url_key(result: Dict) -> str:
+    """去重键：有规范化URL时用规范化URL"""
+    return result.get('canonical_url') or result.get('url', '')
+
+
+def record_url_merges(count: int):
+    """把规范化后才发现重复（原始URL不同）而省掉的打分计入当前请求"""
+    request = current_request()
+    if request is not None and count:
+        request.add_counts(url_variants_merged=count)
+
+
+def char_shingles(text: str) -> np.ndarray:
+    """
+    字符三元组：归一化后的文本转为Unicode码点数组，相邻三个码点（各21位）拼成一个整数
+
+    Returns:
+        uint64数组，文本不足三个字符时为空
+    """
+    text = ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < 3:
+        return codes[:0]
+    return (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """
+    计算MinHash签名（每条文本的全部三元组一次矩阵运算；最小值与重复无关，不需要先去重）
+
+    Args:
+        texts: 文本列表
+
+    Returns:
+        形如 (len(texts), MINHASH_NUM_PERM) 的签名矩阵；不足三个字符的文本整行为 _EMPTY_SIGNATURE
+    """
+    signatures = np.full((len(texts), MINHASH_NUM_PERM), _EMPTY_SIGNATURE, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for i, text in enumerate(texts):
+            shingles = char_shingles(text)
+            if len(shingles):
+                hashed = (_MINHASH_A[:, None] * shingles[None, :] + _MINHASH_B[:, None]) >> np.uint64(32)
+                signatures[i] = hashed.min(axis=1)
+    return signatures
+
+
+def near_duplicate_groups(results: List[Dict], threshold: float = NEAR_DUP_THRESHOLD) -> List[List[int]]:
+    """
+    按title+content的MinHash相似度把近似重复的结果聚成组（相似关系传递合并）
+
+    Args:
+        results: 搜索结果列表
+        threshold: 签名一致比例（字符三元组集合的Jaccard相似度估计）不低于该值视为重复
+
+    Returns:
+        分组列表，每组为结果下标，组内第一个为代表（content最长）；不重复的结果单独成组
+    """
+    n = len(results)
+    if n < 2:
+        return [[i] for i in range(n)]
+
+    signatures = minhash_signatures([f"{r.get('title', '')} {r.get('content', '')}" for r in results])
+    empty = (signatures == _EMPTY_SIGNATURE).all(axis=1)
+    agreements = (signatures[:, None, :] == signatures[None, :, :]).sum(axis=2, dtype=np.int32)
+    similar = np.triu(agreements >= threshold * MINHASH_NUM_PERM, 1) & ~empty[:, None] & ~empty[None, :]
+
+    # 并查集合并相似对
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in np.argwhere(similar):
+        parent[find(int(j))] = find(int(i))
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [sorted(members, key=lambda i: -len(results[i].get('content') or ''))
+            for members in groups.values()]
+
+
 def add_host_to_results(results: List[Dict]) -> List[Dict]:
     """
     为每个结果添加host字段
@@ -39,6 +214,41 @@ def add_host_to_results(results: List[Dict]) -> List[Dict]:
     return results
 
 
+def mark_unscored(result: Dict, reason: str = UNSCORED_REASON) -> Dict:
+    """
+    标记结果未打相关性分（惰性模式下排在top_k之后的结果，或到截止时间仍未打完的结果）
+
+    Args:
+        result: 搜索结果
+        reason: 未打分的原因
+
+    Returns:
+        同一个结果字典，relevance_score 为 None，relevance_status 为 'unscored'
+    """
+    result['relevance_score'] = None
+    result['relevance_reason'] = reason
+    result['relevance_status'] = 'unscored'
+    return result
+
+
+def mark_authority_unscored(result: Dict, reason: str = TIMEOUT_REASON) -> Dict:
+    """
+    标记结果未打权威性分（到截止时间仍未完成的host）
+
+    Returns:
+        同一个结果字典，authority_score 为 None，authority_status 为 'unscored'
+    """
+    result['authority_score'] = None
+    result['authority_reason'] = reason
+    result['authority_status'] = 'unscored'
+    return result
+
+
+def score_or_lowest(score: Optional[int]) -> int:
+    """排序用：未打分(None)按最低分-1处理"""
+    return -1 if score is None else score
+
+
 def filter_results(results: List[Dict], relevance_threshold: int = 2, authority_threshold: int = 4) -> List[Dict]:
     """
     筛选结果：相关性=2且权威性=4
@@ -79,7 +289,7 @@ def deduplicate_by_url(results: List[Dict]) -> List[Dict]:
     deduplicated = []
 
     for r in results:
-        url = r.get('url', '')
+        url = url_key(r)
         if url and url not in seen_urls:
             seen_urls.add(url)
             deduplicated.append(r)
@@ -92,7 +302,7 @@ def deduplicate_by_url(results: List[Dict]) -> List[Dict]:
 
 def deduplicate_by_url_keep_longest(results: List[Dict]) -> List[Dict]:
     """
-    根据URL去重，保留content最长的那个
+    根据URL去重，保留content最长的那个（结果带 canonical_url 时按规范化URL去重）
 
     Args:
         results: 结果列表
@@ -101,11 +311,13 @@ def deduplicate_by_url_keep_longest(results: List[Dict]) -> List[Dict]:
         去重后的结果列表
     """
     url_dict = {}
+    raw_urls = {}
 
     for r in results:
-        url = r.get('url', '')
+        url = url_key(r)
         if not url:
             continue
+        raw_urls.setdefault(url, set()).add(r.get('url', ''))
 
         content = r.get('content', '')
         content_length = len(content) if content else 0
@@ -119,9 +331,12 @@ def deduplicate_by_url_keep_longest(results: List[Dict]) -> List[Dict]:
             url_dict[url] = r
 
     deduplicated = list(url_dict.values())
+    merged = sum(len(urls) - 1 for urls in raw_urls.values())
+    record_url_merges(merged)
 
     if len(results) > len(deduplicated):
-        print(f"  URL去重(保留最长): {len(results)} -> {len(deduplicated)} (移除 {len(results) - len(deduplicated)} 个重复)")
+        print(f"  URL去重(保留最长): {len(results)} -> {len(deduplicated)} (移除 {len(results) - len(deduplicated)} 个重复，"
+              f"其中 {merged} 个为同一页面的不同URL)")
 
     return deduplicated
 
@@ -149,8 +364,11 @@ def format_final_results(results: List[Dict]) -> List[Dict]:
             'engine': r['engine'],
             'relevance_score': r['relevance_score'],
             'relevance_reason': r.get('relevance_reason', ''),
+            'relevance_source': r.get('relevance_source', ''),
+            'relevance_status': r.get('relevance_status', 'scored'),
             'authority_score': r['authority_score'],
-            'authority_reason': r.get('authority_reason', '')
+            'authority_reason': r.get('authority_reason', ''),
+            'authority_status': r.get('authority_status', 'scored')
         })
     return formatted
 
@@ -170,6 +388,20 @@ if __name__ == '__main__':
         host = extract_host(url)
         print(f"  {url} -> {host}")
 
+    # 测试URL规范化
+    print("\n测试URL规范化:")
+    for url in ["http://m.pku.edu.cn/news/?utm_source=x&id=1#top", "https://www.pku.edu.cn:443/news?id=1&spm=a.b"]:
+        print(f"  {url} -> {canonicalize_url(url)}")
+
+    # 测试近似重复聚类
+    print("\n测试近似重复聚类:")
+    article = "教育部发布2025年全国硕士研究生招生考试数学二考试大纲，考试内容包括高等数学和线性代数。"
+    print(near_duplicate_groups([
+        {'title': '考研数学二大纲', 'content': article},
+        {'title': '考研数学二大纲（转载）', 'content': article + '来源：某网站'},
+        {'title': '考研英语一大纲', 'content': '英语一考试大纲包括阅读理解、翻译和写作。'},
+    ]))
+
     # 测试结果筛选
     test_results = [
         {'url': 'url1', 'relevance_score': 2, 'authority_score': 4},
@@ -0,0 +1,89 @@
+"""
+请求合并（singleflight）
+同一个key同时只执行一次：第一个调用方执行，其余并发调用方等待同一个结果。
+同步与异步调用方共用一个登记表，结果通过 concurrent.futures.Future 传递
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """按key合并进行中的调用"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """登记调用，返回 (future, 是否为执行方)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future, False
+            future = Future()
+            # 标记为执行中：等待方被取消时不会连带取消这个共享的future
+            future.set_running_or_notify_cancel()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        执行或等待同一key的调用
+
+        Args:
+            key: 合并键
+            fn: 执行函数
+
+        Returns:
+            (结果, 是否复用了其他调用方的结果)
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        do 的异步版本：fn 返回协程，等待方不占用线程
+
+        Returns:
+            (结果, 是否复用了其他调用方的结果)
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        # 执行方被取消（如请求到达截止时间）时调用继续完成，等待同一结果的其他调用方不受影响
+        task = asyncio.ensure_future(self._run_async(key, future, fn, *args, **kwargs))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task), False
+
+    async def _run_async(self, key: Hashable, future: Future, fn: Callable[..., Awaitable[Any]], *args, **kwargs):
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'in_flight': len(self._calls), 'coalesced': self._coalesced}
@@ -0,0 +1,109 @@
+"""
+相关性提示词的token预算
+搜索接口返回的content长度不受控，部分引擎一条就有几KB，直接放进提示词会拉高prompt token数和打分耗时。
+这里把content裁剪到固定的token预算内：按句切分，优先保留与query词面重合最多的句子，再按原文顺序拼回。
+token数用字符规则估算（汉字约1个token，英文/数字约4个字符1个token），不依赖分词器
+"""
+import math
+import os
+import re
+from typing import List
+
+from lexical_prefilter import tokenize
+from request_context import current_request
+
+# 每条结果content的token预算，0表示不裁剪
+CONTENT_TOKEN_BUDGET = int(os.getenv('RELEVANCE_CONTENT_TOKENS', '512'))
+# 被省略的句子之间用省略号连接
+GAP_MARKER = '……'
+
+_CJK_CHAR = re.compile(r'[㐀-䶿一-鿿豈-﫿]')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_SYMBOL = re.compile(r'[^\sA-Za-z0-9㐀-䶿一-鿿豈-﫿]')
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;\n])|(?<=\.\s)')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_CHAR.findall(text))
+    words = sum(math.ceil(len(word) / 4) for word in _WORD.findall(text))
+    symbols = len(_SYMBOL.findall(text))
+    return cjk + words + symbols
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点和换行切句（保留标点）"""
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """按字符比例截断到大约 budget 个token（用于单句就超出预算的情况）"""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    return text[:max(1, len(text) * budget // tokens)]
+
+
+def trim_content(query: str, content: str, budget: int = CONTENT_TOKEN_BUDGET) -> str:
+    """
+    把content裁剪到token预算内，保留与query词面重合最多的句子
+
+    句子按（与query共有的词面单元数，原文位置）排序后依次放入预算，放不下的跳过；
+    选中的句子按原文顺序拼接，不相邻处插入省略号。
+
+    Args:
+        query: 搜索查询
+        content: 网页内容
+        budget: token预算，0表示不裁剪
+
+    Returns:
+        裁剪后的content（未超出预算时原样返回）
+    """
+    original_tokens = estimate_tokens(content)
+    if budget <= 0 or original_tokens <= budget:
+        return content
+
+    sentences = split_sentences(content)
+    query_terms = set(tokenize(query))
+    sizes = [estimate_tokens(sentence) for sentence in sentences]
+    overlaps = [len(query_terms & set(tokenize(sentence))) for sentence in sentences]
+
+    selected = []
+    used = 0
+    for i in sorted(range(len(sentences)), key=lambda i: (-overlaps[i], i)):
+        if used + sizes[i] <= budget:
+            selected.append(i)
+            used += sizes[i]
+
+    if selected:
+        selected.sort()
+        parts = [sentences[selected[0]]]
+        for previous, i in zip(selected, selected[1:]):
+            parts.append(sentences[i] if i == previous + 1 else GAP_MARKER + sentences[i])
+        trimmed = ''.join(parts)
+    else:
+        # 每一句都超出预算：截取重合最多的一句
+        best = max(range(len(sentences)), key=lambda i: (overlaps[i], -i)) if sentences else None
+        trimmed = truncate_to_tokens(sentences[best] if best is not None else content, budget)
+
+    record_trim(original_tokens, estimate_tokens(trimmed))
+    return trimmed
+
+
+def record_trim(original_tokens: int, trimmed_tokens: int):
+    """把裁剪前后的token数记入当前请求"""
+    request = current_request()
+    if request is not None:
+        request.add_counts(trimmed_contents=1,
+                           content_tokens_before_trim=original_tokens,
+                           content_tokens_after_trim=trimmed_tokens)
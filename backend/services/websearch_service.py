@@ -2,11 +2,26 @@
 WebSearch服务 - 并行调用6个搜索引擎获取结果
 """
 import requests
+import httpx
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Tuple
+import codecs
+import asyncio
+import os
+import threading
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, List, Dict, Optional, Tuple
 import time
 
+from async_runtime import LoopLocal
+from circuit_breaker import CircuitBreaker, backoff_delay
+from hedging import HedgeBudget, LatencyTracker
+from deadline import Deadline, budget_exhausted, iter_completed, wait_until
+from cache_backends import create_cache, normalize_query
+from request_context import current_request, submit_in_context
+from engine_selector import select_engines, ENGINE_MODE, ENGINE_LATENCY_BUDGET_MS
+
 # 6个搜索引擎配置
 SEARCH_ENGINES = {
     "jina": "search_pro_jina",
@@ -21,20 +36,448 @@ SEARCH_ENGINES = {
 API_URL = 'https://runway.devops.xiaohongshu.com/openai/zhipu/paas/v4/web_search'
 API_KEY = '83834a049770445a912608da03702901'
 
+# 每个引擎只取前N条结果
+TOP_N_RESULTS = 10
+
+# 连接池配置：同一host的所有请求共用一个keep-alive Session
+SESSION_POOL_MAXSIZE = 32
+STREAM_CHUNK_SIZE = 16 * 1024
+# 解析完前N条后，剩余响应体不超过该大小时读完以便连接回到连接池，否则直接断开
+DRAIN_LIMIT_BYTES = 512 * 1024
+
+# 单次请求超时与重试退避（带抖动的指数退避，秒）
+SEARCH_TIMEOUT = float(os.getenv('SEARCH_TIMEOUT', '30'))
+SEARCH_RETRY_BASE = float(os.getenv('SEARCH_RETRY_BASE', '0.2'))
+SEARCH_RETRY_CAP = float(os.getenv('SEARCH_RETRY_CAP', '2'))
+
+# 每个引擎一个熔断器：最近 WINDOW 次调用中失败（含超过 SLOW_SECONDS 的慢调用）比例达到阈值即熔断，
+# 熔断 OPEN_SECONDS 秒内直接跳过该引擎，之后放行一次探测请求决定是否恢复
+BREAKER_WINDOW = int(os.getenv('SEARCH_BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('SEARCH_BREAKER_MIN_CALLS', '5'))
+BREAKER_FAILURE_RATE = float(os.getenv('SEARCH_BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_SLOW_SECONDS = float(os.getenv('SEARCH_BREAKER_SLOW_SECONDS', '10'))
+BREAKER_OPEN_SECONDS = float(os.getenv('SEARCH_BREAKER_OPEN_SECONDS', '30'))
+
+# 搜索结果缓存：按 (引擎, 归一化query) 缓存各引擎的结果，默认存磁盘（重启后仍有效）。
+# 未超过该引擎TTL的直接返回；超过TTL但仍在 STALE 窗口内的先返回旧结果，同时在后台刷新
+SEARCH_CACHE_BACKEND = os.getenv('SEARCH_CACHE_BACKEND', 'sqlite')
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '20000'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '1800'))
+# 按引擎覆盖TTL（秒），如 "baidu=600,google=3600"
+SEARCH_CACHE_ENGINE_TTLS = {
+    name.strip(): float(ttl)
+    for name, _, ttl in (item.partition('=') for item in os.getenv('SEARCH_CACHE_ENGINE_TTLS', '').split(',') if '=' in item)
+}
+SEARCH_CACHE_STALE = float(os.getenv('SEARCH_CACHE_STALE', '3600'))
+SEARCH_CACHE_REFRESH_WORKERS = int(os.getenv('SEARCH_CACHE_REFRESH_WORKERS', '4'))
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(engine_name: str) -> CircuitBreaker:
+    """获取引擎对应的熔断器（进程内共享，所有请求共同积累失败统计）"""
+    breaker = _breakers.get(engine_name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(engine_name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    engine_name,
+                    window_size=BREAKER_WINDOW,
+                    min_calls=BREAKER_MIN_CALLS,
+                    failure_rate_threshold=BREAKER_FAILURE_RATE,
+                    slow_call_seconds=BREAKER_SLOW_SECONDS,
+                    open_seconds=BREAKER_OPEN_SECONDS
+                )
+                _breakers[engine_name] = breaker
+    return breaker
+
+
+def get_breaker_stats(engine_names: Iterable[str] = None) -> Dict[str, Dict]:
+    """
+    获取熔断器状态
+
+    Args:
+        engine_names: 引擎名称列表，为None时返回所有引擎
 
-def call_single_engine(query: str, engine_name: str, engine_code: str, max_retries: int = 3) -> List[Dict]:
+    Returns:
+        {引擎名称: 熔断器状态}
     """
-    调用单个搜索引擎获取结果
+    names = SEARCH_ENGINES.keys() if engine_names is None else engine_names
+    return {name: get_breaker(name).get_stats() for name in names}
+
+
+# 对冲请求：引擎超过其最近的 SEARCH_HEDGE_PERCENTILE 分位耗时仍未返回时，再发一个相同请求取先返回者；
+# 对冲请求数不超过普通请求数的 SEARCH_HEDGE_BUDGET 倍
+HEDGE_ENABLED = os.getenv('SEARCH_HEDGE', '1') == '1'
+HEDGE_PERCENTILE = float(os.getenv('SEARCH_HEDGE_PERCENTILE', '0.9'))
+HEDGE_BUDGET = float(os.getenv('SEARCH_HEDGE_BUDGET', '0.1'))
+HEDGE_MIN_SAMPLES = int(os.getenv('SEARCH_HEDGE_MIN_SAMPLES', '20'))
+HEDGE_MIN_DELAY_MS = float(os.getenv('SEARCH_HEDGE_MIN_DELAY_MS', '50'))
+HEDGE_WORKERS = int(os.getenv('SEARCH_HEDGE_WORKERS', '256'))
+
+_latency_trackers: Dict[str, LatencyTracker] = {}
+_hedge_budget = HedgeBudget(ratio=HEDGE_BUDGET)
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def get_latency_tracker(engine_name: str) -> LatencyTracker:
+    """获取引擎的耗时统计（进程内共享）"""
+    tracker = _latency_trackers.get(engine_name)
+    if tracker is None:
+        with _hedge_lock:
+            tracker = _latency_trackers.setdefault(engine_name, LatencyTracker(min_samples=HEDGE_MIN_SAMPLES))
+    return tracker
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """同步对冲请求使用的共享线程池"""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='search-hedge')
+    return _hedge_executor
+
+
+def hedge_delay(engine_name: str):
+    """引擎的对冲等待时间（秒）；未开启对冲或样本不足时返回None"""
+    if not HEDGE_ENABLED:
+        return None
+    threshold = get_latency_tracker(engine_name).percentile(HEDGE_PERCENTILE)
+    if threshold is None:
+        return None
+    return max(threshold, HEDGE_MIN_DELAY_MS / 1000)
+
+
+def get_hedge_stats() -> Dict:
+    """对冲预算使用情况与各引擎的耗时分布"""
+    return {
+        'enabled': HEDGE_ENABLED,
+        'percentile': HEDGE_PERCENTILE,
+        'budget': _hedge_budget.get_stats(),
+        'latency': {name: tracker.get_stats() for name, tracker in list(_latency_trackers.items())}
+    }
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+_refresh_executor = None
+# 正在后台刷新的缓存键，同一个键同时只刷新一次
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_refresh_counts = {'started': 0, 'failed': 0}
+
+
+def get_search_cache():
+    """获取搜索结果缓存单例（SEARCH_CACHE_BACKEND=off 时返回None）"""
+    global _search_cache
+    if SEARCH_CACHE_BACKEND == 'off':
+        return None
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                # 底层缓存按最长的 TTL + STALE 过期，新鲜/过期的判断按引擎在读取时进行
+                max_ttl = max([SEARCH_CACHE_TTL] + list(SEARCH_CACHE_ENGINE_TTLS.values()))
+                _search_cache = create_cache(SEARCH_CACHE_BACKEND, 'search', SEARCH_CACHE_SIZE,
+                                             max_ttl + SEARCH_CACHE_STALE)
+    return _search_cache
+
+
+def engine_cache_ttl(engine_name: str) -> float:
+    return SEARCH_CACHE_ENGINE_TTLS.get(engine_name, SEARCH_CACHE_TTL)
+
+
+def search_cache_key(query: str, engine_name: str) -> str:
+    return json.dumps([engine_name, normalize_query(query)], ensure_ascii=False)
+
+
+def get_refresh_executor() -> ThreadPoolExecutor:
+    """后台刷新过期缓存的线程池"""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _refresh_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=SEARCH_CACHE_REFRESH_WORKERS,
+                                                       thread_name_prefix='search-refresh')
+    return _refresh_executor
+
+
+def lookup_search_cache(query: str, engine_name: str, engine_code: str) -> Optional[List[Dict]]:
+    """
+    查询搜索结果缓存
 
     Args:
         query: 搜索查询
-        engine_name: 引擎名称（用于标识）
-        engine_code: 引擎代码（API参数）
-        max_retries: 最大重试次数
+        engine_name: 引擎名称
+        engine_code: 引擎代码（后台刷新时使用）
 
     Returns:
-        搜索结果列表，每个结果包含 {url, title, content, engine}
+        缓存的结果列表（过期但仍在 STALE 窗口内的同时触发后台刷新）；未命中时返回None
+    """
+    cache = get_search_cache()
+    if cache is None:
+        return None
+    cached = cache.get(search_cache_key(query, engine_name))
+    if cached is None:
+        return None
+    results, stored_at = cached
+    age = time.time() - stored_at
+    ttl = engine_cache_ttl(engine_name)
+    if age > ttl + SEARCH_CACHE_STALE:
+        return None
+
+    request = current_request()
+    if age > ttl:
+        refresh_search_cache(query, engine_name, engine_code)
+        if request is not None:
+            request.add_counts(search_cache_stale=1)
+    if request is not None:
+        request.add_counts(search_cache_hits=1)
+    print(f"✓ {engine_name}: 命中搜索缓存 {len(results)} 条（{age:.0f}秒前）")
+    return results
+
+
+def store_search_cache(query: str, engine_name: str, results: List[Dict]):
+    """写入搜索结果缓存（空结果可能是调用失败，不缓存）"""
+    cache = get_search_cache()
+    if cache is not None and results:
+        cache.set(search_cache_key(query, engine_name), results)
+
+
+def refresh_search_cache(query: str, engine_name: str, engine_code: str):
+    """在后台重新调用引擎并更新缓存，不阻塞当前请求"""
+    key = search_cache_key(query, engine_name)
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        _refresh_counts['started'] += 1
+
+    def refresh():
+        try:
+            results = fetch_single_engine(query, engine_name, engine_code)
+            if results:
+                store_search_cache(query, engine_name, results)
+            else:
+                with _refresh_lock:
+                    _refresh_counts['failed'] += 1
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    get_refresh_executor().submit(refresh)
+
+
+def get_search_cache_stats() -> Dict:
+    """搜索缓存的命中统计与后台刷新次数"""
+    cache = get_search_cache()
+    if cache is None:
+        return {'backend': 'off'}
+    stats = cache.get_stats()
+    with _refresh_lock:
+        stats['refresh'] = dict(_refresh_counts, in_flight=len(_refreshing))
+    return stats
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    获取目标host共享的keep-alive Session（跨请求复用TCP/TLS连接）
+
+    Args:
+        url: 请求地址
+
+    Returns:
+        该host对应的Session
+    """
+    host = urlparse(url).netloc
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SESSION_POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _sessions[host] = session
+    return session
+
+
+class _JsonStreamReader:
+    """
+    在分块到达的JSON文本上做增量解码
+
+    读取方法都是生成器：数据不足时yield，由调用方通过send()送入下一块字节（None表示数据结束）
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._exhausted = False
+        self.buf = ''
+        self.pos = 0
+
+    def _fill(self):
+        """等待下一块数据，丢弃已解析的前缀；没有更多数据时返回False"""
+        if self._exhausted:
+            return False
+        chunk = yield
+        if chunk is None:
+            text = self._utf8.decode(b'', final=True)
+            self._exhausted = True
+        else:
+            text = self._utf8.decode(chunk)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白并返回下一个字符，数据结束时返回空字符串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not (yield from self._fill()):
+                return ''
+
+    def expect(self, char: str):
+        """消费一个指定的结构字符"""
+        if (yield from self.peek()) != char:
+            raise ValueError(f"响应格式错误: 期望 '{char}'")
+        self.pos += 1
+
+    def value(self):
+        """解码下一个完整的JSON值"""
+        yield from self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not (yield from self._fill()):
+                    raise
+                continue
+            # 数字等值可能恰好在块边界被截断，需要多读一块确认
+            if end == len(self.buf) and (yield from self._fill()):
+                continue
+            self.pos = end
+            return obj
+
+
+class TopResultsParser:
+    """
+    搜索API响应体的增量解析器，读到前top_n条search_result后即完成
+
+    用法：逐块调用 feed()，返回True表示已拿到结果；数据读完仍未完成时调用 finish()
     """
+
+    def __init__(self, top_n: int = TOP_N_RESULTS):
+        self.items = None
+        self._reader = _JsonStreamReader()
+        self._parser = self._parse(top_n)
+        next(self._parser)
+
+    def _parse(self, top_n: int):
+        reader = self._reader
+        yield from reader.expect('{')
+        if (yield from reader.peek()) == '}':
+            return []
+
+        while True:
+            key = yield from reader.value()
+            yield from reader.expect(':')
+
+            if key == 'search_result':
+                items = []
+                yield from reader.expect('[')
+                if (yield from reader.peek()) == ']':
+                    return items
+                while len(items) < top_n:
+                    items.append((yield from reader.value()))
+                    char = yield from reader.peek()
+                    if char == ',':
+                        reader.pos += 1
+                    elif char == ']':
+                        break
+                    else:
+                        raise ValueError("响应格式错误: search_result 未正确结束")
+                return items
+
+            # 跳过其他字段
+            yield from reader.value()
+            char = yield from reader.peek()
+            if char == ',':
+                reader.pos += 1
+            elif char == '}':
+                return []
+            else:
+                raise ValueError("响应格式错误: 字段之间缺少分隔符")
+
+    def _send(self, chunk) -> bool:
+        if self.items is not None:
+            return True
+        try:
+            self._parser.send(chunk)
+        except StopIteration as stop:
+            self.items = stop.value
+            return True
+        return False
+
+    def feed(self, chunk: bytes) -> bool:
+        """送入一块响应数据，解析完成时返回True"""
+        return self._send(chunk) if chunk else self.items is not None
+
+    def finish(self) -> List[Dict]:
+        """响应已读完，返回解析结果（响应不完整时抛出ValueError）"""
+        self._send(None)
+        if self.items is None:
+            raise ValueError("响应格式错误: 响应体不完整")
+        return self.items
+
+
+def parse_top_search_results(chunks: Iterable[bytes], top_n: int = TOP_N_RESULTS) -> List[Dict]:
+    """
+    增量解析搜索API的响应体，读到前top_n条search_result后立即停止
+
+    Args:
+        chunks: 响应体的字节块迭代器
+        top_n: 需要的结果条数
+
+    Returns:
+        search_result 的前top_n项（响应中没有该字段时返回空列表）
+    """
+    parser = TopResultsParser(top_n)
+    for chunk in chunks:
+        if parser.feed(chunk):
+            return parser.items
+    return parser.finish()
+
+
+def _release_response(response: requests.Response):
+    """
+    释放流式响应：剩余内容不大时读完（不解码）让连接回到连接池，否则直接断开
+    """
+    try:
+        remaining = int(response.headers.get('Content-Length', -1))
+    except ValueError:
+        remaining = -1
+    if 0 <= remaining <= DRAIN_LIMIT_BYTES:
+        try:
+            for _ in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                pass
+        except Exception:
+            pass
+    response.close()
+
+
+def build_search_request(query: str, engine_name: str, engine_code: str) -> Tuple[Dict, Dict]:
+    """构造搜索API的请求头和请求体"""
     headers = {
         'api-key': API_KEY
     }
@@ -44,39 +487,222 @@ def call_single_engine(query: str, engine_name: str, engine_code: str, max_retri
         "query_rewrite": "false",
         "request_id": f"authority_query_{engine_name}",
     }
+    return headers, data
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(API_URL, headers=headers, data=json.dumps(data), timeout=30)
-            result = json.loads(response.content.decode())
 
-            items = result.get("search_result", [])
+def format_search_items(items: List[Dict], engine_name: str) -> List[Dict]:
+    """将API返回的search_result条目格式化为 {url, title, content, engine}"""
+    results = []
+    for item in items:  # 只取topN
+        results.append({
+            'url': item.get('link', ''),
+            'title': item.get('title', ''),
+            'content': item.get('content', ''),
+            'engine': engine_name
+        })
+    return results
+
+
+def fetch_top_items(session: requests.Session, headers: Dict, data: Dict, timeout: float = SEARCH_TIMEOUT) -> List[Dict]:
+    """发起一次搜索请求，边接收边解析，读到前N条后停止解码"""
+    response = session.post(API_URL, headers=headers, data=json.dumps(data), timeout=timeout, stream=True)
+    try:
+        return parse_top_search_results(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), TOP_N_RESULTS)
+    finally:
+        _release_response(response)
+
+
+def fetch_hedged(engine_name: str, fetch, *args, timeout: float = SEARCH_TIMEOUT,
+                 deadline: Optional[Deadline] = None) -> List[Dict]:
+    """
+    执行一次搜索请求；超过该引擎的对冲阈值仍未返回且预算允许时，再发一个相同请求，取先成功返回的结果
+
+    Args:
+        engine_name: 引擎名称
+        fetch: 发起单次请求的函数，以 timeout 关键字参数接收超时
+        timeout: 主请求的超时（秒）
+        deadline: 请求截止时间，对冲请求的超时不超过发出时的剩余时间
+
+    Returns:
+        fetch 的返回值（两个请求都失败时抛出最后一个异常）
+    """
+    tracker = get_latency_tracker(engine_name)
+    _hedge_budget.on_request()
+    delay = hedge_delay(engine_name)
+    start = time.perf_counter()
+    if delay is None:
+        items = fetch(*args, timeout=timeout)
+        tracker.record(time.perf_counter() - start)
+        return items
+
+    executor = get_hedge_executor()
+    primary = executor.submit(fetch, *args, timeout=timeout)
+    started = {primary: start}
+    if not wait([primary], timeout=delay).done:
+        # 对冲请求晚发出 delay 秒，超时按发出时的剩余时间重新截断，不会比截止时间更晚结束
+        hedge_timeout = deadline.timeout(timeout) if deadline else timeout
+        if hedge_timeout > 0 and _hedge_budget.try_acquire():
+            print(f"↻ {engine_name} 超过 {delay * 1000:.0f}ms 未返回，发出对冲请求")
+            hedge = executor.submit(fetch, *args, timeout=hedge_timeout)
+            started[hedge] = time.perf_counter()
+
+    # 未被采用的请求在后台自行结束并释放连接
+    pending, error = set(started), None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                items = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is not primary:
+                _hedge_budget.on_hedge_win()
+            tracker.record(time.perf_counter() - started[future])
+            return items
+    raise error
+
+
+def call_single_engine(query: str, engine_name: str, engine_code: str, max_retries: int = 3,
+                       deadline: Optional[Deadline] = None) -> List[Dict]:
+    """
+    获取单个搜索引擎的结果：先查搜索缓存，未命中时调用引擎并写入缓存
+
+    Args:
+        query: 搜索查询
+        engine_name: 引擎名称（用于标识）
+        engine_code: 引擎代码（API参数）
+        max_retries: 最大重试次数
+        deadline: 请求截止时间
+
+    Returns:
+        搜索结果列表，每个结果包含 {url, title, content, engine}
+    """
+    cached = lookup_search_cache(query, engine_name, engine_code)
+    if cached is not None:
+        return cached
+    results = fetch_single_engine(query, engine_name, engine_code, max_retries, deadline)
+    store_search_cache(query, engine_name, results)
+    return results
+
+
+def fetch_single_engine(query: str, engine_name: str, engine_code: str, max_retries: int = 3,
+                        deadline: Optional[Deadline] = None) -> List[Dict]:
+    """
+    调用单个搜索引擎获取结果（不经过缓存）
 
-            # 格式化结果
-            results = []
-            for item in items[:10]:  # 只取top10
-                results.append({
-                    'url': item.get('link', ''),
-                    'title': item.get('title', ''),
-                    'content': item.get('content', ''),
-                    'engine': engine_name
-                })
+    Args:
+        query: 搜索查询
+        engine_name: 引擎名称（用于标识）
+        engine_code: 引擎代码（API参数）
+        max_retries: 最大重试次数
+        deadline: 请求截止时间，单次请求的超时和重试都不超过它
 
+    Returns:
+        搜索结果列表，每个结果包含 {url, title, content, engine}
+    """
+    headers, data = build_search_request(query, engine_name, engine_code)
+    session = get_session(API_URL)
+    breaker = get_breaker(engine_name)
+
+    for attempt in range(max_retries):
+        # 先看截止时间再占用熔断器名额：half_open 下 allow() 会占用探测名额
+        if deadline and deadline.expired():
+            return []
+        if not breaker.allow():
+            print(f"✗ {engine_name} 已熔断，跳过该引擎")
+            return []
+        timeout = deadline.timeout(SEARCH_TIMEOUT) if deadline else SEARCH_TIMEOUT
+        start = time.perf_counter()
+        recorded = False
+        try:
+            items = fetch_hedged(engine_name, fetch_top_items, session, headers, data,
+                                 timeout=timeout, deadline=deadline)
+
+            breaker.record(True, time.perf_counter() - start)
+            recorded = True
+            results = format_search_items(items, engine_name)
             print(f"✓ {engine_name}: 获取到 {len(results)} 条结果")
             return results
 
         except Exception as e:
+            # 调用方预算截断的超时不记为引擎失败，否则几个 deadline_ms 很小的请求就能让所有流量熔断
+            if not recorded and not budget_exhausted(deadline, timeout, SEARCH_TIMEOUT):
+                breaker.record(False, time.perf_counter() - start)
+                recorded = True
             print(f"✗ {engine_name} 第{attempt+1}次尝试失败: {str(e)}")
             if attempt < max_retries - 1:
-                time.sleep(1)  # 重试前等待1秒
+                delay = backoff_delay(attempt, SEARCH_RETRY_BASE, SEARCH_RETRY_CAP)
+                time.sleep(deadline.timeout(delay) if deadline else delay)
             else:
                 print(f"✗ {engine_name} 所有重试失败，跳过该引擎")
                 return []
+        finally:
+            # 被取消（异步任务到达截止时间时）等没有得出结果的情况，归还名额
+            if not recorded:
+                breaker.release()
 
     return []
 
 
-def search_all_engines(query: str, selected_engines: List[str] = None, max_workers: int = 6) -> List[Dict]:
+def fetch_and_cache(query: str, engine_name: str, engine_code: str,
+                    deadline: Optional[Deadline] = None) -> List[Dict]:
+    """调用引擎并写入搜索缓存（调用方已查过缓存）"""
+    results = fetch_single_engine(query, engine_name, engine_code, deadline=deadline)
+    store_search_cache(query, engine_name, results)
+    return results
+
+
+def resolve_engines(selected_engines: List[str] = None) -> Dict[str, str]:
+    """
+    根据前端选中的引擎列表确定实际要调用的引擎
+
+    Args:
+        selected_engines: 选中的搜索引擎列表，为空时调用所有引擎
+
+    Returns:
+        {引擎名称: 引擎代码}
+    """
+    if selected_engines:
+        return {k: v for k, v in SEARCH_ENGINES.items() if k in selected_engines}
+    return SEARCH_ENGINES
+
+
+def plan_search(query: str, selected_engines: List[str] = None, engine_mode: Optional[str] = None,
+                deadline: Optional[Deadline] = None) -> Tuple[List[Dict], Dict[str, str], Dict]:
+    """
+    先查搜索缓存，再按引擎模式决定还需要调用哪些引擎
+
+    Args:
+        query: 搜索查询
+        selected_engines: 选中的搜索引擎列表
+        engine_mode: 'all' 或 'adaptive'，None时使用 SEARCH_ENGINE_MODE
+        deadline: 请求截止时间（adaptive 模式以剩余时间作为延迟预算）
+
+    Returns:
+        (命中缓存的结果, 需要调用的引擎 {名称: 代码}, 引擎选择信息 {mode, latency_budget_ms, engines})
+    """
+    engines_to_use = resolve_engines(selected_engines)
+    cached_results = []
+    cached_engines = []
+    for name, code in engines_to_use.items():
+        cached = lookup_search_cache(query, name, code)
+        if cached is not None:
+            cached_results.extend(cached)
+            cached_engines.append(name)
+
+    mode = engine_mode or ENGINE_MODE
+    budget_ms = deadline.remaining() * 1000 if deadline else ENGINE_LATENCY_BUDGET_MS
+    to_fetch, decisions = select_engines(engines_to_use, cached_engines, mode, budget_ms,
+                                         lambda name: get_latency_tracker(name).percentile(0.9))
+    for name, decision in decisions.items():
+        if not decision['selected']:
+            print(f"  跳过引擎 {name}: {decision['reason']}")
+    return cached_results, to_fetch, {'mode': mode, 'latency_budget_ms': round(budget_ms), 'engines': decisions}
+
+
+def search_all_engines(query: str, selected_engines: List[str] = None, max_workers: int = 6,
+                       deadline: Optional[Deadline] = None, engine_mode: Optional[str] = None) -> Tuple[List[Dict], Dict]:
     """
     并行调用搜索引擎获取结果
 
@@ -84,60 +710,278 @@ def search_all_engines(query: str, selected_engines: List[str] = None, max_worke
         query: 搜索查询
         selected_engines: 选中的搜索引擎列表，如 ['google', 'bing']。如果为None则调用所有引擎
         max_workers: 最大并发数
+        deadline: 请求截止时间，届时仍未返回的引擎被放弃
+        engine_mode: 'all' 或 'adaptive'（只调用产出与耗时划算的引擎）
 
     Returns:
-        搜索引擎的结果列表
+        (搜索引擎的结果列表, 引擎选择信息)
     """
-    # 确定要调用哪些引擎
-    engines_to_use = SEARCH_ENGINES
-    if selected_engines:
-        engines_to_use = {k: v for k, v in SEARCH_ENGINES.items() if k in selected_engines}
+    # 先查缓存，再确定要调用哪些引擎
+    all_results, uncached, selection = plan_search(query, selected_engines, engine_mode, deadline)
 
     print(f"\n开始搜索: '{query}'")
-    print(f"并行调用 {len(engines_to_use)} 个搜索引擎...")
+    print(f"并行调用 {len(uncached)} 个搜索引擎...")
     if selected_engines:
-        print(f"选中引擎: {', '.join(engines_to_use.keys())}")
+        print(f"选中引擎: {', '.join(resolve_engines(selected_engines).keys())}")
 
-    all_results = []
+    # 全部命中缓存时不再调用任何引擎
+    if not uncached:
+        print(f"\n搜索完成（全部命中缓存）! 共获取 {len(all_results)} 条结果")
+        return all_results, selection
 
-    # 使用线程池并行调用
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    # 使用线程池并行调用（到截止时间后不再等待未返回的引擎）
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
         # 提交所有任务
         future_to_engine = {
-            executor.submit(call_single_engine, query, name, code): name
-            for name, code in engines_to_use.items()
+            submit_in_context(executor, fetch_and_cache, query, name, code, deadline): name
+            for name, code in uncached.items()
         }
 
         # 收集结果
-        for future in as_completed(future_to_engine):
+        for future in iter_completed(future_to_engine, deadline, 'search'):
             engine_name = future_to_engine[future]
             try:
                 results = future.result()
                 all_results.extend(results)
             except Exception as e:
                 print(f"✗ {engine_name} 执行失败: {str(e)}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
     print(f"\n搜索完成! 共获取 {len(all_results)} 条结果")
-    return all_results
+    return all_results, selection
 
 
-def get_search_results(query: str, selected_engines: List[str] = None) -> Tuple[List[Dict], Dict]:
+def get_search_results(query: str, selected_engines: List[str] = None,
+                       deadline: Optional[Deadline] = None, engine_mode: Optional[str] = None) -> Tuple[List[Dict], Dict]:
     """
     获取搜索结果并返回统计信息
 
     Args:
         query: 搜索查询
         selected_engines: 选中的搜索引擎列表，如 ['google', 'bing']
+        deadline: 请求截止时间
+        engine_mode: 'all' 或 'adaptive'
+
+    Returns:
+        (结果列表, 统计信息字典，含每个引擎被选中或跳过的原因 engine_selection)
+    """
+    results, selection = search_all_engines(query, selected_engines, deadline=deadline, engine_mode=engine_mode)
+    stats = build_search_stats(results, resolve_engines(selected_engines))
+    stats['engine_selection'] = selection
+    return results, stats
+
+
+# 异步客户端：每个事件循环一个httpx.AsyncClient，按host复用连接
+ASYNC_POOL_MAX_CONNECTIONS = 256
+
+_async_http_clients = LoopLocal(lambda: httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=ASYNC_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=ASYNC_POOL_MAX_CONNECTIONS
+    )
+))
+
+
+async def _release_async_response(response: httpx.Response):
+    """释放异步流式响应，逻辑同 _release_response"""
+    try:
+        remaining = int(response.headers.get('Content-Length', -1))
+    except ValueError:
+        remaining = -1
+    if 0 <= remaining <= DRAIN_LIMIT_BYTES:
+        try:
+            async for _ in response.aiter_raw():
+                pass
+        except Exception:
+            pass
+    await response.aclose()
+
+
+async def fetch_top_items_async(client: httpx.AsyncClient, headers: Dict, data: Dict,
+                                timeout: float = SEARCH_TIMEOUT) -> List[Dict]:
+    """fetch_top_items 的异步版本"""
+    request = client.build_request('POST', API_URL, headers=headers, content=json.dumps(data), timeout=timeout)
+    response = await client.send(request, stream=True)
+    try:
+        parser = TopResultsParser(TOP_N_RESULTS)
+        async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+            if parser.feed(chunk):
+                break
+        return parser.items if parser.items is not None else parser.finish()
+    finally:
+        await _release_async_response(response)
+
+
+async def fetch_hedged_async(engine_name: str, fetch, *args, timeout: float = SEARCH_TIMEOUT,
+                             deadline: Optional[Deadline] = None) -> List[Dict]:
+    """fetch_hedged 的异步版本：先返回的请求胜出后，另一个请求直接取消"""
+    tracker = get_latency_tracker(engine_name)
+    _hedge_budget.on_request()
+    delay = hedge_delay(engine_name)
+    start = time.perf_counter()
+    if delay is None:
+        items = await fetch(*args, timeout=timeout)
+        tracker.record(time.perf_counter() - start)
+        return items
+
+    primary = asyncio.ensure_future(fetch(*args, timeout=timeout))
+    started = {primary: start}
+    try:
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        hedge_timeout = deadline.timeout(timeout) if deadline else timeout
+        if not done and hedge_timeout > 0 and _hedge_budget.try_acquire():
+            print(f"↻ {engine_name} 超过 {delay * 1000:.0f}ms 未返回，发出对冲请求")
+            started[asyncio.ensure_future(fetch(*args, timeout=hedge_timeout))] = time.perf_counter()
+
+        pending, error = set(started), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task is not primary:
+                    _hedge_budget.on_hedge_win()
+                tracker.record(time.perf_counter() - started[task])
+                return task.result()
+        raise error
+    finally:
+        for task in started:
+            task.cancel()
+
+
+async def call_single_engine_async(query: str, engine_name: str, engine_code: str, max_retries: int = 3,
+                                   deadline: Optional[Deadline] = None) -> List[Dict]:
+    """call_single_engine 的异步版本（缓存过期时的后台刷新走同步线程池）"""
+    cached = lookup_search_cache(query, engine_name, engine_code)
+    if cached is not None:
+        return cached
+    results = await fetch_single_engine_async(query, engine_name, engine_code, max_retries, deadline)
+    store_search_cache(query, engine_name, results)
+    return results
+
+
+async def fetch_and_cache_async(query: str, engine_name: str, engine_code: str,
+                                deadline: Optional[Deadline] = None) -> List[Dict]:
+    """fetch_and_cache 的异步版本"""
+    results = await fetch_single_engine_async(query, engine_name, engine_code, deadline=deadline)
+    store_search_cache(query, engine_name, results)
+    return results
+
+
+async def fetch_single_engine_async(query: str, engine_name: str, engine_code: str, max_retries: int = 3,
+                                    deadline: Optional[Deadline] = None) -> List[Dict]:
+    """
+    fetch_single_engine 的异步版本：在事件循环上发起请求并流式解析响应
+
+    Args:
+        query: 搜索查询
+        engine_name: 引擎名称（用于标识）
+        engine_code: 引擎代码（API参数）
+        max_retries: 最大重试次数
+        deadline: 请求截止时间
+
+    Returns:
+        搜索结果列表，每个结果包含 {url, title, content, engine}
+    """
+    headers, data = build_search_request(query, engine_name, engine_code)
+    client = _async_http_clients.get()
+    breaker = get_breaker(engine_name)
+
+    for attempt in range(max_retries):
+        # 先看截止时间再占用熔断器名额：half_open 下 allow() 会占用探测名额
+        if deadline and deadline.expired():
+            return []
+        if not breaker.allow():
+            print(f"✗ {engine_name} 已熔断，跳过该引擎")
+            return []
+        timeout = deadline.timeout(SEARCH_TIMEOUT) if deadline else SEARCH_TIMEOUT
+        start = time.perf_counter()
+        recorded = False
+        try:
+            items = await fetch_hedged_async(engine_name, fetch_top_items_async, client, headers, data,
+                                             timeout=timeout, deadline=deadline)
+
+            breaker.record(True, time.perf_counter() - start)
+            recorded = True
+            results = format_search_items(items, engine_name)
+            print(f"✓ {engine_name}: 获取到 {len(results)} 条结果")
+            return results
+
+        except Exception as e:
+            # 调用方预算截断的超时不记为引擎失败，否则几个 deadline_ms 很小的请求就能让所有流量熔断
+            if not recorded and not budget_exhausted(deadline, timeout, SEARCH_TIMEOUT):
+                breaker.record(False, time.perf_counter() - start)
+                recorded = True
+            print(f"✗ {engine_name} 第{attempt+1}次尝试失败: {str(e)}")
+            if attempt < max_retries - 1:
+                delay = backoff_delay(attempt, SEARCH_RETRY_BASE, SEARCH_RETRY_CAP)
+                await asyncio.sleep(deadline.timeout(delay) if deadline else delay)
+            else:
+                print(f"✗ {engine_name} 所有重试失败，跳过该引擎")
+                return []
+        finally:
+            # 被取消（异步任务到达截止时间时）等没有得出结果的情况，归还名额
+            if not recorded:
+                breaker.release()
+
+    return []
+
+
+async def get_search_results_async(query: str, selected_engines: List[str] = None,
+                                   deadline: Optional[Deadline] = None,
+                                   engine_mode: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+    """
+    get_search_results 的异步版本：在同一个事件循环上并发调用所有引擎
+
+    Args:
+        query: 搜索查询
+        selected_engines: 选中的搜索引擎列表，如 ['google', 'bing']
+        deadline: 请求截止时间，届时仍未返回的引擎被取消
+        engine_mode: 'all' 或 'adaptive'
 
     Returns:
         (结果列表, 统计信息字典)
     """
-    results = search_all_engines(query, selected_engines)
+    all_results, uncached, selection = plan_search(query, selected_engines, engine_mode, deadline)
+    print(f"\n开始异步搜索: '{query}'，并发调用 {len(uncached)} 个搜索引擎...")
 
-    # 统计信息
+    tasks = {
+        asyncio.ensure_future(fetch_and_cache_async(query, name, code, deadline)): name
+        for name, code in uncached.items()
+    }
+    done = await wait_until(tasks, deadline, 'search')
+    for task, engine_name in tasks.items():
+        if task not in done:
+            continue
+        if task.exception() is not None:
+            print(f"✗ {engine_name} 执行失败: {str(task.exception())}")
+            continue
+        all_results.extend(task.result())
+
+    print(f"\n搜索完成! 共获取 {len(all_results)} 条结果")
+    stats = build_search_stats(all_results, resolve_engines(selected_engines))
+    stats['engine_selection'] = selection
+    return all_results, stats
+
+
+def build_search_stats(results: List[Dict], engine_names: Iterable[str] = ()) -> Dict:
+    """
+    统计各引擎返回的结果数
+
+    Args:
+        results: 搜索结果列表
+        engine_names: 本次调用的引擎，附带其熔断器状态
+
+    Returns:
+        统计信息字典 {total_results, engines, circuit_breakers}
+    """
     stats = {
         'total_results': len(results),
-        'engines': {}
+        'engines': {},
+        'circuit_breakers': get_breaker_stats(engine_names)
     }
 
     for result in results:
@@ -146,7 +990,7 @@ def get_search_results(query: str, selected_engines: List[str] = None) -> Tuple[
             stats['engines'][engine] = 0
         stats['engines'][engine] += 1
 
-    return results, stats
+    return stats
 
 
 # 测试代码
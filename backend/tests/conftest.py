@@ -0,0 +1,9 @@
+"""
+测试公共配置：与 app.py 一样把 services 目录加入 sys.path，模块按裸名导入
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'services'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'scripts'))
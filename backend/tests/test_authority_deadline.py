@@ -0,0 +1,113 @@
+"""权威性打分与请求截止时间的配合"""
+import threading
+import time
+
+import pytest
+
+import authority_scorer
+from deadline import Deadline, DeadlineExceeded
+
+
+class FakeWhitelist:
+    def __init__(self):
+        self.added = {}
+
+    def get_score(self, host):
+        return self.added.get(host, (None, None))
+
+    def add_host(self, host, score, reason):
+        self.added[host] = (score, reason)
+
+
+@pytest.fixture(autouse=True)
+def whitelist(monkeypatch):
+    whitelist = FakeWhitelist()
+    monkeypatch.setattr(authority_scorer, 'get_whitelist', lambda: whitelist)
+    return whitelist
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """替换LLM调用：按 behavior 决定失败、阻塞或返回标签，并记录每次调用的 timeout 与 deadline"""
+    calls = []
+    state = {'behavior': 'fail', 'release': threading.Event()}
+
+    def get_response(messages, timeout=None, deadline=None):
+        calls.append((timeout, deadline))
+        if state['behavior'] == 'block':
+            # 模拟被截止时间截断的调用：阻塞到放行后失败
+            state['release'].wait(2)
+            raise RuntimeError('timed out')
+        if state['behavior'] == 'fail':
+            raise RuntimeError('upstream error')
+        return None, '{"标签": 3, "判断依据": "官方网站"}'
+
+    monkeypatch.setattr(authority_scorer, 'get_response', get_response)
+    return calls, state
+
+
+def test_request_authority_stops_retrying_after_deadline(llm):
+    calls, _ = llm
+    deadline = Deadline(300)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        authority_scorer.request_authority('example.com', max_retries=5, deadline=deadline)
+    assert time.monotonic() - start < 0.5
+    assert len(calls) == 1
+    assert calls[0][1] is deadline
+    assert calls[0][0] <= 0.3
+
+
+def test_request_authority_without_deadline_retries(llm, monkeypatch):
+    calls, _ = llm
+    monkeypatch.setattr(authority_scorer.time, 'sleep', lambda seconds: None)
+    assert authority_scorer.request_authority('example.com', max_retries=3) == (-1, '打分失败')
+    assert len(calls) == 3
+
+
+def test_score_authority_passes_deadline(llm, whitelist):
+    calls, state = llm
+    state['behavior'] = 'ok'
+    deadline = Deadline(5000)
+    assert authority_scorer.score_authority('example.com', fast=False, deadline=deadline) == (3, '官方网站')
+    assert calls[0][1] is deadline
+    assert whitelist.added['example.com'] == (3, '官方网站')
+
+
+def test_follower_retries_when_leader_deadline_expires(llm):
+    calls, state = llm
+    state['behavior'] = 'block'
+    outcome = {}
+
+    def leader():
+        try:
+            authority_scorer.score_authority('example.com', fast=False, deadline=Deadline(100))
+        except DeadlineExceeded:
+            outcome['leader'] = 'expired'
+
+    def follower():
+        outcome['follower'] = authority_scorer.score_authority('example.com', fast=False)
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    time.sleep(0.15)
+    # 领头方的第一次尝试失败时已过截止时间，不再重试；等待同一结果的请求自己重新发起
+    state['behavior'] = 'ok'
+    state['release'].set()
+    for thread in threads:
+        thread.join()
+    assert outcome == {'leader': 'expired', 'follower': (3, '官方网站')}
+    assert len(calls) == 2
+
+
+def test_batch_leaves_expired_hosts_unscored(llm):
+    _, state = llm
+    state['behavior'] = 'block'
+    deadline = Deadline(100)
+    results = [{'host': 'example.com', 'url': 'https://example.com'}]
+    scored = authority_scorer.score_authority_batch(results, deadline=deadline)
+    state['release'].set()
+    assert scored[0]['authority_status'] == 'unscored'
+    assert 'authority' in deadline.timed_out_stages
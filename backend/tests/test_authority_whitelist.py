@@ -0,0 +1,137 @@
+"""白名单快照 + 追加日志：写入、重放、合并与失败恢复"""
+import json
+import os
+
+import pytest
+
+import authority_whitelist
+from authority_whitelist import AuthorityWhitelist, DEFAULT_WHITELIST, read_journal
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'whitelist.json'), str(tmp_path / 'whitelist.journal')
+
+
+@pytest.fixture
+def open_whitelist(paths):
+    opened = []
+
+    def _open():
+        whitelist = AuthorityWhitelist(*paths)
+        opened.append(whitelist)
+        return whitelist
+
+    yield _open
+    for whitelist in opened:
+        whitelist.close()
+
+
+def read_snapshot(whitelist_file):
+    with open(whitelist_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_first_run_writes_default_snapshot(paths, open_whitelist):
+    open_whitelist()
+    assert read_snapshot(paths[0]) == DEFAULT_WHITELIST
+
+
+def test_add_host_appends_to_journal_not_snapshot(paths, open_whitelist):
+    whitelist = open_whitelist()
+    whitelist.add_host('example.com', 3, '示例')
+    assert whitelist.get_score('www.example.com') == (3, '示例')
+    whitelist.flush()
+    assert list(read_journal(paths[1])) == [('example.com', {'score': 3, 'reason': '示例'})]
+    assert 'example.com' not in read_snapshot(paths[0])
+
+
+def test_invalid_score_is_ignored(open_whitelist):
+    whitelist = open_whitelist()
+    whitelist.add_host('example.com', 7, '无效')
+    assert whitelist.get_score('example.com') == (None, None)
+
+
+def test_reopen_replays_journal(open_whitelist):
+    whitelist = open_whitelist()
+    whitelist.add_host('example.com', 3, '示例')
+    whitelist.close()
+    assert open_whitelist().get_score('example.com') == (3, '示例')
+
+
+def test_close_flushes_pending(paths, open_whitelist):
+    whitelist = open_whitelist()
+    whitelist.add_host('example.com', 2, '示例')
+    whitelist.close()
+    assert [host for host, _ in read_journal(paths[1])] == ['example.com']
+
+
+def test_partial_last_journal_line_is_skipped(paths, open_whitelist):
+    whitelist = open_whitelist()
+    whitelist.add_host('example.com', 3, '示例')
+    whitelist.close()
+    with open(paths[1], 'a', encoding='utf-8') as f:
+        f.write('{"host": "half.com", "sco')
+    reopened = open_whitelist()
+    assert reopened.get_score('example.com') == (3, '示例')
+    assert reopened.get_score('half.com') == (None, None)
+
+
+def test_compaction_merges_journal_into_snapshot(paths, open_whitelist, monkeypatch):
+    monkeypatch.setattr(authority_whitelist, 'COMPACT_MIN_ENTRIES', 3)
+    monkeypatch.setattr(authority_whitelist, 'COMPACT_RATIO', 0)
+    whitelist = open_whitelist()
+    for i in range(3):
+        whitelist.add_host(f'host{i}.com', 2, '示例')
+    whitelist.flush()
+
+    assert os.path.getsize(paths[1]) == 0
+    assert whitelist._journal_entries == 0
+    snapshot = read_snapshot(paths[0])
+    assert all(f'host{i}.com' in snapshot for i in range(3))
+
+
+def test_failed_compaction_keeps_journal(paths, open_whitelist, monkeypatch):
+    monkeypatch.setattr(authority_whitelist, 'COMPACT_MIN_ENTRIES', 3)
+    monkeypatch.setattr(authority_whitelist, 'COMPACT_RATIO', 0)
+    whitelist = open_whitelist()
+
+    def disk_full(src, dst):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(authority_whitelist.os, 'replace', disk_full)
+    for i in range(3):
+        whitelist.add_host(f'host{i}.com', 2, '示例')
+    whitelist.flush()
+
+    assert len(list(read_journal(paths[1]))) == 3
+    assert whitelist._journal_entries == 3
+    assert not os.path.exists(paths[0] + '.tmp')
+    assert 'host0.com' not in read_snapshot(paths[0])
+    whitelist.close()
+
+    # 重启后从日志恢复
+    monkeypatch.undo()
+    assert open_whitelist().get_score('host2.com') == (2, '示例')
+
+
+def test_compaction_retries_after_failure(paths, open_whitelist, monkeypatch):
+    monkeypatch.setattr(authority_whitelist, 'COMPACT_MIN_ENTRIES', 3)
+    monkeypatch.setattr(authority_whitelist, 'COMPACT_RATIO', 0)
+    whitelist = open_whitelist()
+    replace = os.replace
+
+    def disk_full(src, dst):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(authority_whitelist.os, 'replace', disk_full)
+    for i in range(3):
+        whitelist.add_host(f'host{i}.com', 2, '示例')
+    whitelist.flush()
+
+    monkeypatch.setattr(authority_whitelist.os, 'replace', replace)
+    whitelist.add_host('host3.com', 2, '示例')
+    whitelist.flush()
+    assert os.path.getsize(paths[1]) == 0
+    snapshot = read_snapshot(paths[0])
+    assert all(f'host{i}.com' in snapshot for i in range(4))
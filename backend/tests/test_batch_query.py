@@ -0,0 +1,177 @@
+"""离线批量查询：输入解析、检查点推进与中断后续跑"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import batch_query
+from batch_query import Checkpoint, parse_request
+
+
+class Crash(Exception):
+    """模拟运行中途进程被杀"""
+
+
+@pytest.fixture
+def fake_run(monkeypatch):
+    """用线程池代替进程池，run_line 只回显行内容；crash_at 中的行号第一次执行时抛出 Crash"""
+    calls = []
+    crash_at = set()
+    lock = threading.Lock()
+
+    def run_line(line_no, raw):
+        with lock:
+            calls.append(line_no)
+            if line_no in crash_at:
+                crash_at.discard(line_no)
+                raise Crash(line_no)
+        query = json.loads(raw)
+        return query != 'bad', json.dumps({'line': line_no, 'query': query}, ensure_ascii=False)
+
+    monkeypatch.setattr(batch_query, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(batch_query, 'init_worker', lambda verbose: None)
+    monkeypatch.setattr(batch_query, 'run_line', run_line)
+    return calls, crash_at
+
+
+@pytest.fixture
+def files(tmp_path):
+    input_path = tmp_path / 'queries.jsonl'
+    output_path = tmp_path / 'results.jsonl'
+    return input_path, output_path, tmp_path / 'results.jsonl.ckpt'
+
+
+def write_queries(path, queries):
+    path.write_text(''.join(json.dumps(q, ensure_ascii=False) + '\n' for q in queries), encoding='utf-8')
+
+
+def run(files, max_in_flight=1, restart=False):
+    input_path, output_path, checkpoint_path = files
+    batch_query.run(str(input_path), str(output_path), str(checkpoint_path), workers=1,
+                    max_in_flight=max_in_flight, restart=restart, progress_interval=3600, verbose=False)
+
+
+def output_lines(path):
+    return [json.loads(line)['line'] for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_parse_request_accepts_string_and_defaults():
+    assert parse_request(b'"  abc  "\n') == {
+        'query': 'abc', 'selected_engines': [], 'top_k': None, 'deadline_ms': None, 'engine_mode': None
+    }
+
+
+@pytest.mark.parametrize('raw', [
+    b'not json',
+    b'{"query": "  "}',
+    b'[1, 2]',
+    b'{"query": "a", "top_k": 0}',
+    b'{"query": "a", "top_k": true}',
+    b'{"query": "a", "deadline_ms": "3000"}',
+    b'{"query": "a", "engine_mode": "fastest"}',
+])
+def test_parse_request_rejects_invalid(raw):
+    with pytest.raises(ValueError):
+        parse_request(raw)
+
+
+def test_mark_done_advances_watermark_over_holes():
+    checkpoint = Checkpoint('unused', 'queries.jsonl')
+    offsets = {0: 0, 1: 10, 2: 20, 3: 30, 4: 40}
+    checkpoint.mark_done(2, offsets)
+    assert (checkpoint.watermark, checkpoint.input_offset, checkpoint.done_above) == (0, 0, {2})
+    checkpoint.mark_done(0, offsets)
+    assert (checkpoint.watermark, checkpoint.input_offset, checkpoint.done_above) == (1, 10, {2})
+    checkpoint.mark_done(1, offsets)
+    assert (checkpoint.watermark, checkpoint.input_offset, checkpoint.done_above) == (3, 30, set())
+    assert 0 not in offsets and 2 not in offsets
+    assert checkpoint.is_done(2) and not checkpoint.is_done(3)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'ckpt')
+    checkpoint = Checkpoint(path, 'queries.jsonl')
+    checkpoint.watermark, checkpoint.input_offset, checkpoint.done_above = 3, 30, {5, 7}
+    checkpoint.output_offset, checkpoint.succeeded, checkpoint.failed = 99, 4, 1
+    checkpoint.save()
+
+    loaded = Checkpoint(path, 'queries.jsonl')
+    assert loaded.load()
+    assert vars(loaded) == vars(checkpoint)
+    assert not Checkpoint(str(tmp_path / 'missing'), 'queries.jsonl').load()
+    with pytest.raises(ValueError):
+        Checkpoint(path, 'other.jsonl').load()
+
+
+def test_run_writes_every_line(files, fake_run):
+    calls, _ = fake_run
+    write_queries(files[0], ['a', 'bad', 'c', 'd'])
+    run(files, max_in_flight=3)
+    assert sorted(output_lines(files[1])) == [0, 1, 2, 3]
+    assert sorted(calls) == [0, 1, 2, 3]
+
+    checkpoint = Checkpoint(str(files[2]), str(files[0]))
+    checkpoint.load()
+    assert (checkpoint.watermark, checkpoint.succeeded, checkpoint.failed) == (4, 3, 1)
+
+
+def test_blank_lines_are_skipped(files, fake_run):
+    calls, _ = fake_run
+    files[0].write_text('"a"\n\n"c"\n', encoding='utf-8')
+    run(files)
+    assert calls == [0, 2]
+    assert output_lines(files[1]) == [0, 2]
+
+
+def test_resume_after_crash_skips_written_lines(files, fake_run):
+    calls, crash_at = fake_run
+    write_queries(files[0], [f'q{i}' for i in range(6)])
+    crash_at.add(3)
+    with pytest.raises(Crash):
+        run(files)
+    assert output_lines(files[1]) == [0, 1, 2]
+
+    calls.clear()
+    run(files)
+    assert calls == [3, 4, 5]
+    assert output_lines(files[1]) == [0, 1, 2, 3, 4, 5]
+
+
+def test_resume_truncates_unrecorded_output(files, fake_run):
+    calls, crash_at = fake_run
+    write_queries(files[0], [f'q{i}' for i in range(4)])
+    crash_at.add(2)
+    with pytest.raises(Crash):
+        run(files)
+    # 检查点之后写出一半的行
+    with open(files[1], 'a', encoding='utf-8') as f:
+        f.write('{"line": 2, "que')
+
+    calls.clear()
+    run(files)
+    assert calls == [2, 3]
+    assert output_lines(files[1]) == [0, 1, 2, 3]
+
+
+def test_resume_with_many_in_flight_writes_each_line_once(files, fake_run):
+    calls, crash_at = fake_run
+    write_queries(files[0], [f'q{i}' for i in range(40)])
+    crash_at.add(17)
+    with pytest.raises(Crash):
+        run(files, max_in_flight=4)
+    run(files, max_in_flight=4)
+    assert sorted(output_lines(files[1])) == list(range(40))
+
+
+def test_restart_ignores_checkpoint(files, fake_run):
+    calls, crash_at = fake_run
+    write_queries(files[0], ['a', 'b', 'c'])
+    crash_at.add(1)
+    with pytest.raises(Crash):
+        run(files)
+
+    calls.clear()
+    run(files, restart=True)
+    assert calls == [0, 1, 2]
+    assert output_lines(files[1]) == [0, 1, 2]
@@ -0,0 +1,113 @@
+"""熔断器状态转换"""
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, backoff_delay
+
+
+def make_breaker(**kwargs):
+    options = dict(window_size=10, min_calls=4, failure_rate_threshold=0.5, slow_call_seconds=1.0,
+                   open_seconds=60.0, half_open_probes=1)
+    options.update(kwargs)
+    return CircuitBreaker('test', **options)
+
+
+def trip(breaker):
+    """连续失败直到熔断"""
+    for _ in range(breaker.min_calls):
+        assert breaker.allow()
+        breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+
+
+def expire_open(breaker):
+    """跳过冷却时间"""
+    breaker._opened_at = time.monotonic() - breaker.open_seconds
+
+
+def test_stays_closed_below_min_calls():
+    breaker = make_breaker()
+    for _ in range(breaker.min_calls - 1):
+        breaker.record(False, 0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_stays_closed_below_failure_rate():
+    breaker = make_breaker()
+    for success in (True, True, True, False, True, False):
+        breaker.record(success, 0.01)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_failure_rate_and_rejects():
+    breaker = make_breaker()
+    trip(breaker)
+    assert not breaker.allow()
+    stats = breaker.get_stats()
+    assert stats['rejected'] == 1
+    assert stats['open_count'] == 1
+    assert stats['retry_in_seconds'] > 0
+
+
+def test_slow_successes_count_as_failures():
+    breaker = make_breaker()
+    for _ in range(breaker.min_calls):
+        breaker.record(True, breaker.slow_call_seconds + 0.5)
+    assert breaker.state == OPEN
+
+
+def test_half_open_after_cooldown_allows_single_probe():
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open(breaker)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_and_clears_window():
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open(breaker)
+    assert breaker.allow()
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    assert breaker.get_stats()['failure_rate'] == 0.0
+
+
+def test_probe_failure_reopens():
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open(breaker)
+    assert breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    assert breaker.get_stats()['open_count'] == 2
+
+
+def test_release_returns_probe_without_outcome():
+    breaker = make_breaker()
+    trip(breaker)
+    expire_open(breaker)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_release_is_noop_when_closed():
+    breaker = make_breaker()
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CLOSED
+    assert breaker.get_stats()['recent_calls'] == 0
+
+
+@pytest.mark.parametrize('attempt', [0, 1, 5, 20])
+def test_backoff_delay_within_cap(attempt):
+    for _ in range(50):
+        delay = backoff_delay(attempt, base=0.5, cap=4.0)
+        assert 0 <= delay <= min(4.0, 0.5 * 2 ** attempt)
@@ -0,0 +1,80 @@
+"""host归一化与域名规则树"""
+import pytest
+
+from host_rules import HostRuleTrie, host_variants, is_rule_pattern, normalize_host
+
+
+@pytest.mark.parametrize('host, expected', [
+    ('User@WWW.PKU.edu.cn:443', 'pku.edu.cn'),
+    ('m.example.com', 'example.com'),
+    ('example.com.', 'example.com'),
+    ('www.example.com.:80', 'example.com'),
+    ('  Example.COM  ', 'example.com'),
+    ('www.cn', 'www.cn'),
+    ('m.cn', 'm.cn'),
+    ('[::1]:80', '[::1]'),
+    ('user@[2001:db8::1]', '[2001:db8::1]'),
+    ('', ''),
+    (None, ''),
+])
+def test_normalize_host(host, expected):
+    assert normalize_host(host) == expected
+
+
+def test_host_variants():
+    assert host_variants('pku.edu.cn') == ['pku.edu.cn', 'www.pku.edu.cn', 'm.pku.edu.cn']
+
+
+@pytest.mark.parametrize('host, expected', [
+    ('*.gov.cn', True),
+    ('.gov.cn', True),
+    ('gov.cn', False),
+])
+def test_is_rule_pattern(host, expected):
+    assert is_rule_pattern(host) is expected
+
+
+@pytest.fixture
+def trie():
+    trie = HostRuleTrie()
+    trie.add('*.edu.cn', 2, '高校')
+    trie.add('*.pku.edu.cn', 3, '北大')
+    trie.add('.gov.cn', 3, '政府')
+    return trie
+
+
+def test_most_specific_rule_wins(trie):
+    assert trie.match('news.pku.edu.cn') == (3, '北大')
+    assert trie.match('www.tsinghua.edu.cn') == (2, '高校')
+
+
+def test_wildcard_excludes_apex(trie):
+    assert trie.match('edu.cn') is None
+    # pku.edu.cn 不是 *.pku.edu.cn 的子域名，落到 *.edu.cn
+    assert trie.match('pku.edu.cn') == (2, '高校')
+
+
+def test_dot_rule_includes_apex(trie):
+    assert trie.match('gov.cn') == (3, '政府')
+    assert trie.match('www.beijing.gov.cn') == (3, '政府')
+
+
+def test_no_match(trie):
+    assert trie.match('example.com') is None
+    assert trie.match('cn') is None
+    assert trie.match('edu.cn.example.com') is None
+
+
+def test_size_counts_distinct_domains():
+    trie = HostRuleTrie()
+    trie.add('*.edu.cn', 2, '高校')
+    trie.add('.edu.cn', 3, '高校')
+    assert trie.size == 1
+    assert trie.match('edu.cn') == (3, '高校')
+    assert trie.match('pku.edu.cn') == (3, '高校')
+
+
+def test_pattern_is_case_insensitive():
+    trie = HostRuleTrie()
+    trie.add('*.EDU.cn', 2, '高校')
+    assert trie.match(normalize_host('WWW.PKU.EDU.CN')) == (2, '高校')
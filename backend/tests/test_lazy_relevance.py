@@ -0,0 +1,74 @@
+"""惰性相关性打分的调度：按权威性分档，只给能进入前top_k的结果打分"""
+import pytest
+
+from query_pipeline import iter_lazy_relevance
+from result_processor import TIMEOUT_REASON
+
+
+def drive(authority_scores, top_k, relevance):
+    """
+    驱动调度器：每批按 relevance（下标 -> 分数，None 表示超时未打分）送回打分结果
+
+    Returns:
+        (依次请求打分的批次, 合并后的结果)
+    """
+    planner = iter_lazy_relevance([{'url': str(i), 'authority_score': score}
+                                   for i, score in enumerate(authority_scores)], top_k)
+    batches = []
+    try:
+        chunk = next(planner)
+        while True:
+            batches.append(chunk)
+            chunk = planner.send([
+                {'relevance_score': None, 'relevance_reason': TIMEOUT_REASON, 'relevance_status': 'unscored'}
+                if relevance[i] is None else
+                {'relevance_score': relevance[i], 'relevance_reason': 'llm', 'relevance_source': 'llm'}
+                for i in chunk
+            ])
+    except StopIteration as stop:
+        return batches, stop.value
+
+
+@pytest.mark.parametrize('authority, relevance, top_k, expected_batches', [
+    # 最高档的满分结果已够top_k：只打 top_k 条
+    ([4, 4, 4, 3, 3], [2, 2, 2, 2, 2], 2, [[0, 1]]),
+    # 档内满分不够时再打 "还缺的名额数" 条
+    ([4, 4, 4, 3, 3], [2, 0, 2, 2, 2], 2, [[0, 1], [2]]),
+    # 一档打完仍不够top_k，进入下一档补足剩余名额
+    ([4, 4, 3, 3, 3], [1, 1, 2, 2, 2], 3, [[0, 1], [2]]),
+    ([4, 4, 3, 3, 3], [1, 1, 0, 2, 2], 3, [[0, 1], [2], [3]]),
+    # 权威性未打分的结果排在最后一档
+    ([None, 2, 2], [2, 2, 2], 2, [[1, 2]]),
+    # top_k 不小于结果数时全部打分
+    ([4, 3], [0, 0], 5, [[0], [1]]),
+])
+def test_batches(authority, relevance, top_k, expected_batches):
+    batches, _ = drive(authority, top_k, relevance)
+    assert batches == expected_batches
+
+
+def test_unrequested_results_are_unscored():
+    _, combined = drive([4, 4, 4, 3], 2, [2, 2, 2, 2])
+    assert [r['relevance_status'] for r in combined] == ['scored', 'scored', 'unscored', 'unscored']
+    assert [r['relevance_score'] for r in combined] == [2, 2, None, None]
+    assert [r['url'] for r in combined] == ['0', '1', '2', '3']
+
+
+def test_timed_out_results_keep_timeout_reason():
+    _, combined = drive([4, 4, 3], 2, [None, 2, 2])
+    assert combined[0]['relevance_status'] == 'unscored'
+    assert combined[0]['relevance_reason'] == TIMEOUT_REASON
+    assert combined[1]['relevance_score'] == 2
+
+
+def test_no_results():
+    assert drive([], 3, []) == ([], [])
+
+
+def test_input_is_not_modified():
+    authority_scored = [{'url': '0', 'authority_score': 4}]
+    planner = iter_lazy_relevance(authority_scored, 1)
+    next(planner)
+    with pytest.raises(StopIteration):
+        planner.send([{'relevance_score': 2}])
+    assert authority_scored == [{'url': '0', 'authority_score': 4}]
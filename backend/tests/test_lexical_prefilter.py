@@ -0,0 +1,79 @@
+"""词面预筛：切词、归一化BM25分数与阈值校准"""
+import numpy as np
+import pytest
+
+import lexical_prefilter
+from lexical_prefilter import bm25_scores, calibrate_threshold, prefilter, tokenize
+
+NOISE = ['今日天气晴朗适合出游', 'cooking recipes for dinner', '股票行情实时更新', 'football match results']
+
+
+def results_of(documents):
+    return [{'title': document, 'content': ''} for document in documents]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('北京大学', ['北京', '京大', '大学']),
+    ('Python 3.12', ['python', '3', '12']),
+    ('考研Math二', ['考研', 'math', '二']),
+    ('ＡＢＣ１２３', ['abc123']),
+    ('', []),
+])
+def test_tokenize(text, expected):
+    assert tokenize(text) == expected
+
+
+@pytest.mark.parametrize('query, matching', [
+    # query中有本批所有结果都不包含的词面（pdf、官方），完全匹配其余词面的结果不能被压到阈值以下
+    ('python asyncio tutorial pdf', 'python asyncio tutorial part {}'),
+    ('北京大学录取分数线 官方', '北京大学录取分数线公布 {}'),
+    ('考研数学二大纲', '{}年考研数学二大纲发布'),
+])
+def test_matching_results_pass_and_noise_is_rejected(query, matching):
+    documents = [matching.format(i) for i in range(9)] + NOISE
+    rejected, scores = prefilter(results_of(documents), query, threshold=0.05)
+    assert rejected == list(range(9, 9 + len(NOISE)))
+    assert scores[:9].min() > 0.3
+
+
+def test_scores_are_normalized():
+    scores = bm25_scores('python asyncio', ['python asyncio ' * 50, 'python', 'java'] + NOISE)
+    assert ((scores >= 0) & (scores < 1)).all()
+    assert scores[0] > scores[1] > scores[2] == 0
+
+
+def test_no_document_shares_terms():
+    assert bm25_scores('python asyncio', NOISE).tolist() == [0.0] * len(NOISE)
+
+
+def test_query_without_terms_keeps_everything():
+    assert bm25_scores('！？', NOISE).tolist() == [1.0] * len(NOISE)
+    assert len(bm25_scores('python', [])) == 0
+
+
+def test_small_batches_are_not_prefiltered(monkeypatch):
+    monkeypatch.setattr(lexical_prefilter, 'PREFILTER_MIN_BATCH', 5)
+    rejected, scores = prefilter(results_of(NOISE), 'python asyncio', threshold=0.05)
+    assert rejected == []
+    assert scores.tolist() == [0.0] * len(NOISE)
+
+    rejected, _ = prefilter(results_of(NOISE + ['python asyncio']), 'python asyncio', threshold=0.05)
+    assert rejected == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize('max_miss_rate, expected', [
+    (0, 0.2),
+    (0.25, 0.3),
+    (0.5, 0.5),
+])
+def test_calibrate_threshold(max_miss_rate, expected):
+    scores = [0.01, 0.02, 0.2, 0.3, 0.5, 0.9]
+    labels = [0, 0, 1, 2, 1, 2]
+    threshold = calibrate_threshold(scores, labels, max_miss_rate)
+    assert threshold == expected
+    missed = np.sum((np.array(scores) < threshold) & (np.array(labels) > 0))
+    assert missed <= max_miss_rate * 4
+
+
+def test_calibrate_threshold_without_relevant_samples():
+    assert calibrate_threshold([0.1, 0.2], [0, 0]) == 0.0
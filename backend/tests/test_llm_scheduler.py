@@ -0,0 +1,119 @@
+"""LLM调度器：并发上限、按请求轮转、限速与截止时间"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded
+from llm_scheduler import LLMScheduler
+from request_context import RequestContext, run_in_request
+
+
+def enqueue(scheduler, request, count):
+    return [run_in_request(request, scheduler._enqueue) for _ in range(count)]
+
+
+def test_grants_up_to_max_concurrency():
+    scheduler = LLMScheduler('test', max_concurrency=2)
+    tickets = enqueue(scheduler, RequestContext('a'), 3)
+    assert [t.granted for t in tickets] == [True, True, False]
+    assert scheduler.get_stats()['running'] == 2
+    assert scheduler.get_stats()['queue_depth'] == 1
+
+    scheduler.release()
+    assert tickets[2].granted
+    assert scheduler.get_stats()['queue_depth'] == 0
+
+
+def test_slots_rotate_between_requests():
+    scheduler = LLMScheduler('test', max_concurrency=1)
+    holder = enqueue(scheduler, RequestContext('holder'), 1)
+    big = enqueue(scheduler, RequestContext('60条结果'), 3)
+    small = enqueue(scheduler, RequestContext('6条结果'), 1)
+    assert holder[0].granted
+
+    named = {'big0': big[0], 'big1': big[1], 'big2': big[2], 'small': small[0]}
+    order = []
+    for _ in range(4):
+        scheduler.release()
+        order.extend(name for name, ticket in named.items() if ticket.granted and name not in order)
+    # 排在大请求之后的小请求不会等大请求的全部调用完成
+    assert order == ['big0', 'small', 'big1', 'big2']
+
+
+def test_slot_gives_up_at_deadline():
+    scheduler = LLMScheduler('test', max_concurrency=1)
+    enqueue(scheduler, RequestContext('holder'), 1)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with scheduler.slot(Deadline(100)):
+            pass
+    assert 0.09 <= time.monotonic() - start < 0.5
+
+    stats = scheduler.get_stats()
+    assert (stats['queue_depth'], stats['waiting_requests'], stats['running']) == (0, 0, 1)
+    scheduler.release()
+    assert scheduler.get_stats()['running'] == 0
+
+
+def test_cancel_after_grant_returns_slot():
+    scheduler = LLMScheduler('test', max_concurrency=1)
+    holder, waiter = enqueue(scheduler, RequestContext('a'), 2)
+    scheduler.release()
+    assert waiter.granted
+    # 等待方超时与分配同时发生：放弃时归还刚拿到的名额
+    scheduler._cancel(waiter)
+    assert scheduler.get_stats()['running'] == 0
+
+
+def test_slot_without_deadline_waits_for_release():
+    scheduler = LLMScheduler('test', max_concurrency=1)
+    enqueue(scheduler, RequestContext('holder'), 1)
+    entered = threading.Event()
+
+    def worker():
+        with scheduler.slot():
+            entered.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not entered.wait(0.1)
+    scheduler.release()
+    assert entered.wait(1)
+    thread.join()
+    assert scheduler.get_stats()['running'] == 0
+
+
+def test_cancelled_async_waiter_leaves_queue():
+    scheduler = LLMScheduler('test', max_concurrency=1)
+    enqueue(scheduler, RequestContext('holder'), 1)
+
+    async def waiter():
+        async with scheduler.slot_async():
+            pass
+
+    async def run():
+        task = asyncio.ensure_future(waiter())
+        await asyncio.sleep(0.02)
+        assert scheduler.get_stats()['queue_depth'] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert scheduler.get_stats()['queue_depth'] == 0
+    scheduler.release()
+    assert scheduler.get_stats()['running'] == 0
+
+
+def test_rate_limit_spaces_out_grants():
+    scheduler = LLMScheduler('test', max_concurrency=10, rate_per_second=20, burst=1)
+    start = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot(Deadline(2000)):
+            pass
+    # 第一次用掉突发令牌，之后每 50ms 生成一个
+    assert time.monotonic() - start >= 0.09
+    assert scheduler.get_stats()['granted_total'] == 3
@@ -0,0 +1,86 @@
+"""近似重复聚类：字符三元组、MinHash签名与分组"""
+import numpy as np
+import pytest
+
+from result_processor import (MINHASH_NUM_PERM, _EMPTY_SIGNATURE, char_shingles, minhash_signatures,
+                              near_duplicate_groups)
+
+ARTICLE = ('教育部发布2025年全国硕士研究生招生考试数学二考试大纲，考试内容包括高等数学和线性代数，'
+           '试卷满分150分，考试时间180分钟，题型包括单项选择题、填空题和解答题。')
+OTHER = 'Python asyncio tutorial: event loops, tasks and coroutines explained with runnable examples.'
+
+
+def result(title, content):
+    return {'title': title, 'content': content}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('ab', 0),
+    ('abc', 1),
+    ('abcd', 2),
+    ('', 0),
+    (None, 0),
+])
+def test_char_shingle_counts(text, expected):
+    assert len(char_shingles(text)) == expected
+
+
+def test_shingles_ignore_width_case_and_whitespace():
+    assert np.array_equal(char_shingles('ＡＢＣ  d\n e'), char_shingles('abc d e'))
+
+
+def test_signatures():
+    signatures = minhash_signatures([ARTICLE, ARTICLE, OTHER, 'ab'])
+    assert signatures.shape == (4, MINHASH_NUM_PERM)
+    assert np.array_equal(signatures[0], signatures[1])
+    assert (signatures[0] != signatures[2]).any()
+    assert (signatures[3] == _EMPTY_SIGNATURE).all()
+
+
+def test_agreement_estimates_jaccard():
+    a, b = ARTICLE, ARTICLE[:len(ARTICLE) // 2] + OTHER
+    shingles_a, shingles_b = set(char_shingles(a).tolist()), set(char_shingles(b).tolist())
+    jaccard = len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+    signatures = minhash_signatures([a, b])
+    estimate = (signatures[0] == signatures[1]).mean()
+    assert abs(estimate - jaccard) < 0.2
+
+
+def test_reposted_article_is_grouped_with_longest_first():
+    results = [
+        result('数学二考试大纲', ARTICLE),
+        result('asyncio', OTHER),
+        result('数学二考试大纲', ARTICLE + '（转载）'),
+    ]
+    assert sorted(near_duplicate_groups(results)) == [[1], [2, 0]]
+
+
+def test_distinct_results_stay_separate():
+    results = [result('数学二考试大纲', ARTICLE), result('asyncio', OTHER)]
+    assert sorted(near_duplicate_groups(results)) == [[0], [1]]
+
+
+def test_empty_texts_are_never_grouped():
+    assert sorted(near_duplicate_groups([result('', ''), result('', ''), result('a', '')])) == [[0], [1], [2]]
+
+
+@pytest.mark.parametrize('count', [0, 1])
+def test_fewer_than_two_results(count):
+    assert near_duplicate_groups([result('t', ARTICLE)] * count) == [[i] for i in range(count)]
+
+
+def test_threshold_controls_grouping():
+    half = ARTICLE[:len(ARTICLE) // 2]
+    results = [result('', ARTICLE), result('', half + OTHER)]
+    assert len(near_duplicate_groups(results, threshold=0.9)) == 2
+    assert len(near_duplicate_groups(results, threshold=0.0)) == 1
+
+
+def test_similarity_is_transitive():
+    base = ARTICLE * 2
+    texts = [base, base[:-30] + OTHER[:30], base[:-60] + OTHER[:60]]
+    signatures = minhash_signatures([f' {text}' for text in texts])
+    agreement = lambda i, j: (signatures[i] == signatures[j]).mean()
+    # a~b、b~c，但 a 与 c 本身低于阈值
+    assert agreement(0, 1) >= 0.75 and agreement(1, 2) >= 0.75 > agreement(0, 2)
+    assert near_duplicate_groups([result('', text) for text in texts], threshold=0.75) == [[0, 1, 2]]
@@ -0,0 +1,132 @@
+"""搜索引擎调用与熔断器、截止时间的配合"""
+import asyncio
+import time
+
+import pytest
+
+import websearch_service
+from circuit_breaker import CLOSED, OPEN, HALF_OPEN
+from deadline import Deadline
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(websearch_service, '_breakers', {})
+    monkeypatch.setattr(websearch_service, 'SEARCH_RETRY_BASE', 0)
+
+
+def half_open_breaker(engine_name):
+    breaker = websearch_service.get_breaker(engine_name)
+    for _ in range(breaker.min_calls):
+        breaker.record(False, 0.01)
+    breaker._opened_at = time.monotonic() - breaker.open_seconds
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def test_expired_deadline_does_not_take_half_open_probe():
+    breaker = half_open_breaker('google')
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    assert websearch_service.fetch_single_engine('q', 'google', 'x', deadline=deadline) == []
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_probe_success_closes_breaker(monkeypatch):
+    breaker = half_open_breaker('google')
+    monkeypatch.setattr(websearch_service, 'fetch_hedged', lambda *args, **kwargs: [])
+    websearch_service.fetch_single_engine('q', 'google', 'x')
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_async_fetch_releases_probe(monkeypatch):
+    breaker = half_open_breaker('google')
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(websearch_service, 'fetch_hedged_async', hang)
+
+    async def run():
+        task = asyncio.ensure_future(websearch_service.fetch_single_engine_async('q', 'google', 'x'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_budget_truncated_timeouts_are_not_engine_failures(monkeypatch):
+    def time_out(engine_name, fetch, session, headers, data, timeout, deadline):
+        time.sleep(timeout)
+        raise TimeoutError('read timeout')
+
+    monkeypatch.setattr(websearch_service, 'fetch_hedged', time_out)
+    breaker = websearch_service.get_breaker('google')
+    for _ in range(breaker.min_calls + 1):
+        websearch_service.fetch_single_engine('q', 'google', 'x', max_retries=1, deadline=Deadline(20))
+    assert breaker.state == CLOSED
+    assert breaker.get_stats()['recent_calls'] == 0
+
+
+def test_engine_errors_open_breaker(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ValueError('bad response')
+
+    monkeypatch.setattr(websearch_service, 'fetch_hedged', fail)
+    breaker = websearch_service.get_breaker('google')
+    for _ in range(breaker.min_calls):
+        websearch_service.fetch_single_engine('q', 'google', 'x', max_retries=1, deadline=Deadline(5000))
+    assert breaker.state == OPEN
+
+
+@pytest.fixture
+def always_hedge(monkeypatch):
+    monkeypatch.setattr(websearch_service, 'hedge_delay', lambda engine_name: 0.05)
+    monkeypatch.setattr(websearch_service._hedge_budget, 'try_acquire', lambda: True)
+
+
+def recording_fetch(timeouts, primary_seconds):
+    def fetch(timeout):
+        timeouts.append(timeout)
+        time.sleep(primary_seconds if len(timeouts) == 1 else 0)
+        return ['item']
+    return fetch
+
+
+def test_hedge_timeout_is_clipped_to_remaining_budget(always_hedge):
+    timeouts = []
+    deadline = Deadline(300)
+    timeout = deadline.timeout(websearch_service.SEARCH_TIMEOUT)
+    assert websearch_service.fetch_hedged('google', recording_fetch(timeouts, 0.2),
+                                          timeout=timeout, deadline=deadline) == ['item']
+    assert len(timeouts) == 2
+    assert timeouts[1] <= timeout - 0.05
+
+
+def test_no_hedge_after_deadline(always_hedge):
+    timeouts = []
+    deadline = Deadline(20)
+    websearch_service.fetch_hedged('google', recording_fetch(timeouts, 0.1),
+                                   timeout=deadline.timeout(websearch_service.SEARCH_TIMEOUT), deadline=deadline)
+    assert len(timeouts) == 1
+
+
+def test_async_hedge_timeout_is_clipped_to_remaining_budget(always_hedge):
+    timeouts = []
+
+    async def fetch(timeout):
+        timeouts.append(timeout)
+        await asyncio.sleep(0.2 if len(timeouts) == 1 else 0)
+        return ['item']
+
+    deadline = Deadline(300)
+    timeout = deadline.timeout(websearch_service.SEARCH_TIMEOUT)
+    assert asyncio.run(websearch_service.fetch_hedged_async('google', fetch, timeout=timeout,
+                                                            deadline=deadline)) == ['item']
+    assert len(timeouts) == 2
+    assert timeouts[1] <= timeout - 0.05
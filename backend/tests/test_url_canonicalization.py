@@ -0,0 +1,52 @@
+"""URL规范化：同一页面的不同写法得到同一个 canonical_url"""
+import pytest
+
+import result_processor
+from result_processor import canonicalize_results, canonicalize_url
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTP://WWW.Example.com:80/a/b/?utm_source=x&b=2&a=1#frag', 'https://example.com/a/b?a=1&b=2'),
+    ('https://example.com:443/a', 'https://example.com/a'),
+    ('https://m.example.com/a', 'https://example.com/a'),
+    ('https://wap.example.com/a', 'https://example.com/a'),
+    ('https://example.com/', 'https://example.com'),
+    ('https://example.com./a', 'https://example.com/a'),
+    ('http://example.com:8080/p?gclid=1', 'https://example.com:8080/p'),
+    ('https://example.com/p?spm=1.2&UTM_Medium=x&q=', 'https://example.com/p?q='),
+    ('  https://example.com/a  ', 'https://example.com/a'),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://x.com/a',
+    'not a url',
+    'https:///no-host',
+])
+def test_non_web_urls_unchanged(url):
+    assert canonicalize_url(url) == url
+
+
+def test_mirror_prefix_keeps_registrable_domain():
+    assert canonicalize_url('https://www.cn/a') == 'https://www.cn/a'
+
+
+def test_variants_share_canonical_url():
+    variants = [
+        'http://www.example.com/news/1/',
+        'https://example.com/news/1?utm_campaign=feed',
+        'https://m.example.com/news/1#comments',
+    ]
+    assert len({canonicalize_url(url) for url in variants}) == 1
+
+
+def test_canonicalize_results_keeps_existing(monkeypatch):
+    results = [{'url': 'http://www.example.com/a/'}, {'url': 'https://b.com', 'canonical_url': 'preset'}]
+    assert canonicalize_results(results) is results
+    assert [r['canonical_url'] for r in results] == ['https://example.com/a', 'preset']
+
+    monkeypatch.setattr(result_processor, 'URL_CANONICALIZE', False)
+    assert canonicalize_results([{'url': 'http://www.example.com/a/'}])[0]['canonical_url'] == \
+        'http://www.example.com/a/'
@@ -41,6 +41,12 @@ async function handleSearch() {
     showSection('loadingSection');
     setButtonLoading(true);
 
+    // 支持SSE的浏览器使用流式接口，每个引擎打分完成后立即展示
+    if (window.EventSource) {
+        handleSearchStream(query, selectedEngines);
+        return;
+    }
+
     // 重置加载步骤
     resetLoadingSteps();
 
@@ -80,6 +86,81 @@ async function handleSearch() {
     }
 }
 
+// 流式搜索：通过SSE逐批接收打分完成的结果
+let currentEventSource = null;
+
+function handleSearchStream(query, selectedEngines) {
+    if (currentEventSource) {
+        currentEventSource.close();
+    }
+
+    const params = new URLSearchParams({
+        query: query,
+        engines: selectedEngines.join(',')
+    });
+    // 使用相对路径以兼容 WebIDE 等有代理前缀的环境
+    const source = new EventSource(`api/query/stream?${params.toString()}`);
+    currentEventSource = source;
+
+    let streamedResults = [];
+    document.getElementById('step1').classList.add('active');
+
+    const finish = () => {
+        source.close();
+        currentEventSource = null;
+        hideSection('loadingSection');
+        setButtonLoading(false);
+    };
+
+    source.addEventListener('search', () => {
+        document.getElementById('step1').classList.remove('active');
+        document.getElementById('step1').classList.add('completed');
+        document.getElementById('step2').classList.add('active');
+        document.getElementById('step3').classList.add('active');
+    });
+
+    source.addEventListener('results', (e) => {
+        const data = JSON.parse(e.data);
+        streamedResults = sortResults(streamedResults.concat(data.results));
+
+        // 首批结果到达即展示，后续批次到达后重新排序渲染
+        document.getElementById('queryText').textContent = query;
+        document.getElementById('rawCount').textContent = streamedResults.length;
+        document.getElementById('filteredCount').textContent = streamedResults.length;
+        showSection('statsSection');
+        renderResultList(streamedResults);
+        showSection('resultsSection');
+    });
+
+    source.addEventListener('done', (e) => {
+        finish();
+        displayResults(JSON.parse(e.data));
+    });
+
+    source.addEventListener('failure', (e) => {
+        finish();
+        const data = JSON.parse(e.data);
+        showError(data.error || '未知错误');
+    });
+
+    // 连接异常（服务端正常结束时已主动关闭，不会进入此处）
+    source.onerror = () => {
+        if (currentEventSource !== source) {
+            return;
+        }
+        finish();
+        showError('流式连接中断');
+    };
+}
+
+// 与后端一致的排序：权威性降序 -> 相关性降序（未打分的结果排在同档最后）
+function sortResults(results) {
+    const score = (value) => (value === null || value === undefined ? -1 : value);
+    return results.slice().sort((a, b) =>
+        (score(b.authority_score) - score(a.authority_score)) || (score(b.relevance_score) - score(a.relevance_score))
+    );
+}
+
 // 显示结果
 function displayResults(data) {
     // 显示统计信息
@@ -89,10 +170,30 @@ function displayResults(data) {
     showSection('statsSection');
 
     // 显示结果列表
+    renderResultList(data.results);
+    showSection('resultsSection');
+
+    // 显示原始结果
+    if (data.raw_results_by_engine) {
+        displayRawResults(data.raw_results_by_engine);
+        showSection('rawResultsSection');
+    }
+
+    // 滚动到结果区域
+    setTimeout(() => {
+        document.getElementById('resultsSection').scrollIntoView({
+            behavior: 'smooth',
+            block: 'start'
+        });
+    }, 100);
+}
+
+// 渲染按权威性/相关性分组的结果列表
+function renderResultList(results) {
     const resultsList = document.getElementById('resultsList');
     resultsList.innerHTML = '';
 
-    if (data.results.length === 0) {
+    if (results.length === 0) {
         resultsList.innerHTML = `
             <div style="text-align: center; padding: 40px; background: white; border-radius: 12px;">
                 <div style="font-size: 3rem; margin-bottom: 20px;">📭</div>
@@ -106,7 +207,7 @@ function displayResults(data) {
         let lastRelevanceScore = null;
         let resultIndex = 1;
 
-        data.results.forEach((result) => {
+        results.forEach((result) => {
             // 检查是否需要添加权威性分组标题
             if (result.authority_score !== lastAuthorityScore) {
                 const authorityHeader = createGroupHeader(result.authority_score);
@@ -127,22 +228,6 @@ function displayResults(data) {
             resultIndex++;
         });
     }
-
-    showSection('resultsSection');
-
-    // 显示原始结果
-    if (data.raw_results_by_engine) {
-        displayRawResults(data.raw_results_by_engine);
-        showSection('rawResultsSection');
-    }
-
-    // 滚动到结果区域
-    setTimeout(() => {
-        document.getElementById('resultsSection').scrollIntoView({
-            behavior: 'smooth',
-            block: 'start'
-        });
-    }, 100);
 }
 
 // 创建权威性分组标题
@@ -156,7 +241,8 @@ function createGroupHeader(authorityScore) {
         2: '📌 权威性档位2 - 中等权威',
         1: '📋 权威性档位1 - 一般权威',
         0: '❓ 权威性档位0 - 未评分',
-        '-1': '❓ 权威性档位-1 - 评分失败'
+        '-1': '❓ 权威性档位-1 - 评分失败',
+        'null': '⏸ 权威性未打分（超时）'
     };
 
     div.innerHTML = `
@@ -186,7 +272,8 @@ function createSubGroupHeader(relevanceScore) {
         2: '💯 相关性档位2 - 高度相关',
         1: '✅ 相关性档位1 - 部分相关',
         0: '⚪ 相关性档位0 - 不相关',
-        '-1': '❓ 相关性档位-1 - 评分失败'
+        '-1': '❓ 相关性档位-1 - 评分失败',
+        'null': '⏸ 未打分'
     };
 
     const colors = {
@@ -242,13 +329,13 @@ function createResultItem(result, index) {
         <div class="result-scores">
             <div class="score-item">
                 <span class="badge badge-relevance">
-                    相关性: ${result.relevance_score}
+                    相关性: ${result.relevance_score ?? '-'}
                 </span>
                 <span style="color: #999; margin-left: 8px;">${escapeHtml(result.relevance_reason)}</span>
             </div>
             <div class="score-item">
                 <span class="badge badge-authority">
-                    权威性: ${result.authority_score}
+                    权威性: ${result.authority_score ?? '-'}
                 </span>
                 <span style="color: #999; margin-left: 8px;">${escapeHtml(result.authority_reason)}</span>
             </div>
@@ -432,12 +519,12 @@ function createRawResultItem(result, index) {
         <div class="raw-result-scores">
             <div class="raw-score-badge">
                 <span class="label">相关性:</span>
-                <span class="value score-${result.relevance_score}">${result.relevance_score}</span>
+                <span class="value score-${result.relevance_score}">${result.relevance_score ?? '-'}</span>
                 <span style="color: #999; font-size: 0.8rem;">${escapeHtml(result.relevance_reason || '')}</span>
             </div>
             <div class="raw-score-badge">
                 <span class="label">权威性:</span>
-                <span class="value score-${result.authority_score}">${result.authority_score}</span>
+                <span class="value score-${result.authority_score}">${result.authority_score ?? '-'}</span>
                 <span style="color: #999; font-size: 0.8rem;">${escapeHtml(result.authority_reason || '')}</span>
             </div>
         </div>